@@ -0,0 +1,173 @@
+"""
+Time every stage of the pipeline on synthetic data at several sizes and write the results as JSON.
+
+Each size is given as ASSETSxDAYS. The results of two runs can be compared with --compare, which
+prints the ratio of the new to the baseline time of every benchmark and size.
+
+Run from the project root:
+    python -m benchmarks.suite --sizes 10x365 100x365 1000x365 --output results.json
+    python -m benchmarks.suite --sizes 10x365 100x365 1000x365 --compare results.json
+
+Scaling with the number of assets, or the write paths on a long history:
+    python -m benchmarks.suite --sizes 24x365 100x365 1000x365 10000x365 --only calculate_vwap determine_thresholds
+    python -m benchmarks.suite --sizes 100x10000 --repeat 1 --only DatabaseHandler
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_ohlcv, write_csv_exports
+from src.data_analyzer import DataAnalyzer
+from src.data_cleaner import DataCleaner, DataFormatter
+from src.data_loader import DataLoader, DataAggregator
+from src.database_handler import DatabaseHandler, OHLCV_TABLE, engine_registry
+from src.indicators import IndicatorEngine
+
+DEFAULT_SIZES = ['10x365', '100x365', '1000x365']
+
+
+def parse_size(size):
+    """Parse 'ASSETSxDAYS' into (assets, days)."""
+    assets, days = size.lower().split('x')
+    return int(assets), int(days)
+
+
+def time_call(func, repeat, setup=None):
+    """Return the wall times in seconds of func over repeat runs, setup() gives its arguments and is not timed."""
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def analyzed(df):
+    """Return a copy of df with the typical price, VWAP and percentage changes calculated."""
+    analyzer = DataAnalyzer(df.copy())
+    analyzer.calculate_typical_price()
+    analyzer.calculate_vwap()
+    analyzer.calculate_price_change()
+    return analyzer.df
+
+
+def benchmarks(df, directory):
+    """Return (name, func, setup) of every benchmark for the synthetic frame df."""
+    csv_directory = os.path.join(directory, 'csv')
+    write_csv_exports(df, csv_directory)
+    with_prices = DataAnalyzer(df.copy()).calculate_typical_price()
+    with_changes = analyzed(df)
+    thresholds = DataAnalyzer(with_changes).determine_thresholds()
+    databases = itertools.count()
+
+    def quiet(func):
+        # DataCleaner prints the cleaned head, which would flood the benchmark output
+        def run(*args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                func(*args)
+        return run
+
+    def new_database():
+        return (DatabaseHandler(os.path.join(directory, f'bench-{next(databases)}.db')),)
+
+    # The typed OHLCV table with its key and index, and a plain table created by pandas
+    writes = [
+        (f'DatabaseHandler.{path}{suffix}', write, new_database)
+        for suffix, table in [('', OHLCV_TABLE), ('[plain table]', 'bench_plain')]
+        for path, write in [
+            ('save_to_database', lambda db_handler, table=table: db_handler.save_to_database(with_changes, table, mode='replace')),
+            ('bulk_write', lambda db_handler, table=table: db_handler.bulk_write(with_changes, table, mode='replace')),
+        ]
+    ]
+
+    return [
+        ('DataLoader.load_csv_files', lambda: DataLoader(csv_directory).load_csv_files(), None),
+        ('DataAggregator.aggregate_data', DataAggregator.aggregate_data, lambda: (DataLoader(csv_directory).load_csv_files(),)),
+        ('DataCleaner.clean_data', quiet(lambda cleaner: cleaner.clean_data()), lambda: (DataCleaner(df.copy()),)),
+        ('DataAnalyzer.calculate_typical_price', lambda analyzer: analyzer.calculate_typical_price(), lambda: (DataAnalyzer(df.copy()),)),
+        ('DataAnalyzer.calculate_vwap', lambda analyzer: analyzer.calculate_vwap(), lambda: (DataAnalyzer(with_prices.copy()),)),
+        ('DataAnalyzer.calculate_price_change', lambda analyzer: analyzer.calculate_price_change(), lambda: (DataAnalyzer(with_prices.copy()),)),
+        ('DataAnalyzer.determine_thresholds', lambda analyzer: analyzer.determine_thresholds(), lambda: (DataAnalyzer(df),)),
+        ('DataAnalyzer.detect_large_changes', lambda analyzer: analyzer.detect_large_changes(thresholds), lambda: (DataAnalyzer(with_changes),)),
+        ('DataAnalyzer.clean_data', lambda analyzer: analyzer.clean_data(), lambda: (DataAnalyzer(with_changes.copy()),)),
+        ('IndicatorEngine.calculate', lambda: IndicatorEngine().calculate(df), None),
+        ('DataFormatter.format_data', lambda: DataFormatter().format_data(with_changes), None),
+    ] + writes
+
+
+def run(sizes, repeat, only=None):
+    """Run the benchmarks at every size and return the results as a JSON-compatible dict."""
+    results = []
+    for size in sizes:
+        n_assets, n_days = parse_size(size)
+        df = generate_ohlcv(n_assets, n_days)
+        with tempfile.TemporaryDirectory() as directory:
+            for name, func, setup in benchmarks(df, directory):
+                if only and not any(pattern in name for pattern in only):
+                    continue
+                times = time_call(func, repeat, setup)
+                results.append({
+                    'benchmark': name,
+                    'assets': n_assets,
+                    'days': n_days,
+                    'rows': len(df),
+                    'best_seconds': min(times),
+                    'mean_seconds': statistics.mean(times),
+                    'rows_per_second': len(df) / min(times) if min(times) > 0 else None,
+                })
+                print(f"{name:>46} {size:>12} {min(times):>10.4f} s")
+            # Release the benchmark databases before their directory is removed
+            engine_registry.dispose()
+
+    return {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(results, baseline):
+    """Return (benchmark, assets, days, baseline seconds, new seconds, ratio) for every result found in both runs."""
+    key = lambda result: (result['benchmark'], result['assets'], result['days'])
+    baseline_times = {key(result): result['best_seconds'] for result in baseline['results']}
+    return [
+        key(result) + (baseline_times[key(result)], result['best_seconds'], result['best_seconds'] / baseline_times[key(result)])
+        for result in results['results'] if baseline_times.get(key(result))
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data.")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='Sizes as ASSETSxDAYS.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best one is compared.')
+    parser.add_argument('--only', nargs='+', help='Run only the benchmarks whose name contains one of these strings.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Compare the results with an earlier JSON file.')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat, args.only)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\n{'benchmark':>46} {'assets':>7} {'days':>6} {'baseline (s)':>13} {'new (s)':>10} {'ratio':>7}")
+        for name, n_assets, n_days, before, after, ratio in compare(results, baseline):
+            print(f"{name:>46} {n_assets:>7} {n_days:>6} {before:>13.4f} {after:>10.4f} {ratio:>7.2f}")
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+def generate_ohlcv(n_assets, n_days, start_date='2020-01-01', seed=42):
+    """
+    Generate a deterministic synthetic OHLCV and market cap DataFrame.
+
+    Every asset follows its own geometric random walk, so the frame has the same
+    columns and per-crypto layout as the aggregated CSV data.
+
+    Args:
+        n_assets (int): Number of cryptocurrencies.
+        n_days (int): Number of daily rows per cryptocurrency.
+        start_date (str): The first date of the history.
+        seed (int): Seed for the random generator, the same seed always gives the same frame.
+
+    Returns:
+        DataFrame: n_assets * n_days rows sorted by CryptocurrencyName and Date.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=n_days, freq='D')
+    names = np.array([f'asset-{i:05d}' for i in range(n_assets)])
+
+    start_prices = rng.uniform(0.01, 1000.0, size=(n_assets, 1))
+    close = start_prices * np.exp(np.cumsum(rng.normal(0.0, 0.03, size=(n_assets, n_days)), axis=1))
+    open_ = np.concatenate([start_prices, close[:, :-1]], axis=1)
+    spread = np.abs(rng.normal(0.0, 0.02, size=(n_assets, n_days)))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.lognormal(15.0, 1.0, size=(n_assets, n_days))
+    market_cap = close * rng.uniform(1e6, 1e9, size=(n_assets, 1))
+
+    return pd.DataFrame({
+        'Date': np.tile(dates.values, n_assets),
+        'Open': open_.ravel(),
+        'High': high.ravel(),
+        'Low': low.ravel(),
+        'Close': close.ravel(),
+        'Volume': volume.ravel(),
+        'Market Cap': market_cap.ravel(),
+        'CryptocurrencyName': np.repeat(names, n_days),
+    })
+
+
+def write_csv_exports(df, directory):
+    """
+    Write one CSV export per cryptocurrency, in the format of the historical data exports.
+
+    The files are named '<crypto>_<first date>_<last date>.csv' and have the Start and End
+    columns instead of Date, so DataLoader reads them like the downloaded exports.
+
+    Returns:
+        list: The paths of the written files.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for crypto, group in df.groupby('CryptocurrencyName', sort=False):
+        dates = pd.to_datetime(group['Date'])
+        export = group.drop(columns=['CryptocurrencyName', 'Date'])
+        export.insert(0, 'End', (dates + pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d'))
+        export.insert(0, 'Start', dates.dt.strftime('%Y-%m-%d'))
+        path = os.path.join(directory, f"{crypto}_{export['Start'].iloc[0]}_{export['Start'].iloc[-1]}.csv")
+        export.to_csv(path, index=False)
+        paths.append(path)
+    return paths
@@ -1,14 +1,21 @@
+import argparse
 import logging
 import pandas as pd
 import os
 
-from src.data_source import MasterDataLoader, Fetcher, Aggregator
-from src.data_analyzer import PerformCalculations
-from src.database_handler import DatabaseHandler
-from src.data_cleaner import DataFormatter
+from src.data_source import Aggregator
+from src.data_fetcher import FetchedDataProcessor, FetchBackend, create_fetch_backend
+from src.data_analyzer import PerformCalculations, IndicatorState, ThresholdSketches
+from src.database_handler import DatabaseHandler, engine_registry
+from src.columnar_cache import ColumnarCache
+from src.logging_config import configure_logging
+from src.data_cleaner import PerformCleaning, DataFormatter
+from src.pipeline import Stage, PipelineRunner
+from src.streaming import StreamingPipeline, IncrementalAssetProcessor
+from src.instrumentation import instrumentation
 
 
-def main():
+def main(full_reload=False, export_url=None, resume=False, profile=False, stream=False, trace_memory=False):
     # Specify the directory where you want to store log files
     log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
 
@@ -30,6 +37,9 @@ def main():
         filemode='a'  # Append to the log file
     )
 
+    # Attach the per-module log files of the package
+    configure_logging(log_directory)
+
     logger.info("Application started.")
 
     db_file_path = r'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db'
@@ -46,111 +56,184 @@ def main():
         logger.error(f"Failed to create DatabaseHandler instance: {e}")
         return
 
-    # Step 1: Load the previous day's data from the database
-    try:
-        # Check if the database file exists
-        if not os.path.exists(db_handler.database_url):
-            logger.error(f"Database file not found: {db_handler.database_url}")
-            return
-        else:
-            logger.debug(f"Database file found: {db_handler.database_url}")
-
-        query = "SELECT * FROM ohlcv_marketcap_data"  # Load the existing data from the database
-        previous_data = pd.read_sql_query(query, db_handler.engine)
-        logger.info("Successfully loaded previous day's data from the database.")
-        logger.debug(f"Previous data shape: {previous_data.shape}")
-
-        # Display the loaded previous data
-        print("\nPrevious Data from the Database:")
-        print(previous_data.head(30))  # Display the first 30 rows of the previous data
-
-        logger.debug("Displayed head of previous_data.")
-        
-    except Exception as e:
-        logger.error(f"Error loading data from the database: {e}")
+    # Check if the database file exists
+    if not os.path.exists(db_handler.database_url):
+        logger.error(f"Database file not found: {db_handler.database_url}")
         return
+    else:
+        logger.debug(f"Database file found: {db_handler.database_url}")
 
+    runner = PipelineRunner(
+        build_stages(db_handler, logger, full_reload, export_url, stream),
+        # The two kinds of run have different stage outputs, so they keep separate checkpoints
+        checkpoint_directory=os.path.join(f'{db_handler.database_url}.checkpoints', 'full-reload' if full_reload else 'streaming' if stream else 'incremental'),
+        resume=resume,
+    )
+    if resume:
+        logger.info(f"Resuming the {runner.run_date} run, completed stages: {runner.completed_stages()}")
 
-    # Create Fetcher instance
-    fetcher = Fetcher()  # Pass master_data instance if needed
-
-    # Fetch and process new data
+    # Record the time and rows of every stage, with the peak memory and a cProfile dump per stage if asked for
+    instrumentation.enable(profile_directory=os.path.join(log_directory, 'profiles') if profile else None,
+                           trace_memory=trace_memory)
     try:
-        fetcher.fetch_and_process_new_data()  # No need to capture return as it's done in the Fetcher
-        logger.info("New data fetched and cleaned successfully.")
-    except Exception as e:
-        logger.error(f"Error fetching new data: {e}")
-        return
+        if runner.run() is not None:
+            logger.info("Run completed.")
+    finally:
+        instrumentation.disable()
+        instrumentation.write_report(os.path.join(log_directory, 'run_report.json'))
+        instrumentation.write_prometheus(os.path.join(log_directory, 'crypto_pipeline.prom'))
+        # Every component shared the registry's engine, close its pooled connections once at the end
+        engine_registry.dispose()
+
+
+def build_stages(db_handler, logger, full_reload=False, export_url=None, stream=False):
+    """Declare the fetch -> clean -> aggregate -> calculate -> format -> save stages of a run.
+
+    The exports are downloaded through Selenium, or over HTTP from export_url if one is given.
+
+    The incremental run aggregates the new rows with the stored indicator state and threshold sketches,
+    the full reload aggregates them with the whole stored table and recalculates everything.
+    The streaming run replaces the first four stages with one, which cleans and calculates every
+    asset as soon as its export is downloaded.
+    """
+    def fetch_backend():
+        return create_fetch_backend('http', export_url=export_url) if export_url else create_fetch_backend('selenium')
+
+    def fetch():
+        # The slow part of the run, its checkpoint lets --resume skip it
+        return FetchedDataProcessor(fetch_backend()).execute()
+
+    def clean(raw_data):
+        return PerformCleaning(raw_data, db_handler=db_handler).clean_all()
+
+    def aggregate_with_table(new_data):
+        # Load the existing data through the columnar cache, which is only rebuilt when the table changed
+        previous_data = ColumnarCache(db_handler).load()
+        logger.debug(f"Previous data shape: {previous_data.shape}")
+        print("\nPrevious Data from the Database:")
+        print(previous_data.head(30))
+
+        aggregated_data = Aggregator(previous_data, new_data).aggregate_data()
+        if aggregated_data is None or aggregated_data.empty:
+            logger.warning("No aggregated data available for calculations.")
+            return None
+        print("\nAggregated Data Head:")
+        print(aggregated_data.head())
+        return {'aggregated_data': aggregated_data}
+
+    def aggregate_with_state(new_data):
+        # Only the last stored row and the VWAP totals per crypto are needed to extend the history
+        first_new_date = pd.to_datetime(new_data['Date']).min()
+        return {'new_data': new_data, **load_state(first_new_date)}
+
+    def load_state(first_new_date):
+        state = IndicatorState.load(db_handler)
+        if state.is_empty():
+            logger.warning("Rebuilding the indicator state from the stored table.")
+            state = IndicatorState.from_database(db_handler, 'ohlcv_marketcap_data', before_date=first_new_date)
+
+        sketches = ThresholdSketches.load(db_handler)
+        if sketches.is_empty():
+            logger.warning("Building the threshold sketches from the stored table.")
+            history = db_handler.query(
+                end_date=first_new_date - pd.Timedelta(days=1),
+                columns=list(ThresholdSketches.CHANGE_COLUMNS),
+            )
+            sketches = ThresholdSketches.from_history(history)
+        return {'state': state, 'sketches': sketches}
+
+    def fetch_and_calculate():
+        # The new rows are dated yesterday, the state and sketches must describe the days before
+        loaded = load_state(pd.Timestamp(FetchBackend.yesterday()))
+        process_asset = IncrementalAssetProcessor(loaded['state'], loaded['sketches'], db_handler)
+        latest_data, crypto_names = StreamingPipeline(fetch_backend(), process_asset).run()
+        logger.info(f"Fetched {len(crypto_names)} cryptocurrencies.")
+        if latest_data is None or latest_data.empty:
+            logger.warning("No new data available for the latest date to save.")
+            return None
+        return {'latest_data': latest_data, **loaded, 'indicators': process_asset.indicator_state}
+
+    def calculate_all(aggregated):
+        aggregated_data = aggregated['aggregated_data']
+        processor = PerformCalculations(aggregated_data, db_handler=db_handler)
+        latest_data = processor.calculate_newdata(aggregated_data)
+        if latest_data is None or latest_data.empty:
+            logger.warning("No new data available for the latest date to save.")
+            return None
+        # The reload replaces the table, so the state and the sketches are rebuilt from the recalculated history
+        return {'latest_data': latest_data, 'state': IndicatorState.from_history(latest_data),
+                'sketches': processor.threshold_sketches, 'indicators': processor.indicator_state}
+
+    def calculate_new(aggregated):
+        processor = PerformCalculations(aggregated['new_data'], db_handler=db_handler)
+        processor.threshold_sketches = aggregated['sketches']
+        latest_data = processor.calculate_newdata(aggregated['new_data'], state=aggregated['state'])
+        if latest_data is None or latest_data.empty:
+            logger.warning("No new data available for the latest date to save.")
+            return None
+        return {'latest_data': latest_data, 'state': aggregated['state'], 'sketches': processor.threshold_sketches,
+                'indicators': processor.indicator_state}
+
+    def format_rows(calculated):
+        # Format only the displayed rows, the numeric data is saved as is
+        formatted = DataFormatter().format_data(calculated['latest_data'].head(5))
+        print("\nCalculated Latest Data Head:")
+        print(formatted)
+        return formatted
+
+    def save(calculated):
+        # The rows, the states and the sketches are committed together or not at all
+        unit = db_handler.unit_of_work()
+        if full_reload:
+            unit.save_to_database(calculated['latest_data'], table_name='ohlcv_marketcap_data', mode='replace')
+        else:
+            unit.upsert_rows(calculated['latest_data'], table_name='ohlcv_marketcap_data')
+        calculated['state'].save(unit)
+        if calculated['sketches'] is not None and not calculated['sketches'].is_empty():
+            calculated['sketches'].save(unit)
+        if calculated.get('indicators') is not None and not calculated['indicators'].is_empty():
+            calculated['indicators'].save(unit)
+        if not unit.commit():
+            raise RuntimeError("the writes were rolled back, the database is unchanged")
+        logger.info(f"Saved {len(calculated['latest_data'])} rows to the database.")
+
+        latest_30_rows = db_handler.get_last_n_rows('ohlcv_marketcap_data', 30)
+        DataFormatter().display(latest_30_rows, n=30, title="\nLatest 30 Rows from the Database (Sorted by Date, Descending):")
+        return len(calculated['latest_data'])
+
+    if stream:
+        return [
+            Stage('stream', fetch_and_calculate),
+            Stage('format', format_rows, inputs=['stream'], checkpoint=False),
+            Stage('save', save, inputs=['stream']),
+        ]
+    return [
+        Stage('fetch', fetch),
+        Stage('clean', clean, inputs=['fetch']),
+        Stage('aggregate', aggregate_with_table if full_reload else aggregate_with_state, inputs=['clean']),
+        Stage('calculate', calculate_all if full_reload else calculate_new, inputs=['aggregate']),
+        Stage('format', format_rows, inputs=['calculate'], checkpoint=False),
+        Stage('save', save, inputs=['calculate']),
+    ]
 
-    # Ensure new data is available in Fetcher
-    if fetcher.new_data_df is not None and not fetcher.new_data_df.empty:
-        # Create Aggregator instance and pass the actual DataFrames
-        aggregator = Aggregator(previous_data, fetcher.new_data_df)
-
-        # Aggregate new data with master data
-        try:
-            aggregated_data = aggregator.aggregate_data()
-
-            # Ensure aggregated data is not None before proceeding
-            if aggregated_data is not None and not aggregated_data.empty:
-                logger.info("Aggregated new data with master data successfully.")
-
-                # Display the head of the aggregated data
-                print("\nAggregated Data Head:")
-                print(aggregated_data.head())  # Display the first few rows of the aggregated DataFrame
-
-                # Perform calculations on the aggregated data
-                processor = PerformCalculations(aggregated_data)
-                try:
-                    latest_data = processor.calculate_newdata(aggregated_data)  # Use the corrected method
-                    print("\nCalculated Latest Data Head:")
-                    print(latest_data.head())  # Display the first few rows of the calculated data
-
-                    # Use DataFormatter to format the latest data before saving
-                    formatter = DataFormatter()
-                    latest_data = formatter.format_data(latest_data)
-                    
-
-                    # Check if there are rows to save
-                    if not latest_data.empty:
-                        # Save the latest data to the database with mode='replace'
-                        try:
-                            db_handler = DatabaseHandler()
-                            db_handler.save_to_database(latest_data, table_name='ohlcv_marketcap_data', mode='replace')
-                            logger.info("Latest data successfully saved to the database.")
-
-                            # Fetch the latest 30 rows from the database table, sorted by Date in descending order
-                            query = "SELECT * FROM ohlcv_marketcap_data ORDER BY Date DESC LIMIT 30"
-                            
-                            try:
-                                latest_30_rows = pd.read_sql_query(query, db_handler.engine)  # Assuming db_handler has an 'engine' property for connection
-                                print("\nLatest 30 Rows from the Database (Sorted by Date, Descending):")
-                                print(latest_30_rows)  # Display the fetched rows
-                                       
-                                # Set Pandas display options to show all columns
-                                pd.set_option('display.max_columns', None)  # Show all columns
-                                pd.set_option('display.expand_frame_repr', False)  # Do not wrap the DataFrame when displaying
-
-                                # Display all columns of the fetched rows
-                                print("\nLatest 30 Rows from the Database (Sorted by Date, Descending):")
-                                print(latest_30_rows)  # Print all columns and rows
-                            
-                            except Exception as fetch_error:
-                                logger.error(f"Error fetching the latest 30 rows from the database: {fetch_error}")
-
-                        except Exception as save_error:
-                            logger.error(f"Error saving the latest data to the database: {save_error}")
-                    else:
-                        logger.warning("No new data available for the latest date to save.")
-
-                except Exception as e:
-                    logger.error(f"Error performing calculations on latest data: {e}")
-            else:
-                logger.warning("No aggregated data available for calculations.")
-        except Exception as e:
-            logger.error(f"Failed to aggregate new data with master data: {e}")
-    else:
-        logger.warning("No new data was fetched or it is empty.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Fetch yesterday's cryptocurrency data and update the database.")
+    parser.add_argument('--full-reload', action='store_true',
+                        help='Reload, recalculate and replace the whole table instead of upserting only the new rows.')
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the stages that already completed today and continue from their checkpoints.")
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a cProfile dump of every stage to the profiles folder of the log directory.')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Record the peak memory of every stage with tracemalloc, which slows the run down.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Clean and calculate every asset while the remaining exports are still downloading.')
+    parser.add_argument('--export-url',
+                        help='Download the exports over HTTP from this URL template with {crypto}, {start} and {end} '
+                             'placeholders instead of through Selenium.')
+    args = parser.parse_args()
+    if args.stream and args.full_reload:
+        parser.error('--stream updates the stored history incrementally and cannot be combined with --full-reload.')
+    main(full_reload=args.full_reload, export_url=args.export_url, resume=args.resume, profile=args.profile, stream=args.stream,
+         trace_memory=args.trace_memory)
@@ -1,13 +1,17 @@
+import argparse
 import logging
 import pandas as pd
 import os
+from src.data_loader import BulkLoader
 from src.data_source import MasterDataLoader, Fetcher, Aggregator
 from src.data_analyzer import PerformCalculations
-from src.database_handler import DatabaseHandler
+from src.database_handler import DatabaseHandler, engine_registry
+from src.logging_config import configure_logging
+from src.compact import memory_report
 
 
 
-def main():
+def main(bulk=False, workers=None, compact=False):
     
     # Specify the directory where you want to store log files
     log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
@@ -29,6 +33,9 @@ def main():
         filename=log_file_path,  # Use the full path for the log file
         filemode='a'  # Append to the log file
     )
+
+    # Attach the per-module log files of the package
+    configure_logging(log_directory)
     
     directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/CSV'
     db_file_path = r'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db'
@@ -36,28 +43,37 @@ def main():
     # Construct the database URL in the format expected by SQLAlchemy
     database_url = f'sqlite:///{db_file_path}'
     
+    if bulk:
+        # Stream the CSV files into the database in parallel without holding the dataset in memory
+        logger.info("Starting the bulk loading process...")
+        rows = BulkLoader(directory, db_file_path, max_workers=workers).load(mode='replace')
+        logger.info(f"Bulk loaded {rows} rows into the database.")
+        return
+
     logger.info("Starting the data loading process...")
     
     # Create an instance of MasterDataLoader
-    data_loader = MasterDataLoader(directory, database_url)
+    data_loader = MasterDataLoader(directory, database_url, compact=compact)
+    if compact:
+        print("\nMemory per stage in the compact representation:")
+        print(memory_report.summary())
 
     try:
-        # Load master data
-        master_data = data_loader.load_master_data()  # Load master data once
-        logger.info("Master data loaded successfully.")
-
-        # Convert master data to DataFrame
-        master_df = pd.DataFrame(master_data)
-
-
-        # Save the latest data to the database with mode='replace'
-        db_handler = DatabaseHandler()
-        db_handler.save_to_database(master_df, table_name='ohlcv_marketcap_data', mode='replace')
-        logger.info("Latest data successfully saved to the database.")
-        
-
-    except Exception as load_error:
-        logger.error(f"Error loading master data: {load_error}")
+        # The loader already saved the master data in one transaction, report the rows it wrote
+        if data_loader.saved_rows:
+            logger.info(f"Master data loaded successfully with {data_loader.saved_rows} rows.")
+        else:
+            logger.error("No master data was saved to the database.")
+    finally:
+        engine_registry.dispose()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the historical CSV files into the database.")
+    parser.add_argument('--bulk', action='store_true',
+                        help='Stream the files into the database in parallel worker processes, in bounded memory.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes for --bulk (default: number of CPUs).')
+    parser.add_argument('--compact', action='store_true',
+                        help='Hold the data with categorical names and explicit float types, and report the memory saved per stage.')
+    args = parser.parse_args()
+    main(bulk=args.bulk, workers=args.workers, compact=args.compact)
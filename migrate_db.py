@@ -0,0 +1,30 @@
+import argparse
+import logging
+import os
+
+from src.database_handler import DatabaseHandler
+
+
+def main(db_file_path):
+    """Convert the OHLCV table of an existing database to the typed, keyed and indexed schema in place."""
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not os.path.exists(db_file_path):
+        logger.error(f"Database file not found: {db_file_path}")
+        return
+
+    db_handler = DatabaseHandler(db_file_path)
+    if db_handler.migrate_ohlcv_schema():
+        logger.info(f"Migrated '{db_file_path}' to the typed schema.")
+    else:
+        logger.info(f"No migration needed for '{db_file_path}'.")
+    db_handler.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the ohlcv_marketcap_data table to the typed schema.")
+    parser.add_argument('--db', default='C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db',
+                        help='Path to the SQLite database file.')
+    args = parser.parse_args()
+    main(args.db)
@@ -1,9 +1,53 @@
 # src/__init__.py
+import importlib
 
-# You can import specific classes/functions to simplify access
-from .data_source import MasterData, MasterDataLoader, Fetcher, Aggregator
-from .data_analyzer import DataAnalyzer, PerformCalculations
-from .database_handler import DatabaseHandler
-from .data_cleaner import DataCleaner, PerformCleaning, DataFormatter
-from .data_loader import DataLoader, DataAggregator
-from .data_fetcher import NewDataLoader, FetchedDataProcessor
\ No newline at end of file
+# You can import specific classes/functions to simplify access. They are imported on first use,
+# so 'import src' does not load pandas, SQLAlchemy or Selenium until something is needed
+_EXPORTS = {
+    'MasterData': 'data_source',
+    'MasterDataLoader': 'data_source',
+    'Fetcher': 'data_source',
+    'Aggregator': 'data_source',
+    'DataAnalyzer': 'data_analyzer',
+    'PerformCalculations': 'data_analyzer',
+    'IndicatorState': 'data_analyzer',
+    'ThresholdSketches': 'data_analyzer',
+    'IndicatorEngine': 'indicators',
+    'RollingIndicatorState': 'indicators',
+    'DatabaseHandler': 'database_handler',
+    'ColumnarCache': 'columnar_cache',
+    'DataCleaner': 'data_cleaner',
+    'PerformCleaning': 'data_cleaner',
+    'DataFormatter': 'data_cleaner',
+    'DataLoader': 'data_loader',
+    'DataAggregator': 'data_loader',
+    'BulkLoader': 'data_loader',
+    'NewDataLoader': 'data_fetcher',
+    'HttpDataLoader': 'data_fetcher',
+    'FetchBackend': 'data_fetcher',
+    'FetchedDataProcessor': 'data_fetcher',
+    'StreamingPipeline': 'streaming',
+    'IncrementalAssetProcessor': 'streaming',
+    'Stage': 'pipeline',
+    'PipelineRunner': 'pipeline',
+    'Instrumentation': 'instrumentation',
+    'instrumented': 'instrumentation',
+    'MemoryReport': 'compact',
+    'to_compact': 'compact',
+    'configure_logging': 'logging_config',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    """Import the module of an exported name on first access (PEP 562)."""
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
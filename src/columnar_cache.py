@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect
+from src.database_handler import OHLCV_TABLE, OHLCV_KEY_COLUMNS, bump_table_version, quote
+
+
+# Set up logger for the columnar_cache module
+logger = logging.getLogger('columnar_cache_logger')
+logger.setLevel(logging.INFO)
+
+
+class ColumnarCache:
+    """
+    A columnar on-disk cache of the OHLCV table, loaded through memory mapping.
+
+    The Date column and every numeric column are stored as one NumPy .npy file each, sorted by
+    CryptocurrencyName and Date, and meta.json records the row range of every cryptocurrency.
+    Loading maps the files instead of reading them, so a full-history read needs no SQL parsing or
+    per-row conversion, and the columns of a single cryptocurrency are read-only views on the
+    mapped files. Each cache is stored under the table's version tag and is rebuilt from the
+    database as soon as the tag changes.
+
+    Methods:
+    load(cryptos=None, columns=None): Returns the table, or the selected cryptocurrencies and columns, from the cache.
+    refresh(): Rebuilds the cache if the table changed and returns its directory, or None if there is no table.
+    clear(): Deletes all cached versions.
+    """
+
+    META_FILE = 'meta.json'
+
+    def __init__(self, db_handler, cache_directory=None, table_name=OHLCV_TABLE):
+        self.db_handler = db_handler
+        self.table_name = table_name
+        self.cache_directory = cache_directory if cache_directory else f'{db_handler.database_url}.cache'
+
+    def load(self, cryptos=None, columns=None):
+        """Return the cached table sorted by CryptocurrencyName and Date, or an empty DataFrame if there is no table."""
+        version_directory = self.refresh()
+        if version_directory is None:
+            return pd.DataFrame()
+
+        with open(os.path.join(version_directory, self.META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        ranges = meta['ranges']
+        selected = list(ranges) if cryptos is None else [crypto for crypto in cryptos if crypto in ranges]
+        columns = meta['columns'] if columns is None else [column for column in meta['columns'] if column in columns or column in OHLCV_KEY_COLUMNS]
+
+        arrays = {
+            column: np.load(os.path.join(version_directory, f'{column}.npy'), mmap_mode='r')
+            for column in columns if column != 'CryptocurrencyName'
+        }
+        if cryptos is None:
+            data = dict(arrays)  # The mapped files themselves
+        elif len(selected) == 1:
+            start, stop = ranges[selected[0]]
+            data = {column: array[start:stop] for column, array in arrays.items()}  # Views on the mapped files
+        else:
+            data = {
+                column: np.concatenate([array[slice(*ranges[crypto])] for crypto in selected]) if selected else array[:0]
+                for column, array in arrays.items()
+            }
+
+        counts = [ranges[crypto][1] - ranges[crypto][0] for crypto in selected]
+        data['CryptocurrencyName'] = np.repeat(np.array(selected, dtype=object), counts)
+        df = pd.DataFrame({column: data[column] for column in columns}, copy=False)
+        logger.info(f"Loaded {len(df)} rows of {len(selected)} cryptocurrencies from the columnar cache.")
+        return df
+
+    def refresh(self):
+        """Rebuild the cache if the table's version changed, return the cache directory or None if there is no table."""
+        version = self.db_handler.get_table_version(self.table_name)
+        if version is None:
+            with self.db_handler.engine.begin() as connection:
+                if not inspect(connection).has_table(self.table_name):
+                    logger.warning(f"Table '{self.table_name}' does not exist, nothing to cache.")
+                    return None
+                # Tables written before the version counter existed start counting here
+                bump_table_version(connection, self.table_name)
+            return self._build()
+
+        version_directory = os.path.join(self.cache_directory, version)
+        if os.path.exists(os.path.join(version_directory, self.META_FILE)):
+            return version_directory
+        return self._build()
+
+    def clear(self):
+        """Delete all cached versions."""
+        shutil.rmtree(self.cache_directory, ignore_errors=True)
+        logger.info(f"Cleared the columnar cache in {self.cache_directory}.")
+
+    def _build(self):
+        """Write the current table to a new version directory and remove the older versions."""
+        # The version and the rows are read in one transaction, so they always describe the same data
+        with self.db_handler.engine.begin() as connection:
+            version = self.db_handler.get_table_version(self.table_name, connection)
+            order = ', '.join(quote(column) for column in OHLCV_KEY_COLUMNS)
+            df = pd.read_sql_query(f'SELECT * FROM {quote(self.table_name)} ORDER BY {order}', connection)
+
+        version_directory = os.path.join(self.cache_directory, version)
+        temporary_directory = f'{version_directory}.tmp-{os.getpid()}'
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+        os.makedirs(temporary_directory)
+
+        for column in df.columns:
+            if column == 'CryptocurrencyName':
+                continue
+            if column == 'Date':
+                values = pd.to_datetime(df[column]).to_numpy(dtype='datetime64[ns]')
+            else:
+                values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64')
+            np.save(os.path.join(temporary_directory, f'{column}.npy'), values)
+
+        names = df['CryptocurrencyName'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]]) if len(names) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(names)]
+        meta = {
+            'version': version,
+            'columns': list(df.columns),
+            'ranges': {names[start]: [int(start), int(stop)] for start, stop in zip(starts, stops)},
+        }
+        with open(os.path.join(temporary_directory, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        try:
+            os.replace(temporary_directory, version_directory)
+        except OSError:
+            # Another process built the same version first
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+        self._remove_old_versions(keep=version)
+        logger.info(f"Built the columnar cache of '{self.table_name}' version {version} with {len(df)} rows.")
+        return version_directory
+
+    def _remove_old_versions(self, keep):
+        """Delete the other version directories, files still mapped by this process are left for a later run."""
+        for entry in os.listdir(self.cache_directory):
+            if entry != keep and '.tmp-' not in entry:
+                shutil.rmtree(os.path.join(self.cache_directory, entry), ignore_errors=True)
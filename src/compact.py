@@ -0,0 +1,103 @@
+import logging
+import pandas as pd
+
+
+# Set up logger for the compact module
+logger = logging.getLogger('compact_logger')
+logger.setLevel(logging.INFO)
+
+# Column types of the compact representation. The names become categorical codes and the dates
+# datetime64 instead of Python strings. Prices, the market cap, the typical price and the VWAP stay
+# float64: the changes are calculated from the prices and market caps exceed float32's seven digits.
+# Volumes and percentage changes are held as float32, which is precise enough for them since the
+# cumulative volume sums are taken in float64. DatabaseHandler.to_storage_format upcasts every float32
+# column to float64 before it is written, so the stored columns keep their type
+COMPACT_DTYPES = {
+    'CryptocurrencyName': 'category',
+    'Date': 'datetime64[ns]',
+    'Open': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Close': 'float64',
+    'Volume': 'float32',
+    'Market Cap': 'float64',
+    'Typical_Price': 'float64',
+    'VWAP': 'float64',
+    'Open_Daily_Pct_Change': 'float32',
+    'High_Daily_Pct_Change': 'float32',
+    'Low_Daily_Pct_Change': 'float32',
+    'Close_Daily_Pct_Change': 'float32',
+    'Volume_Pct_Change': 'float32',
+}
+
+
+def frame_memory(df):
+    """Return the memory used by the DataFrame in bytes, including the strings of object columns."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def to_compact(df, dtypes=None):
+    """
+    Return the DataFrame in the compact representation, converting only the columns that differ from it.
+
+    Asset names become categorical codes, dates datetime64 and numeric columns the float type of
+    COMPACT_DTYPES (or the given dtypes). Missing values, including pd.NA in object columns, become NaN.
+    Columns that are not listed keep their type.
+    """
+    dtypes = COMPACT_DTYPES if dtypes is None else dtypes
+    converted = {}
+    for column, dtype in dtypes.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == 'category':
+            converted[column] = df[column].astype('category')
+        elif dtype.startswith('datetime64'):
+            converted[column] = pd.to_datetime(df[column], errors='coerce').astype(dtype)
+        else:
+            # to_numeric turns pd.NA and unparsable values into NaN before the cast
+            converted[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df.assign(**converted) if converted else df
+
+
+class MemoryReport:
+    """
+    Collects the memory used by the frames handed between the stages in compact mode.
+
+    Methods:
+    record(stage, before_bytes, df): Records the memory of a stage's input and of its compact output.
+    summary(): Returns the records as a DataFrame with the bytes and percentage saved per stage.
+    reset(): Forgets all records.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, stage, before_bytes, df):
+        """Record the bytes of a stage's frame before and after the compact conversion, return the bytes saved."""
+        after_bytes = frame_memory(df)
+        saved = before_bytes - after_bytes
+        self.records.append({
+            'stage': stage,
+            'rows': len(df),
+            'before_bytes': before_bytes,
+            'after_bytes': after_bytes,
+            'saved_bytes': saved,
+            'saved_pct': 100 * saved / before_bytes if before_bytes else 0.0,
+        })
+        logger.info(
+            f"{stage}: {before_bytes / 1e6:.1f} MB -> {after_bytes / 1e6:.1f} MB for {len(df)} rows "
+            f"({self.records[-1]['saved_pct']:.0f}% saved)."
+        )
+        return saved
+
+    def summary(self):
+        """Return the records as a DataFrame, one row per stage."""
+        return pd.DataFrame(self.records, columns=['stage', 'rows', 'before_bytes', 'after_bytes', 'saved_bytes', 'saved_pct'])
+
+    def reset(self):
+        """Forget all records."""
+        self.records = []
+
+
+# The process-wide report the compact stages record into
+memory_report = MemoryReport()
@@ -1,21 +1,69 @@
-import os
 import pandas as pd
 import numpy as np
 import logging
 import json
-from sqlalchemy import create_engine
+from src.quantile_sketch import TDigest
 from src.database_handler import DatabaseHandler
+from src.instrumentation import instrumented
+from src.compact import to_compact, frame_memory, memory_report
+from src.indicators import IndicatorEngine, RollingIndicatorState
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('data_analyzer_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'data_analyzer.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+def grouped_cumsum(values, groups, seeds=None):
+    """Cumulative sum of values within each group in a single pass, optionally continuing from per-group seeds.
+
+    Missing values are skipped like Series.cumsum, and a seed is added to the first value of its group so
+    the sums are built in the same order as a cumsum over the full history.
+    """
+    values = values.astype('float64')
+    missing = values.isna()
+    if seeds is not None:
+        first_rows = ~groups.duplicated()
+        seed_values = groups[first_rows].map(seeds).astype('float64').fillna(0.0)
+        values = values.copy()
+        values[first_rows] = values[first_rows].fillna(0.0) + seed_values
+    cumulative = values.groupby(groups, sort=False, observed=True).cumsum()
+    return cumulative.mask(missing)
+
+
+def calculate_with_history(new_data, history_tail=None, history_totals=None):
+    """Calculate the typical price, VWAP and daily changes of new rows, continuing from earlier history.
+
+    Args:
+        new_data (DataFrame): The cleaned new rows.
+        history_tail (DataFrame, optional): The last earlier OHLCV row(s) of each cryptocurrency, used for the daily changes.
+        history_totals (DataFrame, optional): Cumulative_Volume and Cumulative_TPV per cryptocurrency, used for the VWAP.
+
+    Returns:
+        DataFrame: The new rows with all calculated columns.
+    """
+    newdata_analyzer = DataAnalyzer(new_data.copy())
+    newdata_analyzer.calculate_typical_price()
+    newdata_analyzer.calculate_vwap(initial_totals=history_totals)
+    new_rows = newdata_analyzer.df
+    new_rows['Date'] = pd.to_datetime(new_rows['Date'])
+    new_rows['Is_New'] = True
+
+    # Prepend the earlier tail so the first new row of each crypto has a previous day to diff against
+    frames = [new_rows]
+    if history_tail is not None and not history_tail.empty:
+        tail = history_tail.copy()
+        tail['Date'] = pd.to_datetime(tail['Date'])
+        tail['Is_New'] = False
+        frames.insert(0, tail)
+
+    change_analyzer = DataAnalyzer(pd.concat(frames, ignore_index=True))
+    change_analyzer.calculate_price_change()
+    change_analyzer.clean_data()
+
+    result = change_analyzer.df[change_analyzer.df['Is_New']].drop(columns=['Is_New'])
+    new_columns = [column for column in new_rows.columns if column != 'Is_New']
+    return result[new_columns + [column for column in result.columns if column not in new_columns]]
+
 
 class DataAnalyzer:
     """ 
@@ -28,11 +76,20 @@ class DataAnalyzer:
     clean_data(): Drops unnecessary columns from the DataFrame.
     calculate_price_change(): Calculates daily price changes and percentage changes for each cryptocurrency.
     detect_large_changes(thresholds, data_subset=None): Detects large changes in percentage based on the provided thresholds.
+    calculate_indicators(engine=None, state=None): Calculates the SMA, EMA, RSI, Bollinger, ATR and rolling VWAP columns (see src.indicators).
+
+    With compact=True the DataFrame is converted to the compact representation (see src.compact)
+    on creation, and the calculated percentage changes are held as float32.
     """
     
-    def __init__(self, df):
+    def __init__(self, df, compact=False):
         if df is None or df.empty:
             raise ValueError("DataFrame cannot be None or empty.")
+        self.compact = compact
+        if compact:
+            before_bytes = frame_memory(df)
+            df = to_compact(df)
+            memory_report.record('DataAnalyzer', before_bytes, df)
         self.df = df 
 
     def calculate_typical_price(self):
@@ -42,39 +99,41 @@ class DataAnalyzer:
         return self.df
     
 
-    def calculate_vwap(self):
-        """Calculate VWAP for each cryptocurrency."""
-        self.df['Cumulative_Volume'] = self.df.groupby('CryptocurrencyName')['Volume'].cumsum()
-        self.df['VWAP'] = np.nan
+    def calculate_vwap(self, initial_totals=None):
+        """Calculate VWAP for each cryptocurrency, accumulated over its whole history.
 
-        for crypto in self.df['CryptocurrencyName'].unique():
-            crypto_data = self.df[self.df['CryptocurrencyName'] == crypto].copy()
-            crypto_data['VWAP'] = (crypto_data['Typical_Price'] * crypto_data['Volume']).cumsum() / crypto_data['Cumulative_Volume']
-            self.df.loc[crypto_data.index, 'VWAP'] = crypto_data['VWAP']
+        The rolling N-day VWAP_<n> columns are added by calculate_indicators.
 
-        self.df.drop(columns=['Cumulative_Volume'], inplace=True)
+        Args:
+            initial_totals (DataFrame, optional): Cumulative_Volume and Cumulative_TPV indexed by
+                CryptocurrencyName, used to continue the VWAP of history that is not in self.df.
+        """
+        groups = self.df['CryptocurrencyName']
+        volume_seeds = initial_totals['Cumulative_Volume'] if initial_totals is not None else None
+        tpv_seeds = initial_totals['Cumulative_TPV'] if initial_totals is not None else None
+
+        cumulative_volume = grouped_cumsum(self.df['Volume'], groups, volume_seeds)
+        cumulative_tpv = grouped_cumsum(self.df['Typical_Price'] * self.df['Volume'], groups, tpv_seeds)
+        self.df['VWAP'] = cumulative_tpv / cumulative_volume
         logger.info("Calculated VWAP for each cryptocurrency.")
         return self.df
 
     def determine_thresholds(self, percentile=98):
         """Determine price change thresholds for percentage changes."""
         logger.info(f"Determining price change thresholds at the {percentile}th percentile.")
-        thresholds = {column: {} for column in ['Open_Pct_Change', 'High_Pct_Change', 'Low_Pct_Change', 'Close_Pct_Change', 'Volume_Pct_Change']}
+        columns = ['Open', 'High', 'Low', 'Close', 'Volume']
 
-        for crypto in self.df['CryptocurrencyName'].unique():
-            crypto_df = self.df[self.df['CryptocurrencyName'] == crypto]
+        # One grouped pass for the percentage changes and one for the percentiles of all columns
+        pct_changes = self.df.groupby('CryptocurrencyName', sort=False, observed=True)[columns].pct_change() * 100
+        pct_changes['CryptocurrencyName'] = self.df['CryptocurrencyName']
+        percentiles = pct_changes.groupby('CryptocurrencyName', sort=False, observed=True)[columns].quantile(percentile / 100)
 
-            for column in ['Open', 'High', 'Low', 'Close', 'Volume']:
-                pct_change = crypto_df[column].pct_change() * 100
-                valid_pct_change = pct_change[~pct_change.isna()]
+        thresholds = {f'{column}_Pct_Change': percentiles[column].to_dict() for column in columns}
 
-                if not valid_pct_change.empty:
-                    threshold = np.percentile(valid_pct_change, percentile)
-                    thresholds[f'{column}_Pct_Change'][crypto] = threshold
-                    logger.info(f"Threshold for {crypto} - {column}_Pct_Change: {threshold:.2f}")
-                else:
-                    thresholds[f'{column}_Pct_Change'][crypto] = np.nan
-                    logger.warning(f"No valid data for {crypto} - {column}_Pct_Change. Threshold set to NaN.")
+        missing = int(percentiles.isna().sum().sum())
+        if missing:
+            logger.warning(f"No valid data for {missing} cryptocurrency/column pairs. Thresholds set to NaN.")
+        logger.info(f"Determined thresholds for {len(percentiles)} cryptocurrencies.")
 
         return thresholds
     
@@ -91,9 +150,14 @@ class DataAnalyzer:
         self.df['Date'] = pd.to_datetime(self.df['Date'])
         self.df = self.df.sort_values(by=['CryptocurrencyName', 'Date'])
 
-        self.df[['Open_Daily_Change', 'High_Daily_Change', 'Low_Daily_Change', 'Close_Daily_Change', 'Volume_Daily_Change']] = self.df.groupby('CryptocurrencyName')[['Open', 'High', 'Low', 'Close', 'Volume']].diff()
+        self.df[['Open_Daily_Change', 'High_Daily_Change', 'Low_Daily_Change', 'Close_Daily_Change', 'Volume_Daily_Change']] = self.df.groupby('CryptocurrencyName', observed=True)[['Open', 'High', 'Low', 'Close', 'Volume']].diff()
+
+        self.df[['Open_Daily_Pct_Change', 'High_Daily_Pct_Change', 'Low_Daily_Pct_Change', 'Close_Daily_Pct_Change', 'Volume_Pct_Change']] = self.df.groupby('CryptocurrencyName', observed=True)[['Open', 'High', 'Low', 'Close', 'Volume']].pct_change() * 100
 
-        self.df[['Open_Daily_Pct_Change', 'High_Daily_Pct_Change', 'Low_Daily_Pct_Change', 'Close_Daily_Pct_Change', 'Volume_Pct_Change']] = self.df.groupby('CryptocurrencyName')[['Open', 'High', 'Low', 'Close', 'Volume']].pct_change() * 100
+        if self.compact:
+            before_bytes = frame_memory(self.df)
+            self.df = to_compact(self.df)
+            memory_report.record('DataAnalyzer.calculate_price_change', before_bytes, self.df)
         
         return self.df
 
@@ -107,17 +171,33 @@ class DataAnalyzer:
         # If a data_subset is provided, use it; otherwise, use the full DataFrame (self.df)
         df_to_analyze = data_subset if data_subset is not None else self.df
 
+        # The thresholds are mapped per row, as floats also when the names are categorical
+        names = df_to_analyze['CryptocurrencyName']
+        limit = lambda key: names.map(thresholds[key]).astype('float64')
         large_changes = df_to_analyze[
-            (df_to_analyze['Open_Daily_Pct_Change'].abs() > df_to_analyze['CryptocurrencyName'].map(thresholds['Open_Pct_Change'])) |
-            (df_to_analyze['High_Daily_Pct_Change'].abs() > df_to_analyze['CryptocurrencyName'].map(thresholds['High_Pct_Change'])) |
-            (df_to_analyze['Low_Daily_Pct_Change'].abs() > df_to_analyze['CryptocurrencyName'].map(thresholds['Low_Pct_Change'])) |
-            (df_to_analyze['Close_Daily_Pct_Change'].abs() > df_to_analyze['CryptocurrencyName'].map(thresholds['Close_Pct_Change'])) |
-            (df_to_analyze['Volume_Pct_Change'].abs() > df_to_analyze['CryptocurrencyName'].map(thresholds['Volume_Pct_Change']))
+            (df_to_analyze['Open_Daily_Pct_Change'].abs() > limit('Open_Pct_Change')) |
+            (df_to_analyze['High_Daily_Pct_Change'].abs() > limit('High_Pct_Change')) |
+            (df_to_analyze['Low_Daily_Pct_Change'].abs() > limit('Low_Pct_Change')) |
+            (df_to_analyze['Close_Daily_Pct_Change'].abs() > limit('Close_Pct_Change')) |
+            (df_to_analyze['Volume_Pct_Change'].abs() > limit('Volume_Pct_Change'))
         ]
 
         logger.info(f"Detected {len(large_changes)} large changes in data.")
         return large_changes
 
+    def calculate_indicators(self, engine=None, state=None):
+        """Calculate the rolling technical indicators of every cryptocurrency.
+
+        Args:
+            engine (IndicatorEngine, optional): The indicators and windows, the defaults if None.
+            state (RollingIndicatorState, optional): The state after the earlier history, advanced past
+                self.df. Without a state self.df is the full history.
+        """
+        engine = engine if engine is not None else IndicatorEngine()
+        self.df = engine.calculate(self.df, state)
+        logger.info("Calculated rolling indicators for each cryptocurrency.")
+        return self.df
+
    
 class PerformCalculations:
     """
@@ -125,21 +205,30 @@ class PerformCalculations:
 
     Methods:
     calculate_masterdata(): Executes all necessary calculations on the master data, including typical price, VWAP, and thresholds.
-    save_thresholds(thresholds): Saves calculated thresholds to a JSON file for later use.
-    load_thresholds(): Loads thresholds from a JSON file to be used in analysis.
-    calculate_newdata(aggregated_data): Runs calculations on new data loaded from the database, detecting large changes on new data.
+    load_thresholds(percentile=98): Loads thresholds from the threshold sketches.
+    update_threshold_sketches(calculated_rows): Adds the percentage changes of new rows to the threshold sketches.
+    save_threshold_sketches(db_handler=None): Saves the threshold sketches to the database or a unit of work.
+    calculate_newdata(aggregated_data, state=None): Runs calculations on new data loaded from the database, detecting large changes on new data.
+    calculate_incremental(new_data, history_tail, history_totals): Calculates only the new rows, continuing from the stored history.
+    load_indicator_state(before_date=None): Loads the rolling indicator state, rebuilding it from the stored history if needed.
+    save_indicator_state(db_handler=None): Saves the rolling indicator state to the database or a unit of work.
     display_large_changes(large_changes, data_source): Displays rows where large changes were detected in the specified data source.
     """
-    def __init__(self, master_df, new_data_df=None):
+    def __init__(self, master_df, new_data_df=None, db_handler=None, compact=False):
         if master_df is None or master_df.empty:
             raise ValueError("Master DataFrame cannot be None or empty.")
         self.master_df = master_df
+        self.compact = compact
         self.new_data_df = new_data_df
-        self.db_handler = DatabaseHandler('sqlite:///"C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db')
+        self.db_handler = db_handler if db_handler is not None else DatabaseHandler()
+        self.threshold_sketches = None
+        self.indicator_engine = IndicatorEngine()
+        self.indicator_state = None
 
+    @instrumented(rows_in=lambda self: self.master_df)
     def calculate_masterdata(self):
         """Run all the necessary calculations on the master data."""
-        master_analyzer = DataAnalyzer(self.master_df)
+        master_analyzer = DataAnalyzer(self.master_df, compact=self.compact)
         master_analyzer.calculate_typical_price()
         master_analyzer.calculate_vwap()   
     
@@ -147,49 +236,79 @@ class PerformCalculations:
             logger.error("Master DataFrame is empty after calculating typical price and VWAP. Exiting.")
             return None
     
-        thresholds = master_analyzer.determine_thresholds(percentile=98)
-        if not thresholds:
+        # Build the threshold sketches from the full history once, the daily runs only add to them
+        self.threshold_sketches = ThresholdSketches.from_history(master_analyzer.df)
+        if self.threshold_sketches.is_empty():
             logger.error("No thresholds calculated, aborting further analysis.")
             return None
 
-        # Save the calculated thresholds
-        self.save_thresholds(thresholds)
+        # The sketches are saved by the caller, together with the rows they describe
             
         master_analyzer.calculate_price_change()
         master_analyzer.clean_data()
 
+        # Like the sketches, the indicator state is saved by the caller
+        self.indicator_state = RollingIndicatorState(self.indicator_engine)
+        master_analyzer.calculate_indicators(self.indicator_engine, self.indicator_state)
+
         logger.info("All calculations performed successfully.")
         return master_analyzer.df
 
 
-    def save_thresholds(self, thresholds):
-        """Save thresholds to a JSON file."""
-        with open('thresholds.json', 'w') as f:
-            json.dump(thresholds, f)
-        logger.info("Thresholds saved to 'thresholds.json'.")
+    def load_thresholds(self, percentile=98):
+        """Load thresholds from the threshold sketches, loading the stored sketches if none are set."""
+        if self.threshold_sketches is None:
+            self.threshold_sketches = ThresholdSketches.load(self.db_handler)
+        if self.threshold_sketches.is_empty():
+            logger.error("No threshold sketches found. Exiting.")
+            return None
+        logger.info(f"Thresholds at the {percentile}th percentile queried from the threshold sketches.")
+        return self.threshold_sketches.thresholds(percentile)
 
+    def update_threshold_sketches(self, calculated_rows):
+        """Add the percentage changes of newly calculated rows to the threshold sketches."""
+        if self.threshold_sketches is None or self.threshold_sketches.is_empty():
+            logger.warning("No threshold sketches loaded, the new changes are not added to the thresholds.")
+            return
+        self.threshold_sketches.update(calculated_rows)
 
-    def load_thresholds(self):
-        """Load thresholds from a JSON file."""
-        try:
-            with open('thresholds.json', 'r') as f:
-                thresholds = json.load(f)
-            logger.info("Thresholds loaded from 'thresholds.json'.")
-            return thresholds
-        except FileNotFoundError:
-            logger.error("Thresholds file not found. Exiting.")
-            return None      
+    def save_threshold_sketches(self, db_handler=None):
+        """Save the threshold sketches to the database, or register them with the given unit of work."""
+        if self.threshold_sketches is not None and not self.threshold_sketches.is_empty():
+            self.threshold_sketches.save(db_handler if db_handler is not None else self.db_handler)
 
-    def calculate_newdata(self, aggregated_data):
-        """Run all the necessary calculations on the new data loaded from the database."""
-        # Create a DataAnalyzer instance with the aggregated data
+    @instrumented()
+    def calculate_newdata(self, aggregated_data, state=None):
+        """Run all the necessary calculations on the new data loaded from the database.
+
+        Args:
+            aggregated_data (DataFrame): The stored history with the new rows appended, or only the
+                new rows when a state is given.
+            state (IndicatorState, optional): The per-crypto state of the stored history. When given, only
+                the new rows are calculated in O(number of assets) and the state is advanced past them.
+                Without a state everything in aggregated_data is recalculated.
+        """
+        if state is not None and not state.is_empty():
+            new_data = state.drop_processed(aggregated_data)
+            if new_data.empty:
+                logger.warning("All new rows are already included in the indicator state.")
+                return None
+
+            latest_data = self.calculate_incremental(new_data, state.get_tail(), state.get_totals())
+            if latest_data is not None:
+                state.update(latest_data)
+            return latest_data
+
+        # Fall back to recalculating the full history
+        logger.info("No indicator state given, recalculating the full history.")
         newdata_analyzer = DataAnalyzer(aggregated_data)
     
         # Perform calculations
         newdata_analyzer.calculate_typical_price()
         newdata_analyzer.calculate_vwap()
 
-        # Load thresholds from the saved file
+        # A full recalculation rebuilds the sketches from the whole history, the caller saves them with the rows
+        self.threshold_sketches = ThresholdSketches.from_history(newdata_analyzer.df)
         thresholds = self.load_thresholds()
         if thresholds is None:
             logger.error("Cannot proceed without thresholds.")
@@ -197,9 +316,12 @@ class PerformCalculations:
 
         newdata_analyzer.calculate_price_change()
         newdata_analyzer.clean_data()
+        self.indicator_state = RollingIndicatorState(self.indicator_engine)
+        newdata_analyzer.calculate_indicators(self.indicator_engine, self.indicator_state)
 
-        # Filter the data for the last two days
-        last_two_days = aggregated_data[aggregated_data['Date'] >= (pd.Timestamp.now() - pd.Timedelta(days=2))]
+        # Filter the calculated data for the last two days, the aggregated rows have no changes of the new days
+        calculated = newdata_analyzer.df
+        last_two_days = calculated[pd.to_datetime(calculated['Date']) >= (pd.Timestamp.now() - pd.Timedelta(days=2))]
 
         # Check if there is data for the last two days
         if last_two_days.empty:
@@ -215,6 +337,49 @@ class PerformCalculations:
         return newdata_analyzer.df  # Return the processed DataFrame
     
     
+    def calculate_incremental(self, new_data, history_tail, history_totals):
+        """Run the calculations on the new rows only, continuing from the stored history.
+
+        Args:
+            new_data (DataFrame): The cleaned new rows.
+            history_tail (DataFrame): The last stored OHLCV row(s) of each cryptocurrency, used for the daily changes.
+            history_totals (DataFrame): Cumulative_Volume and Cumulative_TPV per cryptocurrency, used for the VWAP.
+
+        Returns:
+            DataFrame: The new rows with all calculated columns, or None if thresholds are missing.
+        """
+        thresholds = self.load_thresholds()
+        if thresholds is None:
+            logger.error("Cannot proceed without thresholds.")
+            return None
+
+        result = calculate_with_history(new_data, history_tail, history_totals)
+        if self.indicator_state is None:
+            self.indicator_state = self.load_indicator_state(before_date=pd.to_datetime(new_data['Date']).min())
+        result = DataAnalyzer(result).calculate_indicators(self.indicator_engine, self.indicator_state)
+        logger.info(f"Calculated {len(result)} new rows incrementally.")
+
+        large_changes = DataAnalyzer(result).detect_large_changes(thresholds)
+        self.display_large_changes(large_changes, "New Data")
+
+        # The new changes only count towards the thresholds of the following days
+        self.update_threshold_sketches(result)
+
+        return result
+
+    def load_indicator_state(self, before_date=None):
+        """Load the rolling indicator state, rebuilding it from the stored rows before before_date if there is none."""
+        state = RollingIndicatorState.load(self.db_handler, self.indicator_engine)
+        if state.is_empty():
+            logger.warning("Rebuilding the rolling indicator state from the stored table.")
+            state = RollingIndicatorState.from_database(self.db_handler, self.indicator_engine, before_date=before_date)
+        return state
+
+    def save_indicator_state(self, db_handler=None):
+        """Save the rolling indicator state to the database, or register it with the given unit of work."""
+        if self.indicator_state is not None and not self.indicator_state.is_empty():
+            self.indicator_state.save(db_handler if db_handler is not None else self.db_handler)
+
     def display_large_changes(self, large_changes, data_source):
         """Display rows where large changes were detected."""
         if not large_changes.empty:
@@ -226,3 +391,239 @@ class PerformCalculations:
         else:
             logger.info(f"No large changes detected in {data_source}.")
             print(f"No large changes detected in {data_source}.")
+
+
+class IndicatorState:
+    """
+    A class to keep the per-cryptocurrency state needed to extend the calculations by one bar.
+
+    The state holds the running VWAP totals (cumulative volume and cumulative typical price x volume)
+    and the last OHLCV row of every cryptocurrency. It is persisted in the 'indicator_state' table so
+    the daily run never has to read the full history.
+
+    Methods:
+    from_history(df, before_date=None): Builds the state from a DataFrame with the full history.
+    from_database(db_handler, table_name, before_date=None): Builds the state from the stored table with two SQL aggregations.
+    load(db_handler): Loads the persisted state from the database.
+    save(db_handler): Persists the state to the database.
+    is_empty(): Returns True if the state holds no cryptocurrencies.
+    get_tail(): Returns the last OHLCV row of every cryptocurrency.
+    get_totals(): Returns the running VWAP totals of every cryptocurrency.
+    drop_processed(new_data): Drops new rows that are not newer than the state of their cryptocurrency.
+    update(calculated_rows): Advances the state past the newly calculated rows.
+    """
+
+    TABLE_NAME = 'indicator_state'
+    OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+    COLUMNS = ['CryptocurrencyName', 'Date', 'Cumulative_Volume', 'Cumulative_TPV'] + OHLCV_COLUMNS
+
+    def __init__(self, state_df=None):
+        if state_df is None or state_df.empty:
+            state_df = pd.DataFrame(columns=self.COLUMNS)
+        self.state_df = state_df[self.COLUMNS].reset_index(drop=True)
+        self.state_df['Date'] = pd.to_datetime(self.state_df['Date'])
+
+    @classmethod
+    def from_history(cls, df, before_date=None):
+        """Build the state from a DataFrame holding the full history of every cryptocurrency."""
+        history = df.copy()
+        history['Date'] = pd.to_datetime(history['Date'])
+        if before_date is not None:
+            history = history[history['Date'] < pd.Timestamp(before_date)]
+        if history.empty:
+            return cls()
+
+        for column in cls.OHLCV_COLUMNS + ['Typical_Price']:
+            if column in history.columns and not pd.api.types.is_numeric_dtype(history[column]):
+                history[column] = pd.to_numeric(history[column].astype(str).str.rstrip('%'), errors='coerce')
+        if 'Typical_Price' not in history.columns:
+            history['Typical_Price'] = (history['High'] + history['Low'] + history['Close'] + history['Open']) / 4
+
+        history = history.sort_values(by=['CryptocurrencyName', 'Date'], kind='stable')
+        grouped = history.groupby('CryptocurrencyName', observed=True)
+        history['Cumulative_Volume'] = grouped['Volume'].cumsum()
+        history['Cumulative_TPV'] = (history['Typical_Price'] * history['Volume']).groupby(history['CryptocurrencyName'], observed=True).cumsum()
+
+        state_df = grouped.tail(1).set_index('CryptocurrencyName')[['Date'] + cls.OHLCV_COLUMNS]
+        totals = history.groupby('CryptocurrencyName', observed=True)[['Cumulative_Volume', 'Cumulative_TPV']].last()
+        state_df = state_df.join(totals).reset_index()
+        logger.info(f"Built indicator state for {len(state_df)} cryptocurrencies from {len(history)} rows.")
+        return cls(state_df)
+
+    @classmethod
+    def from_database(cls, db_handler, table_name='ohlcv_marketcap_data', before_date=None):
+        """Build the state from the stored table without loading the history into memory."""
+        tail = db_handler.get_tail_per_crypto(table_name, n=1, before_date=before_date)
+        totals = db_handler.get_cumulative_totals(table_name, before_date=before_date)
+        if tail.empty:
+            return cls()
+
+        state_df = tail.set_index('CryptocurrencyName').join(totals).reset_index()
+        logger.info(f"Built indicator state for {len(state_df)} cryptocurrencies from table '{table_name}'.")
+        return cls(state_df)
+
+    @classmethod
+    def load(cls, db_handler):
+        """Load the persisted state from the database."""
+        state_df = db_handler.load_data_from_database(cls.TABLE_NAME)
+        if state_df.empty:
+            logger.warning(f"No indicator state found in table '{cls.TABLE_NAME}'.")
+            return cls()
+
+        logger.info(f"Loaded indicator state for {len(state_df)} cryptocurrencies.")
+        return cls(state_df)
+
+    def save(self, db_handler):
+        """Persist the state through a DatabaseHandler or register it with a UnitOfWork."""
+        state_df = self.state_df.copy()
+        state_df['Date'] = state_df['Date'].dt.strftime('%Y-%m-%d')
+        db_handler.save_to_database(state_df, self.TABLE_NAME, mode='replace')
+        logger.info(f"Saved indicator state for {len(state_df)} cryptocurrencies.")
+
+    def is_empty(self):
+        """Return True if the state holds no cryptocurrencies."""
+        return self.state_df.empty
+
+    def get_tail(self):
+        """Return the last OHLCV row of every cryptocurrency."""
+        return self.state_df[['Date', 'CryptocurrencyName'] + self.OHLCV_COLUMNS].copy()
+
+    def get_totals(self):
+        """Return Cumulative_Volume and Cumulative_TPV indexed by CryptocurrencyName."""
+        return self.state_df.set_index('CryptocurrencyName')[['Cumulative_Volume', 'Cumulative_TPV']]
+
+    def drop_processed(self, new_data):
+        """Drop new rows dated on or before the last date already in the state of their cryptocurrency."""
+        last_dates = new_data['CryptocurrencyName'].map(self.state_df.set_index('CryptocurrencyName')['Date'])
+        processed = pd.to_datetime(new_data['Date']) <= last_dates
+        if processed.any():
+            logger.warning(f"Skipping {processed.sum()} rows that are already included in the indicator state.")
+        return new_data[~processed]
+
+    def update(self, calculated_rows):
+        """Advance the state past the newly calculated rows."""
+        rows = calculated_rows.copy()
+        rows['Date'] = pd.to_datetime(rows['Date'])
+        rows = rows.sort_values(by=['CryptocurrencyName', 'Date'], kind='stable')
+
+        # Seed the running sums with the stored totals so they add up in the same order as a full recalculation
+        seeds = pd.DataFrame({
+            'CryptocurrencyName': self.state_df['CryptocurrencyName'],
+            'Cumulative_Volume': self.state_df['Cumulative_Volume'].astype('float64'),
+            'Cumulative_TPV': self.state_df['Cumulative_TPV'].astype('float64'),
+        })
+        flows = pd.DataFrame({
+            'CryptocurrencyName': rows['CryptocurrencyName'],
+            'Cumulative_Volume': rows['Volume'],
+            'Cumulative_TPV': rows['Typical_Price'] * rows['Volume'],
+        })
+        combined = pd.concat([seeds, flows], ignore_index=True)
+        combined[['Cumulative_Volume', 'Cumulative_TPV']] = combined.groupby('CryptocurrencyName', observed=True)[['Cumulative_Volume', 'Cumulative_TPV']].cumsum()
+        totals = combined.groupby('CryptocurrencyName', observed=True)[['Cumulative_Volume', 'Cumulative_TPV']].last()
+
+        last_rows = rows.groupby('CryptocurrencyName', observed=True).tail(1).set_index('CryptocurrencyName')[['Date'] + self.OHLCV_COLUMNS]
+        state_df = self.state_df.set_index('CryptocurrencyName')[['Date'] + self.OHLCV_COLUMNS]
+        state_df = state_df.drop(index=last_rows.index, errors='ignore')
+        state_df = pd.concat([state_df, last_rows]) if not state_df.empty else last_rows
+        self.state_df = state_df.join(totals).reset_index()[self.COLUMNS]
+        logger.info(f"Advanced indicator state with {len(rows)} new rows.")
+
+
+class ThresholdSketches:
+    """
+    A class to keep one streaming percentile sketch (t-digest) per cryptocurrency and price column.
+
+    The sketches summarise all daily percentage changes seen so far, so the large-change thresholds
+    follow the data as new days are added without rescanning the history. They are persisted in
+    the 'threshold_sketches' table.
+
+    Methods:
+    from_history(df, compression=200): Builds the sketches from the percentage changes of the full history.
+    load(db_handler): Loads the persisted sketches from the database.
+    save(db_handler): Persists the sketches to the database.
+    is_empty(): Returns True if there are no sketches.
+    update(calculated_rows): Adds the daily percentage changes of new rows to the sketches.
+    thresholds(percentile=98): Returns the thresholds in the same format as DataAnalyzer.determine_thresholds.
+    """
+
+    TABLE_NAME = 'threshold_sketches'
+    CHANGE_COLUMNS = {
+        'Open': 'Open_Daily_Pct_Change',
+        'High': 'High_Daily_Pct_Change',
+        'Low': 'Low_Daily_Pct_Change',
+        'Close': 'Close_Daily_Pct_Change',
+        'Volume': 'Volume_Pct_Change',
+    }
+
+    def __init__(self, sketches=None, compression=200):
+        self.sketches = sketches if sketches is not None else {}  # (crypto, column) -> TDigest
+        self.compression = compression
+
+    @classmethod
+    def from_history(cls, df, compression=200):
+        """Build the sketches from the percentage changes of the full history."""
+        columns = list(cls.CHANGE_COLUMNS)
+        history = df[['CryptocurrencyName'] + columns].copy()
+        for column in columns:
+            if not pd.api.types.is_numeric_dtype(history[column]):
+                history[column] = pd.to_numeric(history[column].astype(str).str.rstrip('%'), errors='coerce')
+
+        pct_changes = history.groupby('CryptocurrencyName', sort=False, observed=True)[columns].pct_change() * 100
+        sketches = cls(compression=compression)
+        for crypto, crypto_changes in pct_changes.groupby(history['CryptocurrencyName'], sort=False, observed=True):
+            for column in columns:
+                sketches._sketch(crypto, column).update(crypto_changes[column].to_numpy())
+
+        logger.info(f"Built threshold sketches for {pct_changes.shape[0]} rows and {len(sketches.sketches)} cryptocurrency/column pairs.")
+        return sketches
+
+    @classmethod
+    def load(cls, db_handler):
+        """Load the persisted sketches from the database."""
+        stored = db_handler.load_data_from_database(cls.TABLE_NAME)
+        if stored.empty:
+            logger.warning(f"No threshold sketches found in table '{cls.TABLE_NAME}'.")
+            return cls()
+
+        sketches = {
+            (crypto, column): TDigest.from_dict(json.loads(sketch))
+            for crypto, column, sketch in stored[['CryptocurrencyName', 'Column', 'Sketch']].itertuples(index=False)
+        }
+        logger.info(f"Loaded {len(sketches)} threshold sketches.")
+        return cls(sketches)
+
+    def save(self, db_handler):
+        """Persist the sketches to the database."""
+        stored = pd.DataFrame(
+            [(crypto, column, json.dumps(sketch.to_dict())) for (crypto, column), sketch in self.sketches.items()],
+            columns=['CryptocurrencyName', 'Column', 'Sketch']
+        )
+        db_handler.save_to_database(stored, self.TABLE_NAME, mode='replace')
+        logger.info(f"Saved {len(stored)} threshold sketches.")
+
+    def is_empty(self):
+        """Return True if there are no sketches."""
+        return not self.sketches
+
+    def update(self, calculated_rows):
+        """Add the daily percentage changes of new rows to the sketches, O(1) amortized per value."""
+        change_columns = list(self.CHANGE_COLUMNS.values())
+        rows = calculated_rows[['CryptocurrencyName'] + change_columns].itertuples(index=False)
+        for crypto, *changes in rows:
+            for column, change in zip(self.CHANGE_COLUMNS, changes):
+                self._sketch(crypto, column).add(change)
+        logger.info(f"Added {len(calculated_rows)} rows of changes to the threshold sketches.")
+
+    def thresholds(self, percentile=98):
+        """Return the thresholds in the same format as DataAnalyzer.determine_thresholds."""
+        thresholds = {f'{column}_Pct_Change': {} for column in self.CHANGE_COLUMNS}
+        for (crypto, column), sketch in self.sketches.items():
+            thresholds[f'{column}_Pct_Change'][crypto] = sketch.percentile(percentile)
+        return thresholds
+
+    def _sketch(self, crypto, column):
+        """Return the sketch of a cryptocurrency and column, creating it if needed."""
+        key = (crypto, column)
+        if key not in self.sketches:
+            self.sketches[key] = TDigest(compression=self.compression)
+        return self.sketches[key]
@@ -1,19 +1,140 @@
 import os
+import json
+import numpy as np
 import pandas as pd
 import logging
 from src.database_handler import DatabaseHandler
+from src.instrumentation import instrumented
+from src.compact import to_compact, frame_memory, memory_report
 
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('data_cleaner_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'data_cleaner.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+NUMERIC_COLUMNS = ['Market Cap', 'Volume', 'Open', 'High', 'Low', 'Close']
+KEY_COLUMNS = ['CryptocurrencyName', 'Date']  # A cryptocurrency has one row per date
+
+
+class QualityReport:
+    """
+    Counts of the rows each cleaning rule applied to, in total and per cryptocurrency.
+
+    The rules are 'missing_<column>' for missing values in the input, 'non_positive_<column>' for
+    zero or negative values (prices are only reported, market caps and volumes are set to NaN),
+    'volume_forward_filled' and 'volume_unfilled' for the volumes replaced by the previous day's
+    value or left missing, and 'duplicate_key' for rows dropped because a later row has the same
+    cryptocurrency and date.
+
+    Methods:
+    add(masks, names): Adds the counts of boolean row masks, one per rule, grouped by cryptocurrency.
+    merge(other): Adds the rows and counts of another report, e.g. of another file or chunk.
+    totals(): Returns the count of every rule over all cryptocurrencies.
+    to_dict(): Returns the row counts, totals and per-cryptocurrency counts as a JSON-compatible dict.
+    """
+
+    MISSING_NAME = '<missing>'
+
+    def __init__(self, rows_in=0):
+        self.rows_in = rows_in
+        self.rows_out = rows_in
+        self.per_asset = pd.DataFrame()
+
+    def add(self, masks, names):
+        """Count the True rows of every mask per cryptocurrency, in one grouped pass over all masks."""
+        if not masks:
+            return
+        if names.isna().any():
+            names = names.astype(object).where(names.notna(), self.MISSING_NAME)
+        counts = pd.DataFrame(masks, index=names.index).groupby(names, observed=True, sort=False).sum()
+        self.per_asset = self.per_asset.add(counts, fill_value=0).fillna(0).astype('int64')
+
+    def merge(self, other):
+        """Add the rows and rule counts of another report to this one."""
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        self.per_asset = self.per_asset.add(other.per_asset, fill_value=0).fillna(0).astype('int64')
+        return self
+
+    def totals(self):
+        """Return the count of every rule over all cryptocurrencies."""
+        return {rule: int(count) for rule, count in self.per_asset.sum().items()}
+
+    def to_dict(self):
+        """Return the report as a JSON-compatible dict."""
+        return {
+            'rows_in': int(self.rows_in),
+            'rows_out': int(self.rows_out),
+            'totals': self.totals(),
+            'per_asset': {
+                str(name): {rule: int(count) for rule, count in counts.items() if count}
+                for name, counts in self.per_asset.iterrows() if counts.any()
+            },
+        }
+
+
+def drop_duplicate_keys(df, report=None):
+    """Drop the rows whose cryptocurrency and date appear again later, the last row of a key wins like an upsert."""
+    key_columns = [column for column in KEY_COLUMNS if column in df.columns]
+    duplicates = df.duplicated(subset=key_columns or None, keep='last')
+    if report is not None:
+        report.add({'duplicate_key': duplicates.to_numpy()}, df['CryptocurrencyName'])
+    return df[~duplicates] if duplicates.any() else df
+
+
+def clean_rows(df, numeric_columns=NUMERIC_COLUMNS, report=None, previous_volumes=None):
+    """
+    Apply the value rules of the cleaning to rows sorted by cryptocurrency and date without duplicate keys.
+
+    Zero and negative market caps and volumes become NaN, and every missing volume is filled with
+    the previous day's volume of the same cryptocurrency. The rows can be a whole dataset or one
+    chunk of a stream: previous_volumes maps each cryptocurrency to the last volume of the rows
+    before the chunk, so the forward fill continues across chunks. The rows every rule applied to
+    are added to report if one is given.
+    """
+    masks = {}
+    for column in KEY_COLUMNS:
+        if column in df.columns:
+            masks[f'missing_{column}'] = df[column].isna().to_numpy()
+
+    replaced = {}
+    for column in numeric_columns:
+        if column not in df.columns:
+            logger.warning(f"Column '{column}' is missing in the data.")
+            continue
+        values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+        missing = np.isnan(values)
+        non_positive = values <= 0  # False for NaN
+        masks[f'missing_{column}'] = missing
+        masks[f'non_positive_{column}'] = non_positive
+
+        # Prices are only reported, zero and negative market caps and volumes are not valid values
+        if column in PRICE_COLUMNS:
+            continue
+        if non_positive.any():
+            values = np.where(non_positive, np.nan, values)
+        replaced[column] = values
+
+    if 'Volume' in replaced:
+        # Fill each missing volume with the previous day's volume of the same cryptocurrency
+        volume = pd.Series(replaced['Volume'], index=df.index)
+        needs_fill = volume.isna().to_numpy()
+        if needs_fill.any():
+            names = df['CryptocurrencyName']
+            volume = volume.groupby(names, observed=True, sort=False).ffill()
+            if previous_volumes:
+                # Only the leading gaps of a cryptocurrency are left, they continue from the previous chunk
+                volume = volume.fillna(names.map(previous_volumes).astype('float64'))
+        still_missing = volume.isna().to_numpy()
+        masks['volume_forward_filled'] = needs_fill & ~still_missing
+        masks['volume_unfilled'] = still_missing
+        replaced['Volume'] = volume.to_numpy()
+
+    if report is not None:
+        report.add(masks, df['CryptocurrencyName'])
+    return df.assign(**replaced) if replaced else df
 
 
 class DataCleaner:
@@ -23,136 +144,89 @@ class DataCleaner:
 
     This class provides methods to handle missing values, remove duplicates, 
     and convert data formats to ensure the DataFrame is ready for analysis. 
+    Missing and invalid values are set to NaN, so numeric columns keep a float dtype. In compact
+    mode the cleaned DataFrame is also converted to the compact representation (see src.compact).
+
+    The columns are converted once, the frame is sorted at most once, and the rules are applied by
+    drop_duplicate_keys and clean_rows, which the bulk loader applies chunk by chunk as well. What
+    each rule changed is counted in quality_report (a QualityReport) instead of being logged line by line.
 
     Methods:
         clean_data(): Main function to clean the DataFrame and handle various data issues.
-        remove_duplicates(): Remove any duplicate rows in the DataFrame.
-        validate_and_clean_data(): Validate the data formats, handle missing and erroneous values.
+        remove_duplicates(): Remove rows with the same cryptocurrency and date, keeping the last one.
+        validate_and_clean_data(): Convert, sort, deduplicate and clean the data in one pass.
         check_and_convert_formats(): Check and convert columns to appropriate numeric or date formats.
         print_cleaned_data(): Print the cleaned DataFrame and total row count.
-        save_cleaned_data(): Save the cleaned DataFrame to a specified database.
+        save_cleaned_data(): Save the cleaned DataFrame to the database, only when called explicitly.
     """
-    def __init__(self, df, numeric_columns=None, date_columns=None):
+    def __init__(self, df, numeric_columns=None, date_columns=None, db_handler=None, compact=False):
         self.df = df
+        self.compact = compact
         # Use provided numeric columns or default ones
-        self.numeric_columns = numeric_columns if numeric_columns else ['Market Cap', 'Volume', 'Open', 'High', 'Low', 'Close']
+        self.numeric_columns = numeric_columns if numeric_columns else NUMERIC_COLUMNS
         self.date_columns = date_columns if date_columns else ['Date']  # Default to 'Date' column
-        self.db_handler = DatabaseHandler()
+        self.db_handler = db_handler
+        self.quality_report = QualityReport(len(df))
 
     def clean_data(self):
         """Main function to clean data."""
-        volume_na_count, forward_fill_count = self.validate_and_clean_data()
-        self.remove_duplicates()
-        logger.info("Data cleaning completed.")
+        # Duplicate keys are removed inside, before they could feed a forward fill
+        self.validate_and_clean_data()
         
         # Print the cleaned DataFrame and number of rows
         self.print_cleaned_data()
 
-        # Log the counts of cleaned rows
-        logger.info(f"Rows set to NA in 'Volume': {volume_na_count}")
-        logger.info(f"Rows forward filled in 'Volume': {forward_fill_count}")
- 
-        # Save the cleaned data to the database
-        self.save_cleaned_data()
+        # One line with every rule that changed or flagged rows, the details are in quality_report
+        applied = {rule: count for rule, count in self.quality_report.totals().items() if count}
+        logger.info(f"Data cleaning completed, {self.quality_report.rows_in} rows in, {self.quality_report.rows_out} rows out, rules applied: {applied}")
+
+        if self.compact:
+            before_bytes = frame_memory(self.df)
+            self.df = to_compact(self.df)
+            memory_report.record('DataCleaner.clean_data', before_bytes, self.df)
 
         return self.df  # Return the cleaned DataFrame
         
     def remove_duplicates(self):
-        """Remove duplicate rows."""
-        duplicates = self.df.duplicated().sum()
-        if duplicates > 0:
-            self.df = self.df.drop_duplicates()
-            logger.info(f"Removed {duplicates} duplicate rows after cleaning.")
-        else:
-            logger.info("No duplicate rows found.")
+        """Remove rows with the same cryptocurrency and date, the last row of a key wins like an upsert."""
+        self.df = drop_duplicate_keys(self.df, self.quality_report)
+        self.quality_report.rows_out = len(self.df)
 
     def validate_and_clean_data(self):
-        """Validate and clean the data formats."""
-        logger.info("Validating and cleaning data.")
-        volume_na_count = 0  # Count of rows set to NA in 'Volume'
-        forward_fill_count = 0  # Count of rows forward filled in 'Volume'
-
-        # Check for missing values in 'Date' and 'CryptocurrencyName' columns
-        if self.df['Date'].isna().any():
-            logger.warning("NaN values found in 'Date' column.")
-        if self.df['CryptocurrencyName'].isna().any():
-            logger.warning("NaN values found in 'CryptocurrencyName' column.")
-
-        # Check for negative, zero, and missing values in numeric columns
-        for column in self.numeric_columns:
-            if column in self.df.columns:
-                # Check for missing values
-                if self.df[column].isna().any():
-                    logger.warning(f"Missing values found in '{column}' column.")
-
-                # Check for negative or zero values in Open, High, Low, Close
-                if column in ['Open', 'High', 'Low', 'Close']:
-                    if (self.df[column] <= 0).any():
-                        logger.warning(f"Zero or negative values found in '{column}' column.")
-
-                # Handle cleaning for 'Market Cap' column
-                if column == 'Market Cap':
-                    self.df[column] = self.df[column].replace({-1: pd.NA})  # Assuming -1 is an example of a negative value
-                    self.df[column] = self.df[column].where(self.df[column] > 0, pd.NA)  # Set any negative values to NA
-                    logger.info(f"Replaced negative values in 'Market Cap' with NA.")
-
-                # Handle cleaning for 'Volume' column
-                if column == 'Volume':
-                    # Initial count of NA values before cleaning
-                    initial_na_count = self.df[column].isna().sum()
-
-                    # Set negative and zero values to NA
-                    self.df[column] = self.df[column].where(self.df[column] > 0, pd.NA)
-                    volume_na_count = self.df[column].isna().sum() - initial_na_count  # Count new NA values in 'Volume'
-
-                    logger.info(f"Rows set to NA in 'Volume' during cleaning: {volume_na_count}")
-
-                    # Fill zero or NA values using forward fill
-                    self.df['Date'] = pd.to_datetime(self.df['Date'])
-                    self.df.sort_values(by=['CryptocurrencyName', 'Date'], inplace=True)
-
-                    # Count the number of rows to forward fill
-                    forward_fill_indexes = self.df[self.df[column].isna()].index
-                    forward_fill_count = len(forward_fill_indexes)  # Count the rows that will be forward filled
-                    
-                    # Perform forward fill
-                    self.df[column] = self.df.groupby('CryptocurrencyName')[column].ffill()
-                    
-                    # After forward fill, calculate how many were actually filled
-                    remaining_na_after_fill = self.df[self.df[column].isna()].index.isin(forward_fill_indexes).sum()
-                    forward_fill_count -= remaining_na_after_fill  # Update the forward fill count
-                    
-                    logger.info(f"Rows forward filled in 'Volume' column: {forward_fill_count}")
-
-            else:
-                logger.warning(f"Column '{column}' is missing in the data.")
-
+        """Validate and clean the data in one pass, return the volumes set to NaN and the volumes forward filled."""
         self.check_and_convert_formats()
-        return volume_na_count, forward_fill_count  # Return counts of NA and forward filled rows
+        df = self.df
+
+        # Sort once, and only if the rows are not in key order already
+        if 'Date' in df.columns and not self._is_sorted(df):
+            df = df.sort_values(by=KEY_COLUMNS, kind='stable')
+        self.df = df
+        self.remove_duplicates()
+        self.df = clean_rows(self.df, self.numeric_columns, self.quality_report)
+
+        totals = self.quality_report.totals()
+        return totals.get('non_positive_Volume', 0), totals.get('volume_forward_filled', 0)
+
+    @staticmethod
+    def _is_sorted(df):
+        """Return True if the rows are ordered by CryptocurrencyName and then Date."""
+        names = df['CryptocurrencyName']
+        codes = names.cat.codes.to_numpy() if isinstance(names.dtype, pd.CategoricalDtype) else pd.factorize(names, sort=True)[0]
+        dates = df['Date'].to_numpy()
+        same_name = codes[1:] == codes[:-1]
+        return bool((codes[1:] >= codes[:-1]).all() and (dates[1:][same_name] >= dates[:-1][same_name]).all())
 
     def check_and_convert_formats(self):
-        """Check and convert numeric, date, and text formats."""
+        """Convert the numeric and date columns that are not of the right type yet."""
         for column in self.numeric_columns:
-            if column in self.df.columns:
-                if pd.api.types.is_numeric_dtype(self.df[column]):
-                    logger.info(f"Column '{column}' is already in numeric format.")
-                else:
-                    try:
-                        self.df[column] = pd.to_numeric(self.df[column], errors='coerce')
-                        logger.info(f"Column '{column}' successfully converted to numeric format.")
-                    except Exception as e:
-                        logger.error(f"Failed to convert column '{column}' to numeric format: {e}")
+            if column in self.df.columns and not pd.api.types.is_numeric_dtype(self.df[column]):
+                self.df[column] = pd.to_numeric(self.df[column], errors='coerce')
+                logger.info(f"Column '{column}' converted to numeric format.")
 
         for column in self.date_columns:
-            if column in self.df.columns:
-                if pd.api.types.is_datetime64_any_dtype(self.df[column]):
-                    logger.info(f"Column '{column}' is already in date format.")
-                else:
-                    try:
-                        self.df[column] = pd.to_datetime(self.df[column], errors='coerce')
-                        logger.info(f"Column '{column}' successfully converted to date format.")
-                    except Exception as e:
-                        logging.error(f"Failed to convert column '{column}' to date format: {e}")
+            if column in self.df.columns and not pd.api.types.is_datetime64_any_dtype(self.df[column]):
+                self.df[column] = pd.to_datetime(self.df[column], errors='coerce')
+                logger.info(f"Column '{column}' converted to date format.")
 
     def print_cleaned_data(self):
         """Print the cleaned DataFrame and the total row count."""
@@ -162,6 +236,8 @@ class DataCleaner:
         
     def save_cleaned_data(self):
         """Save the cleaned DataFrame to the database."""
+        if self.db_handler is None:
+            self.db_handler = DatabaseHandler()  # Shares the registry's engine
         try:
             self.db_handler.save_to_database(self.df, table_name='ohlcv_marketcap_data')  # Save to 'ohlcv_marketcap_data' table
             logger.info("Cleaned data successfully saved to the database.")
@@ -179,10 +255,16 @@ class PerformCleaning:
 
     Methods:
         clean_all(): Validates the input DataFrame and performs data cleaning using the DataCleaner class.
+
+    After cleaning, quality_report holds the DataCleaner's QualityReport, which is also logged as one JSON line.
     """
-    def __init__(self, df):
+    def __init__(self, df, db_handler=None, compact=False):
         self.df = df
+        self.db_handler = db_handler
+        self.compact = compact
+        self.quality_report = None
 
+    @instrumented(rows_in=lambda self: self.df)
     def clean_all(self):
         """Clean the dataframe using the DataCleaner class."""
         # Check if the input DataFrame is valid before proceeding
@@ -191,9 +273,11 @@ class PerformCleaning:
             return None  # Early return
 
         # Initialize the DataCleaner with the dataframe
-        cleaner = DataCleaner(self.df)
+        cleaner = DataCleaner(self.df, db_handler=self.db_handler, compact=self.compact)
         # Perform all cleaning operations
         cleaned_df = cleaner.clean_data()  # Now captures the cleaned DataFrame
+        self.quality_report = cleaner.quality_report
+        logger.info(f"Quality report: {json.dumps(self.quality_report.to_dict())}")
 
         # Check if the cleaned DataFrame is valid
         if cleaned_df is not None and not cleaned_df.empty:
@@ -208,14 +292,19 @@ class PerformCleaning:
     
 class DataFormatter:
     """
-    A class to format numerical and percentage columns in a DataFrame.
+    A view and export layer that formats numerical and percentage columns of a DataFrame.
     Formats percentage columns with a '%' sign and ensures numeric columns have four decimal places.
-    
+
+    The formatter never modifies the DataFrame it is given, every method returns a formatted copy, so the
+    numeric data can be stored as is and only the rows that are displayed or exported are turned into text.
+
     Methods:
-    format_percentages(df): Formats percentage columns to strings with four decimal places followed by a '%' sign.
-    format_numerics(df): Formats numeric columns to strings with four decimal places.
-    format_date(df): Formats the date column to a standard string format (YYYY-MM-DD).
-    format_data(df): Applies all formatting functions to the DataFrame.
+    format_percentages(df): Returns a copy with percentage columns as strings with four decimal places followed by a '%' sign.
+    format_numerics(df): Returns a copy with numeric columns as strings with four decimal places.
+    format_date(df): Returns a copy with the date column in a standard string format (YYYY-MM-DD).
+    format_data(df): Returns a copy with all formatting applied.
+    display(df, n=30, title=None): Prints the first n rows formatted, formatting only those rows.
+    export_csv(df, file_path): Writes the formatted DataFrame to a CSV file.
     """
     
     def __init__(self):
@@ -231,35 +320,73 @@ class DataFormatter:
             'Open', 'High', 'Low', 'Close', 'Volume', 'Market Cap', 
             'Typical_Price', 'VWAP'
         ]
-        
+        # The indicator columns are named after their windows, e.g. 'SMA_20', 'BB_Upper_20' or 'VWAP_30'
+        self.indicator_prefixes = ('SMA_', 'EMA_', 'RSI_', 'BB_', 'ATR_', 'VWAP_')
+
     def format_percentages(self, df):
-        try:
-            df[self.percentage_cols] = df[self.percentage_cols].applymap(lambda x: f"{x:.4f}%")
-            logger.info("Formatted percentage columns.")
-        except Exception as e:
-            logger.error(f"Error formatting percentage columns: {e}")
-        return df
+        """Return a copy with the percentage columns formatted."""
+        return self._format_percentages(df.copy())
 
     def format_numerics(self, df):
-        try:
-            df[self.numeric_cols] = df[self.numeric_cols].applymap(lambda x: f"{x:.4f}")
-            logger.info("Formatted numeric columns.")
-        except Exception as e:
-            logger.error(f"Error formatting numeric columns: {e}")
-        return df
+        """Return a copy with the numeric columns formatted."""
+        return self._format_numerics(df.copy())
 
     def format_date(self, df):
+        """Return a copy with the date column formatted."""
+        return self._format_date(df.copy())
+
+    @instrumented()
+    def format_data(self, df):
+        """Return a formatted copy of the DataFrame, the input is left unchanged."""
+        logger.info("Formatting DataFrame.")
+        formatted = df.copy()
+        formatted = self._format_percentages(formatted)
+        formatted = self._format_numerics(formatted)
+        formatted = self._format_date(formatted)
+        logger.info("DataFrame formatting completed.")
+        return formatted
+
+    def display(self, df, n=30, title=None):
+        """Print the first n rows of the DataFrame formatted, only these rows are formatted."""
+        if title:
+            print(title)
+        with pd.option_context('display.max_columns', None, 'display.expand_frame_repr', False):
+            print(self.format_data(df.head(n)))
+
+    def export_csv(self, df, file_path):
+        """Write the formatted DataFrame to a CSV file."""
+        self.format_data(df).to_csv(file_path, index=False)
+        logger.info(f"Exported formatted data to '{file_path}'.")
+
+    def _format_percentages(self, df):
+        self._format_columns(df, self.percentage_cols, '{:.4f}%')
+        logger.info("Formatted percentage columns.")
+        return df
+
+    def _format_numerics(self, df):
+        indicator_cols = [column for column in df.columns if column.startswith(self.indicator_prefixes)]
+        self._format_columns(df, self.numeric_cols + indicator_cols, '{:.4f}')
+        logger.info("Formatted numeric columns.")
+        return df
+
+    def _format_date(self, df):
         try:
-            df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+            df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
             logger.info("Formatted date column.")
         except Exception as e:
             logger.error(f"Error formatting date column: {e}")
         return df
 
-    def format_data(self, df):
-        logger.info("Formatting DataFrame.")
-        df = self.format_percentages(df)
-        df = self.format_numerics(df)
-        df = self.format_date(df)
-        logger.info("DataFrame formatting completed.")
-        return df
+    @staticmethod
+    def _format_columns(df, columns, template):
+        """Format each column with a str.format template, missing values become 'nan'.
+
+        Columns that are not numeric are left as they are.
+        """
+        for column in columns:
+            if column not in df.columns:
+                continue
+            if not pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+                logger.warning(f"Column '{column}' is not numeric and is left unformatted.")
+                continue
+            df[column] = df[column].astype('float64').map(template.format)
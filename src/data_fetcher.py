@@ -2,33 +2,30 @@ import os
 import time
 import pandas as pd
 import logging
+import io
 import re  
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from selenium import webdriver  # Ensure you import the webdriver
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.edge.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from src.database_handler import DatabaseHandler  # Ensure this import is correct
+from src.instrumentation import instrumented
 
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('data_fetcher_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'data_fetcher.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
-
-
 
 # Constants
 DOWNLOAD_FOLDER = 'C:\\Users\\46704\\Downloads'
-TIME_LIMIT = 10 * 60  # 10 minutes
+EDGE_DRIVER_PATH = 'C:\\Users\\46704\\Downloads\\edgedriver_win64\\msedgedriver.exe'
+BASE_URL = 'https://coincodex.com'
+DOWNLOAD_TIMEOUT = 60  # Seconds to wait for the CSV to be generated and downloaded
+PARTIAL_DOWNLOAD_SUFFIXES = ('.crdownload', '.part', '.partial', '.download', '.tmp')
+POOL_SIZE = 4  # Number of browsers exporting concurrently
+HTTP_TIMEOUT = 30  # Seconds
+TAIL_ROWS = 7  # Trailing rows of each export parsed before falling back to a full parse
+TAIL_BLOCK_SIZE = 64 * 1024  # Bytes read per step when seeking backwards through an export
 CRYPTOS = [
     'avalanche', 'binance-coin', 'bitcoin', 'bitcoin-cash', 'cardano', 
     'chainlink', 'dogecoin', 'ethereum', 'kaspa', 'lido-staked-ether', 
@@ -37,56 +34,260 @@ CRYPTOS = [
     'weth', 'wrapped-bitcoin', 'wrapped-steth'
 ]
 
-class NewDataLoader:
+class FetchBackend(ABC):
+    """
+    Interface of the backends that fetch new data for FetchedDataProcessor.
+
+    A backend downloads the historical data of its cryptocurrencies and returns yesterday's
+    rows, with the CSV export columns plus 'CryptocurrencyName'.
+
+    Methods:
+    process_crypto_data(): Returns the combined DataFrame (or None) and the names of the fetched cryptocurrencies.
+    stream_exports(on_export): Hands every export to on_export as soon as it is downloaded.
+    read_export(crypto, export): Parses a downloaded export into yesterday's rows.
+    filter_frame_by_date(df, source): Keeps the rows where the 'Start' column equals yesterday's date.
+    yesterday(): Returns yesterday's date as 'YYYY-MM-DD'.
+    """
+
+    @abstractmethod
+    def process_crypto_data(self):
+        """Fetch the data of all cryptocurrencies and return (combined_df or None, crypto_names)."""
+
+    @abstractmethod
+    def stream_exports(self, on_export):
+        """Download the exports, calling on_export(crypto, export) from the fetch threads as each one finishes.
+
+        Returns the names of the downloaded cryptocurrencies. The export is parsed later with read_export,
+        so the fetch threads can start the next download right away.
+        """
+
+    @abstractmethod
+    def read_export(self, crypto, export):
+        """Return yesterday's rows of a downloaded export with the 'CryptocurrencyName' column, or None."""
+
+    @staticmethod
+    def filter_frame_by_date(df, source=''):
+        """Filter rows where the 'Start' column equals yesterday's date."""
+        if 'Start' not in df.columns:
+            logger.warning(f"Missing 'Start' column in {source}")
+            return None
+
+        yesterday_date = FetchBackend.yesterday()
+        filtered_df = df[df['Start'] == yesterday_date].copy()
+
+        if not filtered_df.empty:
+            logger.info(f"Filtered data from {source} for date {yesterday_date}.")
+            return filtered_df
+        else:
+            logger.warning(f"No data for yesterday's date in {source}.")
+            return None
+
+    @staticmethod
+    def yesterday():
+        """Return yesterday's date as 'YYYY-MM-DD'."""
+        return (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def read_csv_tail(file_path, n_rows=TAIL_ROWS, block_size=TAIL_BLOCK_SIZE):
+    """
+    Parse the header and only the last n_rows rows of a CSV file.
+
+    The file is read backwards in blocks until enough line breaks are found, so the cost
+    depends on n_rows and not on how much history the file holds.
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        body_start = f.tell()
+        position = f.seek(0, os.SEEK_END)
+        tail = b''
+        while position > body_start and tail.count(b'\n') <= n_rows:
+            read_size = min(block_size, position - body_start)
+            position -= read_size
+            f.seek(position)
+            tail = f.read(read_size) + tail
+
+    lines = tail.splitlines()
+    if position > body_start:
+        lines = lines[1:]  # The first line may start in the middle of a row
+    lines = [line for line in lines if line.strip()][-n_rows:]
+    if not header.endswith(b'\n'):
+        header += b'\n'
+    return pd.read_csv(io.BytesIO(header + b'\n'.join(lines)))
+
+
+class DownloadWatcher:
+    """
+    Detects when a new download in a directory has finished.
+
+    The directory is snapshotted before the download is triggered and then polled with os.scandir
+    in a tight loop. A new file counts as finished once it has the expected suffix, no partial
+    download (.crdownload, .part, ...) is left in the directory and its size is unchanged since
+    the previous poll, so waiting takes as long as the download itself.
+
+    Methods:
+    start(): Snapshots the directory, call it before triggering the download.
+    wait(): Returns the path of the finished file, or None if the timeout expires.
+    """
+
+    def __init__(self, directory, suffix='.csv', timeout=DOWNLOAD_TIMEOUT, poll_interval=0.05):
+        self.directory = directory
+        self.suffix = suffix
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._existing = set()
+
+    def start(self):
+        """Snapshot the files that exist before the download."""
+        self._existing = {entry.name for entry in os.scandir(self.directory)}
+        return self
+
+    def wait(self):
+        """Wait until a new file is completely downloaded and return its path, or None on timeout."""
+        deadline = time.monotonic() + self.timeout
+        last_sizes = {}
+
+        while True:
+            partial, sizes = False, {}
+            for entry in os.scandir(self.directory):
+                if entry.name in self._existing:
+                    continue
+                if entry.name.endswith(PARTIAL_DOWNLOAD_SUFFIXES):
+                    partial = True
+                elif entry.name.endswith(self.suffix):
+                    try:
+                        sizes[entry.path] = entry.stat().st_size
+                    except FileNotFoundError:
+                        continue  # Renamed between listing and stat
+
+            # Finished when nothing is partial and the file did not grow since the previous poll
+            finished = [path for path, size in sizes.items() if not partial and last_sizes.get(path) == size]
+            if finished:
+                return max(finished, key=os.path.getmtime)
+            if time.monotonic() >= deadline:
+                logger.error(f"Timed out after {self.timeout} s waiting for a download in {self.directory}.")
+                return None
+
+            last_sizes = sizes
+            time.sleep(self.poll_interval)
+
+
+class DriverPool:
+    """
+    A bounded pool of headless WebDrivers that run exports concurrently.
+
+    Each worker thread lazily creates its own driver, which downloads into its own
+    sub-directory of the download folder, so files of concurrent exports never mix.
+
+    Methods:
+    map(func, items): Calls func(driver, download_dir, item) for every item on up to size drivers at once.
+    close(): Quits all drivers created by the pool.
+    """
+
+    def __init__(self, driver_factory, download_folder, size=POOL_SIZE):
+        self.driver_factory = driver_factory
+        self.download_folder = download_folder
+        self.size = max(1, size)
+        self._drivers = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def map(self, func, items):
+        """Run func(driver, download_dir, item) for every item and return the results in the order of items."""
+        with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='webdriver') as executor:
+            return list(executor.map(lambda item: func(*self._worker_driver(), item), items))
+
+    def close(self):
+        """Quit all drivers created by the pool."""
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                logger.error(f"Error closing WebDriver: {e}")
+        logger.info(f"Closed {len(drivers)} WebDrivers.")
+
+    def _worker_driver(self):
+        """Return the driver and download directory of the current worker thread, creating them on first use."""
+        if not hasattr(self._local, 'driver'):
+            with self._lock:
+                worker_id = len(self._drivers)
+                download_dir = os.path.abspath(os.path.join(self.download_folder, f'worker_{worker_id}'))
+                os.makedirs(download_dir, exist_ok=True)
+                driver = self.driver_factory(download_dir)
+                self._drivers.append(driver)
+            self._local.driver = driver
+            self._local.download_dir = download_dir
+        return self._local.driver, self._local.download_dir
+
+
+class NewDataLoader(FetchBackend):
     """
     Class responsible for downloading and processing cryptocurrency data.
 
     This class automates the downloading of historical cryptocurrency data from the CoinCodex website.
-    It manages the WebDriver, interacts with the website to export data, 
+    It manages a pool of WebDrivers, interacts with the website to export data, 
     and processes the downloaded CSV files to filter and clean the data.
     
     """
 
-    def __init__(self, download_folder=DOWNLOAD_FOLDER, time_limit=TIME_LIMIT, cryptos=CRYPTOS):
+    def __init__(self, download_folder=DOWNLOAD_FOLDER, cryptos=CRYPTOS,
+                 pool_size=POOL_SIZE, base_url=BASE_URL, download_timeout=DOWNLOAD_TIMEOUT, driver_factory=None):
         """Initialize the NewDataLoader with specified parameters."""
         self.download_folder = download_folder
-        self.time_limit = time_limit
         self.cryptos = cryptos
-        self.driver = self.create_driver()
+        self.pool_size = pool_size
+        self.base_url = base_url.rstrip('/')
+        self.download_timeout = download_timeout
+        self.driver_factory = driver_factory if driver_factory else self.create_driver
         self.downloaded_files = {}  # Dictionary to store crypto names and file paths
         self.crypto_names = []  # List to store cryptocurrency names
 
-    def create_driver(self):
-        """Create and configure the WebDriver."""
+    def create_driver(self, download_dir=None):
+        """Create and configure a headless WebDriver that downloads into download_dir."""
+        # Selenium is only imported when a browser is started, importing the module stays light
+        from selenium import webdriver
+        from selenium.webdriver.edge.service import Service
+        from selenium.webdriver.edge.options import Options
+
         edge_options = Options()
         edge_options.add_argument("--headless")  # Run in headless mode
-        service = Service('C:\\Users\\46704\\Downloads\\edgedriver_win64\\msedgedriver.exe')
+        if download_dir:
+            edge_options.add_experimental_option("prefs", {
+                "download.default_directory": download_dir,
+                "download.prompt_for_download": False,
+            })
+        service = Service(EDGE_DRIVER_PATH)
         driver = webdriver.Edge(service=service, options=edge_options)
-        logger.info("WebDriver created successfully.")
+        logger.info(f"WebDriver created successfully, downloading into {download_dir}.")
         return driver
 
-    def click_export_button(self, crypto):
-        """Click the 'Export' button for the given cryptocurrency and track the file."""
-        url = f'https://coincodex.com/crypto/{crypto}/historical-data/'
-        self.driver.get(url)
+    def click_export_button(self, crypto, driver, download_dir):
+        """Click the 'Export' button for the given cryptocurrency and track the downloaded file."""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        url = f'{self.base_url}/crypto/{crypto}/historical-data/'
+        watcher = DownloadWatcher(download_dir, timeout=self.download_timeout).start()
+        driver.get(url)
         
         try:
-            wait = WebDriverWait(self.driver, 10)
+            wait = WebDriverWait(driver, 10)
             export_button = wait.until(
                 EC.visibility_of_element_located((By.CSS_SELECTOR, "div.export.link.button.button-secondary"))
             )
-            self.driver.execute_script("arguments[0].scrollIntoView(true);", export_button)
+            driver.execute_script("arguments[0].scrollIntoView(true);", export_button)
             wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "div.export.link.button.button-secondary")))
-            self.driver.execute_script("arguments[0].click();", export_button)
-            time.sleep(5)  # Allow time for the CSV to be generated and downloaded
+            driver.execute_script("arguments[0].click();", export_button)
             logger.info(f"Export button clicked for {crypto}.")
 
-            # After downloading, get the most recent CSV file in the download folder
-            recent_file = max(self.get_recent_csv_files(), key=os.path.getctime)  # Get the latest file
-            self.downloaded_files[crypto] = recent_file  # Store the file path associated with the crypto
-
-            # Store the cryptocurrency name for later use
-            self.crypto_names.append(crypto.capitalize())  # Add name to the list
+            # The worker's directory only receives this worker's downloads, so the new CSV belongs to this crypto
+            downloaded_file = watcher.wait()
+            if downloaded_file is None:
+                logger.error(f"No downloaded CSV file found for {crypto}.")
+                return None
+            self.downloaded_files[crypto] = downloaded_file  # Store the file path associated with the crypto
 
             return crypto.capitalize()  # Return the name for logging purposes
 
@@ -94,35 +295,28 @@ class NewDataLoader:
             logger.error(f"Error finding or clicking the export button for {crypto}: {e}")
             return None
 
-    def get_recent_csv_files(self):
-        """Get CSV files modified in the last TIME_LIMIT."""
-        now = time.time()
-        recent_files = [
-            os.path.join(self.download_folder, f)
-            for f in os.listdir(self.download_folder)
-            if f.endswith('.csv') and (now - os.path.getmtime(os.path.join(self.download_folder, f)) <= self.time_limit)
-        ]
-        logger.info(f"Found {len(recent_files)} recent CSV files.")
-        return recent_files
-    
     @staticmethod
-    def filter_rows_by_date(file_path):
-        """Filter rows where the 'Start' column equals yesterday's date."""
+    def filter_rows_by_date(file_path, tail_rows=TAIL_ROWS):
+        """
+        Filter rows where the 'Start' column equals yesterday's date.
+
+        Only the last tail_rows rows are parsed, then the first tail_rows for newest-first
+        exports, and the whole file only if yesterday is in neither.
+        """
         try:
-            df = pd.read_csv(file_path)
-            if 'Start' not in df.columns:
-                logger.warning(f"Missing 'Start' column in {file_path}")
-                return None
-            
-            yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            filtered_df = df[df['Start'] == yesterday_date].copy()
-            
-            if not filtered_df.empty:
-                logger.info(f"Filtered data from {file_path} for date {yesterday_date}.")
-                return filtered_df
+            yesterday_date = FetchBackend.yesterday()
+            readers = (
+                lambda: read_csv_tail(file_path, tail_rows),
+                lambda: pd.read_csv(file_path, nrows=tail_rows),
+            )
+            for read in readers:
+                df = read()
+                if 'Start' in df.columns and (df['Start'] == yesterday_date).any():
+                    break
             else:
-                logger.warning(f"No data for yesterday's date in {file_path}.")
-                return None
+                logger.info(f"Yesterday's date not found at either end of {file_path}, parsing the full file.")
+                df = pd.read_csv(file_path)
+            return FetchBackend.filter_frame_by_date(df, file_path)
         except Exception as e:
             logger.error(f"Error processing CSV file {file_path}: {e}")
             return None
@@ -171,22 +365,51 @@ class NewDataLoader:
         logger.info(f"Total rows combined: {len(combined_df)}")
         return combined_df
 
+    def stream_exports(self, on_export):
+        """Export every crypto on the driver pool and call on_export(crypto, file_path) as each download finishes."""
+        def export(driver, download_dir, crypto):
+            name = self.click_export_button(crypto, driver, download_dir)
+            if name:
+                on_export(crypto, self.downloaded_files[crypto])
+            return name
+
+        pool = DriverPool(self.driver_factory, self.download_folder, self.pool_size)
+        try:
+            names = pool.map(export, self.cryptos)
+        finally:
+            pool.close()
+            logger.info("WebDriver pool closed.")
+        self.crypto_names = [name for name in names if name]
+        return self.crypto_names
+
+    def read_export(self, crypto, file_path):
+        """Filter a downloaded export to yesterday's rows like combine_filtered_data, then delete the file."""
+        try:
+            filtered_df = self.filter_rows_by_date(file_path)
+            if filtered_df is not None:
+                filtered_df['CryptocurrencyName'] = self.extract_crypto_name_from_filename(os.path.basename(file_path))
+            return filtered_df
+        finally:
+            self.delete_csv_files([file_path])
+
+    @instrumented()
     def process_crypto_data(self):
         """Main process to download and combine cryptocurrency data."""
+        pool = DriverPool(self.driver_factory, self.download_folder, self.pool_size)
         try:
-            # Step 1: Click export buttons for all cryptos
-            for crypto in self.cryptos:
-                self.click_export_button(crypto)
+            # Step 1: Click export buttons for all cryptos, pool_size at a time
+            names = pool.map(lambda driver, download_dir, crypto: self.click_export_button(crypto, driver, download_dir), self.cryptos)
+            self.crypto_names = [name for name in names if name]  # Keep the order of self.cryptos
 
-            # Step 2: Collect recent CSV files
-            recent_csv_files = self.get_recent_csv_files()
+            # Step 2: Collect the files downloaded for each crypto
+            downloaded_csv_files = [self.downloaded_files[crypto] for crypto in self.cryptos if crypto in self.downloaded_files]
 
             # Step 3: Combine filtered rows into a single DataFrame
-            combined_df = self.combine_filtered_data(recent_csv_files)
+            combined_df = self.combine_filtered_data(downloaded_csv_files)
 
             # Optionally delete the CSV files after processing
-            if recent_csv_files:
-                self.delete_csv_files(recent_csv_files)  # Delete after processing if desired
+            if downloaded_csv_files:
+                self.delete_csv_files(downloaded_csv_files)  # Delete after processing if desired
 
             if not combined_df.empty:
                 logger.info("Combined DataFrame successfully created.")
@@ -196,44 +419,166 @@ class NewDataLoader:
                 return None, self.crypto_names
 
         finally:
-            # Ensure that the driver is closed regardless of success or failure
-            self.driver.quit()
-            logger.info("WebDriver closed.")
+            # Ensure that the drivers are closed regardless of success or failure
+            pool.close()
+            logger.info("WebDriver pool closed.")
+
+class HttpDataLoader(FetchBackend):
+    """
+    Fetch backend that downloads the CSV exports directly over HTTP instead of through a browser.
+
+    All requests share one keep-alive session whose connection pool holds max_workers connections,
+    and the exports are fetched by max_workers threads. Only yesterday's date range is requested,
+    and the result has the same columns and row order as NewDataLoader.process_crypto_data.
+
+    export_url is a URL template in which {crypto}, {start} and {end} are filled in per request.
+    There is no default: the CSV export endpoint of CoinCodex has not been verified, so the
+    nightly run uses the Selenium backend and this one is only used when main.py is given --export-url.
+
+    Methods:
+    create_session(): Creates the pooled requests session with retries.
+    download_export(crypto): Downloads the CSV text of a single cryptocurrency's export.
+    read_export(crypto, text): Parses and filters the CSV text of an export.
+    fetch_export(crypto): Downloads and filters the export of a single cryptocurrency.
+    stream_exports(on_export): Hands every export to on_export as soon as it is downloaded.
+    process_crypto_data(): Fetches all cryptocurrencies concurrently and combines the rows.
+    """
+
+    def __init__(self, export_url, cryptos=CRYPTOS, max_workers=POOL_SIZE, timeout=HTTP_TIMEOUT, session=None):
+        self.cryptos = cryptos
+        self.export_url = export_url
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.session = session if session is not None else self.create_session()
+        self.crypto_names = []  # List to store cryptocurrency names
+
+    def create_session(self):
+        """Create a keep-alive session with a connection pool sized for the workers and retries on transient errors."""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        session = requests.Session()
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'User-Agent': 'Mozilla/5.0', 'Accept': 'text/csv'})
+        return session
+
+    def export_url_for(self, crypto):
+        """Return the URL of the export holding yesterday's data of a cryptocurrency."""
+        start = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        end = datetime.now().strftime('%Y-%m-%d')
+        return self.export_url.format(crypto=crypto, start=start, end=end)
+
+    def download_export(self, crypto):
+        """Download the export of a cryptocurrency and return its CSV text, or None."""
+        url = self.export_url_for(crypto)
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.text
+        except Exception as e:
+            logger.error(f"Error fetching export for {crypto} from {url}: {e}")
+            return None
+
+    def read_export(self, crypto, text):
+        """Parse the CSV text of an export and return yesterday's rows, or None."""
+        url = self.export_url_for(crypto)
+        try:
+            filtered_df = self.filter_frame_by_date(pd.read_csv(io.StringIO(text)), url)
+            if filtered_df is not None:
+                filtered_df['CryptocurrencyName'] = crypto.lower()
+            return filtered_df
+        except Exception as e:
+            logger.error(f"Error parsing export for {crypto} from {url}: {e}")
+            return None
+
+    def fetch_export(self, crypto):
+        """Download the export of a cryptocurrency and return yesterday's rows, or None."""
+        text = self.download_export(crypto)
+        return self.read_export(crypto, text) if text is not None else None
+
+    def stream_exports(self, on_export):
+        """Download the exports concurrently and call on_export(crypto, text) as each download finishes."""
+        def download(crypto):
+            text = self.download_export(crypto)
+            if text is not None:
+                on_export(crypto, text)
+            return text is not None
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='http-fetch') as executor:
+                downloaded = list(executor.map(download, self.cryptos))
+        finally:
+            self.session.close()
+
+        self.crypto_names = [crypto.capitalize() for crypto, ok in zip(self.cryptos, downloaded) if ok]
+        return self.crypto_names
+
+    @instrumented()
+    def process_crypto_data(self):
+        """Fetch the exports of all cryptocurrencies concurrently and combine them into a single DataFrame."""
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='http-fetch') as executor:
+                frames = list(executor.map(self.fetch_export, self.cryptos))
+        finally:
+            self.session.close()
+
+        self.crypto_names = [crypto.capitalize() for crypto, frame in zip(self.cryptos, frames) if frame is not None]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            logger.warning("No data to combine.")
+            return None, self.crypto_names
+
+        combined_df = pd.concat(frames, ignore_index=True)
+        logger.info(f"Total rows combined: {len(combined_df)}")
+        return combined_df, self.crypto_names
+
+
+def create_fetch_backend(backend='selenium', **kwargs):
+    """Create a fetch backend by name, 'selenium' for NewDataLoader or 'http' for HttpDataLoader.
+
+    The 'http' backend needs an export_url keyword argument, since there is no verified default endpoint.
+    """
+    backends = {'selenium': NewDataLoader, 'http': HttpDataLoader}
+    if backend not in backends:
+        raise ValueError(f"Unknown fetch backend '{backend}'. Use one of: {', '.join(backends)}.")
+    if backend == 'http' and 'export_url' not in kwargs:
+        raise ValueError("The 'http' backend needs the export_url of a verified CSV export endpoint.")
+    return backends[backend](**kwargs)
 
-# Create an instance of DatabaseHandler
-db_handler = DatabaseHandler()  # Make sure this class is properly defined
 
 class FetchedDataProcessor:
-    """A class to handle the entire process of fetching, filtering, and saving crypto data.
+    """A class to handle the process of fetching and transforming crypto data.
     
-    This class orchestrates the workflow of downloading cryptocurrency data, 
-    transforming it, and saving the processed data into a database. It utilizes 
-    the NewDataLoader class to retrieve the data and a database handler to save it.
+    This class orchestrates the workflow of downloading cryptocurrency data and
+    transforming it. It utilizes a FetchBackend (NewDataLoader or HttpDataLoader)
+    to retrieve the data. Nothing is saved here, the transformed rows are returned
+    to the pipeline, which writes them once at the end of the run.
 
     """
 
     def __init__(self, loader):
         self.loader = loader
-        self.db_handler = db_handler  # Add the db_handler here
 
     def execute(self):
-        """Execute the entire data loading and processing workflow."""
+        """Execute the data loading workflow and return the transformed DataFrame."""
         combined_df, crypto_names = self.loader.process_crypto_data()  # Get the combined DataFrame
 
         if combined_df is not None:
-            # Step 1: Transform the DataFrame
+            # Transform the DataFrame
             transformed_df = self.transform_csv(combined_df)
         
             if transformed_df is not None:
-                # Step 2: Save transformed DataFrame to the database
-                self.db_handler.save_to_database(transformed_df, 'ohlcv_marketcap_data')  # Save to a specified table
-                logger.info("Transformed DataFrame saved to database successfully.")
+                logger.info("Fetched data transformed successfully.")
                 return transformed_df
             else:
-                logger.error("Data transformation failed. No data to save.")
+                logger.error("Data transformation failed.")
                 return None
         else:
-            logger.error("No combined data to save.")
+            logger.error("No combined data fetched.")
             return None
 
     @staticmethod
@@ -253,6 +598,6 @@ if __name__ == "__main__":
     transformed_data = fetched_data_processor.execute()  # This should now be recognized properly
     
     if transformed_data is not None:
-        logger.info("Data processed and saved successfully.")
+        logger.info("Data fetched and transformed successfully.")
     else:
         logger.error("Data processing failed.")
\ No newline at end of file
@@ -1,32 +1,53 @@
 import os
 import glob
+import json
 import pandas as pd
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from src.database_handler import DatabaseHandler, OHLCV_TABLE, bump_table_version, insert_rows, quote
+from src.data_analyzer import IndicatorState, ThresholdSketches, calculate_with_history
+from src.compact import to_compact, frame_memory, memory_report
+from src.data_cleaner import QualityReport, drop_duplicate_keys, clean_rows
+from src.indicators import IndicatorEngine, RollingIndicatorState
 
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('data_loader_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'data_loader.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+# Explicit schema of the CoinCodex CSV exports, so no types are inferred ('End' is not loaded)
+CSV_DTYPES = {
+    'Start': 'object',
+    'Open': 'float64',
+    'High': 'float64',
+    'Low': 'float64',
+    'Close': 'float64',
+    'Volume': 'float64',
+    'Market Cap': 'float64',
+}
+CHUNK_SIZE = 50_000  # Rows per chunk streamed into the database by the bulk loader
+
+
+def crypto_name_from_path(file_path):
+    """Return the cryptocurrency name of an export, the part of the file name before the first '_'."""
+    return os.path.splitext(os.path.basename(file_path))[0].split('_')[0]
 
 
 class DataLoader:
     """A class to load CSV files from a specified directory."""
 
-    def __init__(self, directory):
+    def __init__(self, directory, compact=False):
         """
         Initialize the DataLoader with the specified directory.
 
         Args:
             directory (str): The path to the directory containing CSV files.
+            compact (bool): Read only the export columns with their explicit types instead of inferring them.
         """
         self.directory = directory
+        self.compact = compact
 
     def load_csv_files(self):
         """
@@ -61,8 +82,11 @@ class DataLoader:
             DataFrame: A DataFrame with an added column for the cryptocurrency name.
         """
         try:
-            cryptocurrency_name = os.path.splitext(os.path.basename(file_path))[0].split('_')[0]
-            df = pd.read_csv(file_path)
+            cryptocurrency_name = crypto_name_from_path(file_path)
+            if self.compact:
+                df = pd.read_csv(file_path, usecols=lambda column: column in CSV_DTYPES, dtype=CSV_DTYPES)
+            else:
+                df = pd.read_csv(file_path)
             df['CryptocurrencyName'] = cryptocurrency_name
             logger.info(f"Loaded CSV file: {file_path} with cryptocurrency name: {cryptocurrency_name}")
             return df
@@ -75,12 +99,13 @@ class DataAggregator:
     """A class to aggregate multiple DataFrames into a single DataFrame."""
 
     @staticmethod
-    def aggregate_data(dataframes):
+    def aggregate_data(dataframes, compact=False):
         """
         Aggregate a list of DataFrames into a single DataFrame.
 
         Args:
             dataframes (list): A list of DataFrames to aggregate.
+            compact (bool): Return the DataFrame in the compact representation (see src.compact).
 
         Returns:
             DataFrame: A single aggregated DataFrame.
@@ -93,7 +118,182 @@ class DataAggregator:
         aggregated_df.drop(columns=['End'], inplace=True, errors='ignore')  # Ignore if 'End' column does not exist
         aggregated_df.rename(columns={'Start': 'Date'}, inplace=True)
 
+        if compact:
+            before_bytes = frame_memory(aggregated_df)
+            aggregated_df = to_compact(aggregated_df)
+            memory_report.record('DataAggregator.aggregate_data', before_bytes, aggregated_df)
+
         logger.info(f"Successfully aggregated data into a single DataFrame with {len(aggregated_df)} records.")
         return aggregated_df
 
 
+class UnsortedExportError(Exception):
+    """Raised when a CSV export is not in ascending date order and cannot be streamed."""
+
+
+class BulkLoader:
+    """
+    A class to bulk load the CSV directory into the database in parallel.
+
+    Every file holds one cryptocurrency and is handled by its own worker process, which reads it
+    in chunks with the explicit CSV_DTYPES schema, cleans each chunk with the rules of DataCleaner,
+    calculates it while carrying the VWAP totals and last row over from the previous chunk, and
+    writes it straight to SQLite. Two files of the same cryptocurrency are rejected before loading,
+    because their chunks would be written in no particular order. What the cleaning rules changed
+    is collected in quality_report.
+    Peak memory is bounded by the chunk size times the number of workers instead of the whole
+    dataset. The indicator states and threshold sketches are saved at the end, so the daily run
+    can continue from the loaded history. The rows of a file that fails part way were already
+    committed chunk by chunk, so its cryptocurrency is deleted from the table again and the table
+    only holds cryptocurrencies that have a state.
+
+    Methods:
+    load(mode='replace'): Loads all CSV files and returns the number of rows written.
+    """
+
+    def __init__(self, directory, database_path, max_workers=None, chunk_size=CHUNK_SIZE, table_name=OHLCV_TABLE):
+        self.directory = directory
+        self.database_path = os.path.abspath(database_path)
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.table_name = table_name
+        self.quality_report = QualityReport()
+
+    def load(self, mode='replace'):
+        """Load all CSV files in parallel and return the number of rows written to the database."""
+        csv_files = sorted(glob.glob(os.path.join(self.directory, '*.csv')))
+        if not csv_files:
+            logger.error("No CSV files found in the directory.")
+            return 0
+
+        files_per_crypto = {}
+        for file_path in csv_files:
+            files_per_crypto.setdefault(crypto_name_from_path(file_path), []).append(os.path.basename(file_path))
+        conflicts = {name: files for name, files in files_per_crypto.items() if len(files) > 1}
+        if conflicts:
+            logger.error(f"Several CSV files per cryptocurrency, nothing was loaded: {conflicts}")
+            return 0
+
+        db_handler = DatabaseHandler(self.database_path)
+        with db_handler.engine.begin() as connection:
+            # The workers insert the indicator columns, which the typed schema does not have
+            db_handler.ensure_ohlcv_schema(connection, extra_columns=IndicatorEngine().columns())
+            if mode == 'replace':
+                connection.exec_driver_sql(f'DELETE FROM {quote(self.table_name)}')
+
+        total_rows, states, sketches, indicator_states, failed = 0, [], ThresholdSketches(), [], []
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(
+                load_csv_file, csv_files, repeat(self.database_path), repeat(self.table_name), repeat(self.chunk_size)
+            )
+            for file_path, result in zip(csv_files, results):
+                if result is None:
+                    failed.append(crypto_name_from_path(file_path))
+                    continue
+                rows, state, file_sketches, file_indicators, file_report = result
+                total_rows += rows
+                self.quality_report.merge(file_report)
+                states.append(state.state_df)
+                sketches.sketches.update(file_sketches.sketches)
+                indicator_states.append(file_indicators.state_df)
+
+        if failed:
+            self._delete_cryptos(db_handler, failed)
+        if states:
+            unit_of_work = db_handler.unit_of_work()
+            IndicatorState(pd.concat(states, ignore_index=True)).save(unit_of_work)
+            sketches.save(unit_of_work)
+            RollingIndicatorState(IndicatorEngine(), pd.concat(indicator_states).reset_index()).save(unit_of_work)
+            unit_of_work.commit()
+        db_handler.close()
+        logger.info(f"Quality report: {json.dumps(self.quality_report.to_dict())}")
+        logger.info(f"Bulk loaded {total_rows} rows from {len(csv_files)} CSV files into table '{self.table_name}'.")
+        return total_rows
+
+    def _delete_cryptos(self, db_handler, cryptos):
+        """Delete the rows that the failed files of the cryptocurrencies committed before they failed."""
+        placeholders = ', '.join('?' for _ in cryptos)
+        with db_handler.engine.begin() as connection:
+            connection.exec_driver_sql(
+                f'DELETE FROM {quote(self.table_name)} WHERE "CryptocurrencyName" IN ({placeholders})', tuple(cryptos)
+            )
+            bump_table_version(connection, self.table_name)
+        logger.error(f"Loading failed for {cryptos}, their rows were deleted from table '{self.table_name}'.")
+
+
+def load_csv_file(file_path, database_path, table_name=OHLCV_TABLE, chunk_size=CHUNK_SIZE):
+    """
+    Stream one CSV export into the database in chunks, run in a worker process of BulkLoader.
+
+    Returns:
+        tuple: The number of rows written and the IndicatorState, ThresholdSketches, RollingIndicatorState
+            and QualityReport of the file, or None on error.
+    """
+    try:
+        try:
+            chunks = pd.read_csv(file_path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunk_size)
+            try:
+                return _stream_chunks(file_path, chunks, database_path, table_name)
+            finally:
+                chunks.close()
+        except UnsortedExportError:
+            # Sort in memory and stream the sorted rows, rows already written are replaced by key
+            logger.warning(f"{file_path} is not in ascending date order, sorting it in memory.")
+            df = pd.read_csv(file_path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES)
+            df = df.sort_values(by='Start', kind='stable')  # Stable, so the last row of a repeated date still wins
+            chunks = (df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size))
+            return _stream_chunks(file_path, chunks, database_path, table_name)
+    except Exception as e:
+        logger.error(f"Error bulk loading CSV file {file_path}: {e}")
+        return None
+
+
+def _stream_chunks(file_path, chunks, database_path, table_name):
+    """Clean, calculate and write the chunks of one file in order.
+
+    The rows of a chunk's last date are held back and written with the next chunk, so a date
+    repeated across a chunk boundary is deduplicated like within a chunk.
+    """
+    cryptocurrency_name = crypto_name_from_path(file_path)
+    state, sketches = IndicatorState(), ThresholdSketches()
+    engine = IndicatorEngine()
+    indicator_state = RollingIndicatorState(engine)
+    report = QualityReport()
+    held_back, last_date, total_rows = None, None, 0
+
+    def write(rows):
+        nonlocal last_date, total_rows
+        rows = drop_duplicate_keys(rows, report)
+        # The Volume forward fill continues from the last row of the previous chunk
+        previous_volumes = None if state.is_empty() else {cryptocurrency_name: state.state_df['Volume'].iloc[0]}
+        rows = clean_rows(rows, report=report, previous_volumes=previous_volumes)
+        report.rows_out += len(rows)
+        last_date = rows['Date'].iloc[-1]
+
+        rows = calculate_with_history(rows, state.get_tail(), state.get_totals())
+        rows = engine.calculate(rows, indicator_state)
+        total_rows += insert_rows(database_path, table_name, DatabaseHandler.to_storage_format(rows))
+        sketches.update(rows)
+        state.update(rows)
+
+    for chunk in chunks:
+        report.rows_in += len(chunk)
+        chunk = chunk.rename(columns={'Start': 'Date'})
+        chunk['Date'] = pd.to_datetime(chunk['Date'])
+        chunk['CryptocurrencyName'] = cryptocurrency_name
+        if held_back is not None:
+            chunk = pd.concat([held_back, chunk])
+        dates = chunk['Date']
+        if not dates.is_monotonic_increasing or (last_date is not None and dates.iloc[0] <= last_date):
+            raise UnsortedExportError(file_path)
+
+        last_day = (dates == dates.iloc[-1]).to_numpy()
+        held_back = chunk[last_day]
+        if not last_day.all():
+            write(chunk[~last_day])
+
+    if held_back is not None:
+        write(held_back)
+
+    logger.info(f"Bulk loaded {total_rows} rows from {file_path}.")
+    return total_rows, state, sketches, indicator_state, report
@@ -2,38 +2,35 @@ import os
 import pandas as pd
 import logging
 from src.data_loader import DataLoader, DataAggregator
-from src.data_fetcher import NewDataLoader, FetchedDataProcessor
+from src.data_fetcher import FetchedDataProcessor, create_fetch_backend
 from src.database_handler import DatabaseHandler
+from src.columnar_cache import ColumnarCache
 from src.data_cleaner import PerformCleaning
-from src.data_analyzer import PerformCalculations
+from src.data_analyzer import PerformCalculations, IndicatorState
 
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('data_source_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'data_source.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
 
 
 class MasterData:
     """Class to manage the loading, cleaning, and processing of master data."""
     
-    def __init__(self, directory, database_url='C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db'):
+    def __init__(self, directory, database_url='C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db', compact=False):
         self.directory = directory
+        self.compact = compact  # Load, clean and calculate in the compact representation
         self.master_df = None
         self.db_name = database_url
-        self.db_handler = DatabaseHandler(f'sqlite:///{database_url}')  
+        self.db_handler = DatabaseHandler(database_url)
+        self.processor = None
 
     def load_and_process(self):
         """Load, clean, and process the master data."""
         logger.info("Loading master data...")
-        loader = DataLoader(self.directory)
+        loader = DataLoader(self.directory, compact=self.compact)
         master_dataframes = loader.load_csv_files()
 
         if not master_dataframes:
@@ -41,10 +38,10 @@ class MasterData:
             return None
 
         # Aggregate master data
-        self.master_df = DataAggregator.aggregate_data(master_dataframes)
+        self.master_df = DataAggregator.aggregate_data(master_dataframes, compact=self.compact)
 
         # Perform cleaning using the PerformCleaning class
-        cleaner = PerformCleaning(self.master_df)
+        cleaner = PerformCleaning(self.master_df, db_handler=self.db_handler, compact=self.compact)
         self.master_df = cleaner.clean_all()
 
         # Ensure the master_df is not empty after cleaning
@@ -52,8 +49,9 @@ class MasterData:
             logger.error("Master DataFrame is empty after cleaning. Exiting the processing.")
             return None
 
-        processor = PerformCalculations(self.master_df)
-        self.master_df = processor.calculate_masterdata()        
+        # Keep the processor, its threshold sketches and indicator state are saved together with the master data
+        self.processor = PerformCalculations(self.master_df, db_handler=self.db_handler, compact=self.compact)
+        self.master_df = self.processor.calculate_masterdata()
 
         logger.info("Master data loaded and processed successfully.")
         return self.master_df
@@ -62,7 +60,7 @@ class MasterData:
 class MasterDataLoader:
     """Class to handle the loading and processing of master data into the database."""
     
-    def __init__(self, directory, db_file_path):
+    def __init__(self, directory, db_file_path, compact=False):
         self.directory = directory
         self.db_file_path = db_file_path
 
@@ -70,10 +68,11 @@ class MasterDataLoader:
         logger.info("Initializing MasterDataLoader...")
 
         # Initialize database handler
-        self.db_handler = DatabaseHandler()
+        self.db_handler = DatabaseHandler(db_file_path)
+        self.saved_rows = 0  # Rows written to ohlcv_marketcap_data by process_master_data
 
-        # Create instance of MasterData
-        self.master_data_processor = MasterData(directory)
+        # Create instance of MasterData, sharing the database
+        self.master_data_processor = MasterData(directory, db_file_path, compact=compact)
 
         # Load and process master data
         self.master_data = self.master_data_processor.load_and_process()
@@ -88,17 +87,23 @@ class MasterDataLoader:
             print("Master Data Sample:")
             print(master_df.head())
 
-            # Save processed data to the database
+            # Save the processed data, its indicator states and threshold sketches in one transaction
             try:
-                self.db_handler.save_to_database(master_df, table_name='ohlcv_marketcap_data', mode='replace')
-                logger.info(f"Processed data saved to database at '{self.db_file_path}' in table 'ohlcv_marketcap_data'.")
+                unit = self.db_handler.unit_of_work()
+                unit.save_to_database(master_df, table_name='ohlcv_marketcap_data', mode='replace')
+                IndicatorState.from_history(master_df).save(unit)
+                self.master_data_processor.processor.save_threshold_sketches(unit)
+                self.master_data_processor.processor.save_indicator_state(unit)
+                if unit.commit():
+                    self.saved_rows = len(master_df)
+                    logger.info(f"Processed data saved to database at '{self.db_file_path}' in table 'ohlcv_marketcap_data'.")
             except Exception as e:
                 logger.error(f"Error saving to database: {e}")
 
     def load_master_data(self):
-        """Load master data from the database."""
+        """Load master data from the database through the columnar cache."""
         try:
-            master_data = self.db_handler.load_data_from_database(table_name='ohlcv_marketcap_data')
+            master_data = ColumnarCache(self.db_handler).load()
             if master_data is not None:
                 logger.info("Master data loaded from the database successfully.")
                 return master_data
@@ -110,16 +115,21 @@ class MasterDataLoader:
 class Fetcher:
     """Class to fetch new data and prepare it for processing."""
     
-    def __init__(self):
+    def __init__(self, export_url=None, db_handler=None):
         self.new_data_df = None
-        logger.info("Fetcher initialized.")
+        self.export_url = export_url  # Fetch over HTTP from this URL template instead of through Selenium
+        self.db_handler = db_handler if db_handler is not None else DatabaseHandler()
+        logger.info(f"Fetcher initialized with the {'HTTP' if export_url else 'Selenium'} backend.")
 
     def fetch_and_process_new_data(self):
         """Fetch new data, clean it, and prepare it for aggregation."""
         logger.info("Fetching new data...")
 
-        # Create a NewDataLoader instance to fetch new data
-        loader = NewDataLoader()
+        # Create the fetch backend to fetch new data
+        if self.export_url:
+            loader = create_fetch_backend('http', export_url=self.export_url)
+        else:
+            loader = create_fetch_backend('selenium')
         fetcher = FetchedDataProcessor(loader)
 
         # Execute the data fetching and processing workflow
@@ -133,7 +143,7 @@ class Fetcher:
         print(self.new_data_df)
 
         # Perform cleaning using PerformCleaning class
-        cleaner = PerformCleaning(self.new_data_df)
+        cleaner = PerformCleaning(self.new_data_df, db_handler=self.db_handler)
         self.new_data_df = cleaner.clean_all()
 
         # Ensure the new_data_df is not empty after cleaning
@@ -1,40 +1,486 @@
 import pandas as pd
-from sqlalchemy import create_engine, exc
+from sqlalchemy import create_engine, event, exc, inspect, text
 import logging
 import os
 import sqlite3
+import threading
+import uuid
+from src.instrumentation import instrumented
 
 # Set up logger for the data_loader module
 logger = logging.getLogger('database_handler_logger')
 logger.setLevel(logging.INFO)
 
-log_directory = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
-log_file_path = os.path.join(log_directory, 'database_handler.log')
-file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+DEFAULT_DATABASE_PATH = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db'
+
+# Explicit schema of the OHLCV table, Date is stored as ISO 8601 text ('YYYY-MM-DD') so it sorts correctly
+OHLCV_TABLE = 'ohlcv_marketcap_data'
+OHLCV_KEY_COLUMNS = ['CryptocurrencyName', 'Date']
+OHLCV_COLUMN_TYPES = {
+    'CryptocurrencyName': 'TEXT NOT NULL',
+    'Date': 'TEXT NOT NULL',
+    'Open': 'REAL',
+    'High': 'REAL',
+    'Low': 'REAL',
+    'Close': 'REAL',
+    'Volume': 'REAL',
+    'Market Cap': 'REAL',
+    'Typical_Price': 'REAL',
+    'VWAP': 'REAL',
+    'Open_Daily_Pct_Change': 'REAL',
+    'High_Daily_Pct_Change': 'REAL',
+    'Low_Daily_Pct_Change': 'REAL',
+    'Close_Daily_Pct_Change': 'REAL',
+    'Volume_Pct_Change': 'REAL',
+}
+# The primary key serves the per-crypto latest-N reads, this index covers date-range and latest-N reads over all cryptos
+OHLCV_INDEXES = {
+    'idx_ohlcv_marketcap_data_date': ['Date', 'CryptocurrencyName', 'Open', 'High', 'Low', 'Close', 'Volume'],
+}
+# SQLite settings applied by the bulk writer for the duration of its write: WAL lets readers continue during
+# the write, synchronous NORMAL is durable in WAL mode without a sync on every commit, and a negative
+# cache_size is in KiB (64 MB)
+BULK_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+}
+BULK_BATCH_SIZE = 50_000  # Rows per executemany call of the bulk writer
+# Every write made through the handler increases the table's counter here, caches compare against it
+VERSION_TABLE = 'table_versions'
+
+
+def create_sqlite_engine(database_path):
+    """Create an engine for a SQLite file whose transactions also cover DDL statements.
+
+    The sqlite3 module does not open a transaction before CREATE, ALTER or DROP, so BEGIN is
+    emitted explicitly to make schema changes such as the migration atomic.
+    """
+    engine = create_engine(f'sqlite:///{database_path}')
+
+    @event.listens_for(engine, 'connect')
+    def disable_implicit_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):
+        connection.exec_driver_sql('BEGIN')
+
+    return engine
+
+
+def database_path_from_url(database_url):
+    """Return the absolute file path of a SQLite database given as a path or a 'sqlite:///' URL."""
+    if database_url.startswith('sqlite:///'):
+        database_url = database_url[len('sqlite:///'):]
+    return os.path.abspath(database_url)
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of SQLAlchemy engines keyed by database file.
+
+    An engine and its connection pool are created on first use and shared by every
+    DatabaseHandler of the same file, so the setup cost is paid once per process.
+    The registry counts the handlers holding each engine, and a handler that closes
+    only disposes the engine when no other handler holds it.
+
+    Methods:
+    get_engine(database_url, holder=None): Returns the engine of a database, creating it on first use.
+    release(database_url, holder): Stops holder holding the engine and disposes it when nobody holds it.
+    dispose(database_url=None): Closes the pooled connections of one database, or of all, and forgets the engines.
+    """
+
+    def __init__(self):
+        self._engines = {}
+        self._holders = {}  # Ids of the handlers holding each engine
+        self._lock = threading.Lock()
+
+    def get_engine(self, database_url, holder=None):
+        """Return the shared engine of a database, creating it on first use, and count holder as holding it."""
+        database_path = database_path_from_url(database_url)
+        with self._lock:
+            if database_path not in self._engines:
+                self._engines[database_path] = create_sqlite_engine(database_path)
+                logger.info(f"Created engine for database: {database_path}")
+            if holder is not None:
+                self._holders.setdefault(database_path, set()).add(id(holder))
+            return self._engines[database_path]
+
+    def release(self, database_url, holder):
+        """Stop counting holder and dispose the engine once no handler holds it."""
+        database_path = database_path_from_url(database_url)
+        with self._lock:
+            holders = self._holders.get(database_path, set())
+            holders.discard(id(holder))
+            if holders:
+                return
+            self._holders.pop(database_path, None)
+            engine = self._engines.pop(database_path, None)
+        if engine is not None:
+            engine.dispose()
+            logger.info(f"Disposed engine for database: {database_path}")
+
+    def dispose(self, database_url=None):
+        """Dispose the engine of one database, or of all databases when database_url is None."""
+        with self._lock:
+            if database_url is None:
+                paths = list(self._engines)
+            else:
+                paths = [database_path_from_url(database_url)]
+            for database_path in paths:
+                self._holders.pop(database_path, None)
+                engine = self._engines.pop(database_path, None)
+                if engine is not None:
+                    engine.dispose()
+                    logger.info(f"Disposed engine for database: {database_path}")
+
+
+engine_registry = EngineRegistry()
+
+
+def quote(identifier):
+    """Quote a table or column name for SQLite."""
+    return '"' + identifier.replace('"', '""') + '"'
 
 
 class DatabaseHandler:
-    def __init__(self, database_url='C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/cryptocurrency_db.db'):
-        """Initialize the DatabaseHandler with the provided database URL."""
-        self.database_url = os.path.abspath(database_url)  # Ensure the path is absolute
-        self.engine = create_engine(f'sqlite:///{self.database_url}')
+    def __init__(self, database_url=DEFAULT_DATABASE_PATH):
+        """Initialize the DatabaseHandler with the provided database path or 'sqlite:///' URL."""
+        self.database_url = database_path_from_url(database_url)  # Ensure the path is absolute
         logger.info(f"DatabaseHandler initialized with database URL: {self.database_url}")
 
+    @property
+    def engine(self):
+        """The engine of the database, shared through the process-wide engine registry."""
+        return engine_registry.get_engine(self.database_url, holder=self)
+
+    @instrumented()
     def save_to_database(self, df: pd.DataFrame, table_name: str, mode: str = 'append'):
-        """Save the DataFrame to the specified table in the database."""
+        """Save the DataFrame to the specified table in the database.
+
+        Rows for the OHLCV table are converted to the typed schema. In 'replace' mode its rows are
+        deleted instead of dropping the table, and in 'append' mode rows with an existing key replace the stored ones.
+        """
         if mode not in ['replace', 'append']:
             logger.error("Invalid mode. Use 'replace' or 'append'.")
             raise ValueError("Invalid mode. Use 'replace' or 'append'.")
 
         try:
-            df.to_sql(table_name, con=self.engine, if_exists=mode, index=False)
+            with self.engine.begin() as connection:
+                self._save(connection, df, table_name, mode)
             logger.info(f"Data saved to table '{table_name}' successfully in '{mode}' mode.")
         except Exception as e:
             logger.error(f"Error saving data to the database: {e}")
 
+    def _save(self, connection, df, table_name, mode):
+        """Write df to the table on an open connection, the caller owns the transaction."""
+        if table_name == OHLCV_TABLE:
+            rows = self.to_storage_format(df)
+            self.ensure_ohlcv_schema(connection, extra_columns=rows.columns)
+            if mode == 'replace':
+                connection.exec_driver_sql(f'DELETE FROM {quote(table_name)}')
+            rows.to_sql(table_name, con=connection, if_exists='append', index=False, method=insert_or_replace)
+        else:
+            df.to_sql(table_name, con=connection, if_exists=mode, index=False)
+        bump_table_version(connection, table_name)
+
+    @instrumented()
+    def upsert_rows(self, df: pd.DataFrame, table_name: str = OHLCV_TABLE,
+                    key_columns=('CryptocurrencyName', 'Date')):
+        """Replace the rows matching the key columns of df and append df, in one transaction."""
+        if df is None or df.empty:
+            logger.warning(f"No rows to upsert into '{table_name}'.")
+            return 0
+
+        try:
+            with self.engine.begin() as connection:
+                self._upsert(connection, df, table_name, key_columns)
+            logger.info(f"Upserted {len(df)} rows into table '{table_name}'.")
+            return len(df)
+        except Exception as e:
+            logger.error(f"Error upserting data into the database: {e}")
+            return 0
+
+    def _upsert(self, connection, df, table_name, key_columns):
+        """Upsert df into the table on an open connection, the caller owns the transaction."""
+        if table_name == OHLCV_TABLE:
+            # The primary key makes INSERT OR REPLACE an upsert
+            rows = self.to_storage_format(df)
+            self.ensure_ohlcv_schema(connection, extra_columns=rows.columns)
+            rows.to_sql(table_name, con=connection, if_exists='append', index=False, method=insert_or_replace)
+        else:
+            keys = df[list(key_columns)].astype(str).drop_duplicates().values.tolist()
+            conditions = ' AND '.join(f'{quote(column)} = ?' for column in key_columns)
+            if inspect(connection).has_table(table_name):
+                connection.exec_driver_sql(f'DELETE FROM {quote(table_name)} WHERE {conditions}', [tuple(key) for key in keys])
+            df.to_sql(table_name, con=connection, if_exists='append', index=False)
+        bump_table_version(connection, table_name)
+
+    def unit_of_work(self):
+        """Return a UnitOfWork that collects writes and commits them in one transaction."""
+        return UnitOfWork(self)
+
+    @instrumented()
+    def bulk_write(self, df: pd.DataFrame, table_name: str = OHLCV_TABLE, mode: str = 'append',
+                   batch_size: int = BULK_BATCH_SIZE, pragmas=None) -> int:
+        """Write a DataFrame with executemany in batches inside a single transaction.
+
+        The PRAGMAs (BULK_PRAGMAS by default) are applied to the connection before the transaction and
+        their previous values are restored afterwards, as the connection is pooled and shared.
+        Rows for the OHLCV table are converted to the typed schema and upserted by key, other tables
+        are created from the DataFrame like save_to_database does. Returns the number of rows written,
+        or 0 on error.
+        """
+        if mode not in ['replace', 'append']:
+            logger.error("Invalid mode. Use 'replace' or 'append'.")
+            raise ValueError("Invalid mode. Use 'replace' or 'append'.")
+        if df is None or df.empty:
+            logger.warning(f"No rows to write to '{table_name}'.")
+            return 0
+
+        try:
+            with self.engine.connect() as connection:
+                # PRAGMAs such as journal_mode cannot be changed inside a transaction
+                driver_connection = connection.connection.driver_connection
+                pragmas = BULK_PRAGMAS if pragmas is None else pragmas
+                previous = {name: driver_connection.execute(f'PRAGMA {name}').fetchone()[0] for name in pragmas}
+                try:
+                    for name, value in pragmas.items():
+                        driver_connection.execute(f'PRAGMA {name} = {value}')
+
+                    with connection.begin():
+                        if table_name == OHLCV_TABLE:
+                            rows = self.to_storage_format(df)
+                            self.ensure_ohlcv_schema(connection, extra_columns=rows.columns)
+                            if mode == 'replace':
+                                connection.exec_driver_sql(f'DELETE FROM {quote(table_name)}')
+                        else:
+                            rows = df
+                            rows.head(0).to_sql(table_name, con=connection, if_exists=mode, index=False)
+                        written = write_batches(driver_connection, table_name, rows, batch_size, replace=table_name == OHLCV_TABLE)
+                        bump_table_version(connection, table_name)
+                finally:
+                    # Later users of the pooled connection, such as UnitOfWork commits, get the usual durability
+                    for name, value in previous.items():
+                        driver_connection.execute(f'PRAGMA {name} = {value}')
+            logger.info(f"Bulk wrote {written} rows to table '{table_name}' in '{mode}' mode.")
+            return written
+        except Exception as e:
+            logger.error(f"Error bulk writing data to the database: {e}")
+            return 0
+
+    @staticmethod
+    def to_storage_format(df: pd.DataFrame) -> pd.DataFrame:
+        """Convert a DataFrame to the typed OHLCV schema: ISO date text and float64 REAL columns."""
+        rows = df.copy()
+        if 'Date' in rows.columns:
+            rows['Date'] = pd.to_datetime(rows['Date'], format='mixed').dt.strftime('%Y-%m-%d')
+        if 'CryptocurrencyName' in rows.columns and isinstance(rows['CryptocurrencyName'].dtype, pd.CategoricalDtype):
+            rows['CryptocurrencyName'] = rows['CryptocurrencyName'].astype(str)  # Compact frames hold the names as codes
+        for column in rows.columns:
+            if rows[column].dtype == 'float32':
+                rows[column] = rows[column].astype('float64')  # Compact frames hold volumes and changes as float32
+            if column in OHLCV_KEY_COLUMNS or pd.api.types.is_numeric_dtype(rows[column]):
+                continue
+            # Formatted values such as '123.4567' and '1.2345%' are parsed back to numbers
+            rows[column] = pd.to_numeric(rows[column].astype(str).str.rstrip('%'), errors='coerce')
+        return rows
+
+    def ensure_ohlcv_schema(self, connection=None, extra_columns=()):
+        """Create the typed OHLCV table and its indexes, migrating an untyped table and adding new columns."""
+        if connection is None:
+            with self.engine.begin() as connection:
+                return self.ensure_ohlcv_schema(connection, extra_columns)
+
+        table = inspect(connection)
+        if not table.has_table(OHLCV_TABLE):
+            self._create_ohlcv_table(connection, OHLCV_TABLE, extra_columns)
+            return
+        if not table.get_pk_constraint(OHLCV_TABLE)['constrained_columns']:
+            logger.warning(f"Table '{OHLCV_TABLE}' has no primary key, migrating it to the typed schema.")
+            self._migrate_ohlcv_table(connection)
+
+        existing = {column['name'] for column in inspect(connection).get_columns(OHLCV_TABLE)}
+        for column in extra_columns:
+            if column not in existing:
+                connection.exec_driver_sql(f'ALTER TABLE {quote(OHLCV_TABLE)} ADD COLUMN {quote(column)} REAL')
+                logger.info(f"Added column '{column}' to table '{OHLCV_TABLE}'.")
+
+    def migrate_ohlcv_schema(self):
+        """Convert an existing untyped OHLCV table to the typed, keyed and indexed schema in place."""
+        with self.engine.begin() as connection:
+            if not inspect(connection).has_table(OHLCV_TABLE):
+                logger.info(f"Table '{OHLCV_TABLE}' does not exist, creating it with the typed schema.")
+                self._create_ohlcv_table(connection, OHLCV_TABLE)
+                return False
+            if inspect(connection).get_pk_constraint(OHLCV_TABLE)['constrained_columns']:
+                logger.info(f"Table '{OHLCV_TABLE}' already has the typed schema.")
+                return False
+            self._migrate_ohlcv_table(connection)
+            bump_table_version(connection, OHLCV_TABLE)
+            return True
+
+    def _create_ohlcv_table(self, connection, table_name, extra_columns=()):
+        """Create the OHLCV table as a WITHOUT ROWID table clustered on (CryptocurrencyName, Date)."""
+        columns = dict(OHLCV_COLUMN_TYPES)
+        for column in extra_columns:
+            columns.setdefault(column, 'REAL')
+        definitions = ',\n    '.join(f'{quote(column)} {column_type}' for column, column_type in columns.items())
+        key = ', '.join(quote(column) for column in OHLCV_KEY_COLUMNS)
+        connection.exec_driver_sql(
+            f'CREATE TABLE {quote(table_name)} (\n    {definitions},\n    PRIMARY KEY ({key})\n) WITHOUT ROWID'
+        )
+        if table_name == OHLCV_TABLE:
+            for index_name, index_columns in OHLCV_INDEXES.items():
+                connection.exec_driver_sql(
+                    f'CREATE INDEX IF NOT EXISTS {quote(index_name)} ON {quote(table_name)} '
+                    f'({", ".join(quote(column) for column in index_columns)})'
+                )
+        logger.info(f"Created table '{table_name}' with the typed schema.")
+
+    def _migrate_ohlcv_table(self, connection):
+        """Copy an untyped OHLCV table into the typed schema, parsing formatted text and keeping the last row per key."""
+        legacy_table = f'{OHLCV_TABLE}_legacy'
+        legacy_columns = [column['name'] for column in inspect(connection).get_columns(OHLCV_TABLE)]
+        connection.exec_driver_sql(f'ALTER TABLE {quote(OHLCV_TABLE)} RENAME TO {quote(legacy_table)}')
+        self._create_ohlcv_table(connection, OHLCV_TABLE, extra_columns=legacy_columns)
+
+        selects = []
+        for column in legacy_columns:
+            source = quote(column)
+            if column == 'Date':
+                selects.append(f'date({source})')
+            elif column == 'CryptocurrencyName':
+                selects.append(source)
+            else:
+                # Text such as '1.2345%' becomes REAL, text without digits such as 'nan' becomes NULL
+                selects.append(
+                    f"CASE WHEN typeof({source}) IN ('integer', 'real') THEN {source} "
+                    f"WHEN replace({source}, '%', '') GLOB '*[0-9]*' THEN CAST(replace({source}, '%', '') AS REAL) "
+                    f"ELSE NULL END"
+                )
+        column_list = ', '.join(quote(column) for column in legacy_columns)
+        result = connection.exec_driver_sql(
+            f'INSERT OR REPLACE INTO {quote(OHLCV_TABLE)} ({column_list}) '
+            f'SELECT {", ".join(selects)} FROM {quote(legacy_table)} '
+            f'WHERE CryptocurrencyName IS NOT NULL AND date(Date) IS NOT NULL ORDER BY rowid'
+        )
+        connection.exec_driver_sql(f'DROP TABLE {quote(legacy_table)}')
+        logger.info(f"Migrated {result.rowcount} rows of table '{OHLCV_TABLE}' to the typed schema.")
+
+    def query(self, table_name: str = OHLCV_TABLE, cryptos=None, start_date=None, end_date=None,
+              columns=None, last_n=None) -> pd.DataFrame:
+        """Load only the requested rows and columns, with the filters and the projection done in SQL.
+
+        Args:
+            table_name (str): The table to read, keyed by CryptocurrencyName and Date.
+            cryptos (list, optional): The cryptocurrencies to load, all if None.
+            start_date, end_date (optional): Inclusive date range, open-ended if None.
+            columns (list, optional): Columns to load besides CryptocurrencyName and Date, all if None.
+            last_n (int, optional): Load only the last n rows of every cryptocurrency within the date range.
+
+        Returns:
+            DataFrame: The rows sorted by CryptocurrencyName and Date, or an empty DataFrame on error.
+
+        Raises:
+            ValueError: If a requested column does not exist in the table.
+        """
+        conditions, params = [], []
+        if start_date is not None:
+            conditions.append('"Date" >= ?')
+            params.append(pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+        if end_date is not None:
+            conditions.append('"Date" <= ?')
+            params.append(pd.Timestamp(end_date).strftime('%Y-%m-%d'))
+
+        try:
+            with self.engine.connect() as connection:
+                available = [column['name'] for column in inspect(connection).get_columns(table_name)]
+                if columns is None:
+                    selected = OHLCV_KEY_COLUMNS + [column for column in available if column not in OHLCV_KEY_COLUMNS]
+                else:
+                    unknown = [column for column in columns if column not in available]
+                    if unknown:
+                        raise ValueError(f"Unknown columns for table '{table_name}': {unknown}")
+                    selected = OHLCV_KEY_COLUMNS + [column for column in columns if column not in OHLCV_KEY_COLUMNS]
+                projection = ', '.join(quote(column) for column in selected)
+
+                if last_n is None:
+                    if cryptos is not None:
+                        conditions.append(f'"CryptocurrencyName" IN ({", ".join("?" for _ in cryptos)})')
+                        params.extend(cryptos)
+                    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+                    sql = f'SELECT {projection} FROM {quote(table_name)} {where} ORDER BY "CryptocurrencyName", "Date"'
+                    rows = connection.exec_driver_sql(sql, tuple(params)).fetchall()
+                else:
+                    # Primary key searches only, one per cryptocurrency, so the cost does not grow with the history
+                    if cryptos is None:
+                        cryptos = self._crypto_names(connection, table_name)
+                    where = ' AND '.join(['"CryptocurrencyName" = ?'] + conditions)
+                    sql = f'SELECT {projection} FROM {quote(table_name)} WHERE {where} ORDER BY "Date" DESC LIMIT ?'
+                    rows = []
+                    for crypto in sorted(set(cryptos)):
+                        rows.extend(connection.exec_driver_sql(sql, (crypto, *params, int(last_n))).fetchall()[::-1])
+
+            df = pd.DataFrame.from_records(rows, columns=selected)
+            logger.info(f"Queried {len(df)} rows and {len(selected)} columns from '{table_name}'.")
+            return df
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error querying '{table_name}': {e}")
+            return pd.DataFrame()  # Return an empty DataFrame on error
+
+    @staticmethod
+    def _crypto_names(connection, table_name):
+        """Return the distinct cryptocurrency names by seeking from one name to the next through the primary key.
+
+        A SELECT DISTINCT reads every row of the table, this reads one index entry per cryptocurrency.
+        """
+        table = quote(table_name)
+        sql = f"""
+            WITH RECURSIVE names(name) AS (
+                SELECT MIN("CryptocurrencyName") FROM {table}
+                UNION ALL
+                SELECT (SELECT MIN("CryptocurrencyName") FROM {table} WHERE "CryptocurrencyName" > names.name)
+                FROM names WHERE names.name IS NOT NULL
+            )
+            SELECT name FROM names WHERE name IS NOT NULL
+        """
+        return connection.exec_driver_sql(sql).scalars().all()
+
+    def get_tail_per_crypto(self, table_name: str = OHLCV_TABLE, n: int = 1, before_date=None) -> pd.DataFrame:
+        """Fetch the last n OHLCV rows of every cryptocurrency, optionally only rows dated before before_date."""
+        end_date = pd.Timestamp(before_date) - pd.Timedelta(days=1) if before_date is not None else None
+        df = self.query(table_name, end_date=end_date, columns=['Open', 'High', 'Low', 'Close', 'Volume'], last_n=n)
+        if df.empty:
+            return pd.DataFrame()
+        logger.info(f"Loaded the last {n} rows per cryptocurrency from '{table_name}' ({len(df)} rows).")
+        return df
+
+    def get_cumulative_totals(self, table_name: str = OHLCV_TABLE, before_date=None) -> pd.DataFrame:
+        """Sum Volume and Typical_Price * Volume per cryptocurrency, the running totals behind the VWAP."""
+        date_filter = 'WHERE Date < :before_date' if before_date is not None else ''
+        query = f"""
+            SELECT CryptocurrencyName,
+                   SUM(Volume) AS Cumulative_Volume,
+                   SUM(Typical_Price * Volume) AS Cumulative_TPV
+            FROM {quote(table_name)} {date_filter}
+            GROUP BY CryptocurrencyName
+        """
+        params = {'before_date': pd.Timestamp(before_date).strftime('%Y-%m-%d')} if before_date is not None else {}
+
+        try:
+            with self.engine.connect() as connection:
+                df = pd.read_sql_query(text(query), connection, params=params)
+                logger.info(f"Loaded cumulative VWAP totals for {len(df)} cryptocurrencies from '{table_name}'.")
+                return df.set_index('CryptocurrencyName')
+        except Exception as e:
+            logger.error(f"Error fetching cumulative totals from '{table_name}': {e}")
+            return pd.DataFrame()  # Return an empty DataFrame on error
+
     def load_data_from_database(self, table_name: str = 'ohlcv_marketcap_data') -> pd.DataFrame:
         """Load data from the SQLite database into a DataFrame."""
         try:
@@ -60,19 +506,38 @@ class DatabaseHandler:
             logger.error(f"Error executing query: {e}")
             return pd.DataFrame()  # Return an empty DataFrame on error
 
+    def get_table_version(self, table_name: str = OHLCV_TABLE, connection=None):
+        """Return the version tag of a table, '<token>-<counter>', or None if it was never written.
+
+        The counter increases with every write made through the handler and the token is created with
+        the counter, so a rebuilt database never reuses the tag of an older one.
+        """
+        if connection is None:
+            with self.engine.connect() as connection:
+                return self.get_table_version(table_name, connection)
+
+        if not inspect(connection).has_table(VERSION_TABLE):
+            return None
+        row = connection.exec_driver_sql(
+            f'SELECT "Version", "Token" FROM {quote(VERSION_TABLE)} WHERE "TableName" = ?', (table_name,)
+        ).fetchone()
+        return f'{row[1]}-{row[0]}' if row else None
+
     def close(self):
-        """Close the database engine connection."""
-        if self.engine:
-            self.engine.dispose()  # Dispose of the engine when done
-            logger.info("Database connection closed.")
+        """Release the shared engine, which is disposed once no other handler of the database holds it.
+
+        The handler stays usable, its next query holds the engine again.
+        """
+        engine_registry.release(self.database_url, self)
+        logger.info("Database handler closed.")
 
     def get_last_n_rows(self, table_name: str, n: int) -> pd.DataFrame:
         """Fetch the last n rows from a specific table in the database."""
         try:
-            with sqlite3.connect(self.database_url) as conn:
-                query = f"SELECT * FROM {table_name} ORDER BY Date DESC LIMIT {n};"
+            with self.engine.connect() as connection:
+                query = f"SELECT * FROM {quote(table_name)} ORDER BY Date DESC LIMIT ?"
                 logger.debug(f"Executing query to get last {n} rows from '{table_name}'.")
-                return pd.read_sql_query(query, conn)
+                return pd.read_sql_query(query, connection, params=(int(n),))
         except Exception as e:
             logger.error(f"Error fetching last {n} rows from '{table_name}': {e}")
             return pd.DataFrame()  # Return an empty DataFrame on error
@@ -87,5 +552,128 @@ class DatabaseHandler:
             print(data.head(n))  # Display the first n rows (which are the latest n rows)
         else:
             logger.warning(f"Failed to load data from table '{table_name}' or no data available.")
-           
-           
+
+
+class UnitOfWork:
+    """
+    Collects the writes of a pipeline run and commits them together in one transaction.
+
+    The stages of a run pass their data in memory and register their writes here instead of
+    writing themselves, so a run either stores all of its rows, state and sketches or nothing.
+    It has the same write methods as DatabaseHandler, so it can be passed wherever a handler is
+    only used for saving.
+
+    Methods:
+    save_to_database(df, table_name, mode='append'): Registers a write of df in 'append' or 'replace' mode.
+    upsert_rows(df, table_name, key_columns): Registers an upsert of df by key and returns its row count.
+    commit(): Runs all registered writes in one transaction and returns True if they were committed.
+    """
+
+    def __init__(self, db_handler):
+        self.db_handler = db_handler
+        self.operations = []
+
+    def save_to_database(self, df: pd.DataFrame, table_name: str, mode: str = 'append'):
+        """Register a write of df to the table."""
+        if mode not in ['replace', 'append']:
+            logger.error("Invalid mode. Use 'replace' or 'append'.")
+            raise ValueError("Invalid mode. Use 'replace' or 'append'.")
+        self.operations.append(('save', df, table_name, mode))
+
+    def upsert_rows(self, df: pd.DataFrame, table_name: str = OHLCV_TABLE,
+                    key_columns=('CryptocurrencyName', 'Date')):
+        """Register an upsert of df by the key columns, return the number of rows registered."""
+        if df is None or df.empty:
+            logger.warning(f"No rows to upsert into '{table_name}'.")
+            return 0
+        self.operations.append(('upsert', df, table_name, tuple(key_columns)))
+        return len(df)
+
+    @instrumented(rows_in=lambda self: sum(len(operation[1]) for operation in self.operations))
+    def commit(self):
+        """Run the registered writes in order in one transaction, nothing is written if one of them fails."""
+        operations, self.operations = self.operations, []
+        if not operations:
+            logger.warning("No writes registered, nothing to commit.")
+            return True
+
+        try:
+            with self.db_handler.engine.begin() as connection:
+                for kind, df, table_name, option in operations:
+                    if kind == 'save':
+                        self.db_handler._save(connection, df, table_name, option)
+                    else:
+                        self.db_handler._upsert(connection, df, table_name, option)
+            logger.info(f"Committed {len(operations)} writes to tables {sorted({op[2] for op in operations})} in one transaction.")
+            return True
+        except Exception as e:
+            logger.error(f"Error committing the unit of work, all its writes were rolled back: {e}")
+            return False
+
+
+def insert_or_replace(table, connection, keys, data_iter):
+    """pandas.to_sql insertion method that replaces rows whose primary key already exists."""
+    columns = ', '.join(quote(key) for key in keys)
+    placeholders = ', '.join('?' for _ in keys)
+    connection.exec_driver_sql(
+        f'INSERT OR REPLACE INTO {quote(table.name)} ({columns}) VALUES ({placeholders})',
+        [tuple(row) for row in data_iter]
+    )
+
+
+def insert_rows(database_path, table_name, rows, timeout=60):
+    """Insert or replace DataFrame rows in one transaction over a plain sqlite3 connection.
+
+    Used by loader processes that write to the same file concurrently, BEGIN IMMEDIATE takes the
+    write lock up front so the writers queue on the busy timeout instead of failing with a deadlock.
+    """
+    connection = sqlite3.connect(database_path, timeout=timeout, isolation_level=None)
+    try:
+        connection.execute('BEGIN IMMEDIATE')
+        write_batches(connection, table_name, rows, replace=True)
+        bump_table_version(connection, table_name)
+        connection.execute('COMMIT')
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+    return len(rows)
+
+
+def write_batches(connection, table_name, rows, batch_size=BULK_BATCH_SIZE, replace=False):
+    """Insert DataFrame rows with executemany in batches, inside the transaction of the given sqlite3 connection."""
+    columns = ', '.join(quote(column) for column in rows.columns)
+    placeholders = ', '.join('?' for _ in rows.columns)
+    verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+    statement = f'{verb} INTO {quote(table_name)} ({columns}) VALUES ({placeholders})'
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows.iloc[start:start + batch_size]
+        # Column-wise tolist() converts to Python values much faster than iterating rows
+        values = []
+        for column in batch.columns:
+            series = batch[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                series = series.dt.strftime('%Y-%m-%d %H:%M:%S.%f')  # The format SQLAlchemy stores DATETIME in
+            if not pd.api.types.is_numeric_dtype(series):
+                series = series.astype(object).where(series.notna(), None)
+            values.append(series.tolist())
+        connection.executemany(statement, zip(*values))
+    return len(rows)
+
+
+def bump_table_version(connection, table_name):
+    """Increase the version counter of a table inside the caller's transaction (SQLAlchemy or sqlite3 connection)."""
+    execute = getattr(connection, 'exec_driver_sql', None) or connection.execute
+    execute(
+        f'CREATE TABLE IF NOT EXISTS {quote(VERSION_TABLE)} '
+        '("TableName" TEXT PRIMARY KEY, "Version" INTEGER NOT NULL, "Token" TEXT NOT NULL)'
+    )
+    execute(
+        f'INSERT INTO {quote(VERSION_TABLE)} ("TableName", "Version", "Token") VALUES (?, 1, ?) '
+        'ON CONFLICT ("TableName") DO UPDATE SET "Version" = "Version" + 1',
+        (table_name, uuid.uuid4().hex)
+    )
+
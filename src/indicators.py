@@ -0,0 +1,312 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+
+# Set up logger for the indicators module
+logger = logging.getLogger('indicators_logger')
+logger.setLevel(logging.INFO)
+
+# Windows in days of every indicator, an IndicatorEngine can be given others
+DEFAULT_WINDOWS = {
+    'sma': (20, 50),
+    'ema': (12, 26),
+    'rsi': (14,),
+    'bollinger': (20,),
+    'atr': (14,),
+    'vwap': (7, 30),
+}
+BOLLINGER_STDS = 2.0  # Width of the Bollinger bands in population standard deviations
+# Values of the last days kept per cryptocurrency, so the windows of the next rows can be completed
+HISTORY_COLUMNS = ['Close_History', 'Volume_History', 'TPV_History']
+
+
+class IndicatorEngine:
+    """
+    Calculates rolling technical indicators per cryptocurrency from the daily prices.
+
+    SMA_<n> and the Bollinger bands BB_Middle_<n>, BB_Upper_<n> and BB_Lower_<n> are calculated from the
+    last n closes, EMA_<n> with the smoothing factor 2 / (n + 1), and RSI_<n> and ATR_<n> with Wilder's
+    smoothing 1 / n. VWAP_<n> is the volume weighted average of the typical price over the last n days,
+    next to the cumulative VWAP of DataAnalyzer.calculate_vwap. An indicator is NaN until its
+    cryptocurrency has n days (n changes for the RSI). A missing close or volume makes the windows
+    that contain it NaN, and a missing close is skipped by the recursive indicators.
+
+    The full history and the daily update run the same code. The window indicators are calculated for
+    all rows at once with NumPy array operations. The recursive ones step through the days with one array
+    operation over all cryptocurrencies per day. The daily update continues from a RollingIndicatorState,
+    so it costs O(longest window) per cryptocurrency and gives exactly the values of a full recalculation.
+    The rolling VWAPs are the exception: all windows are differences of one cumulative sum per column,
+    whose rounding depends on where the sum starts, so they agree to within floating point rounding.
+
+    Methods:
+    columns(): Returns the names of the indicator columns.
+    state_columns(): Returns the names of the running values kept per cryptocurrency in the state.
+    calculate(df, state=None): Returns df with the indicator columns and advances the state past its rows.
+    """
+
+    def __init__(self, windows=None, bollinger_stds=BOLLINGER_STDS):
+        windows = {**DEFAULT_WINDOWS, **(windows or {})}
+        self.windows = {kind: tuple(sorted(set(int(n) for n in windows[kind]))) for kind in DEFAULT_WINDOWS}
+        if any(n < 1 for sizes in self.windows.values() for n in sizes):
+            raise ValueError("Indicator windows must be at least one day.")
+        self.bollinger_stds = float(bollinger_stds)
+        # Each state keeps the days that precede a row in the longest window
+        self.history_length = max(self.windows['sma'] + self.windows['bollinger'] + self.windows['vwap'], default=1) - 1
+
+    def config(self):
+        """Return the windows and band width, stored with the state to detect a changed configuration."""
+        return {'windows': {kind: list(sizes) for kind, sizes in self.windows.items()}, 'bollinger_stds': self.bollinger_stds}
+
+    def columns(self):
+        """Return the names of the indicator columns in the order they are added."""
+        columns = [f'SMA_{n}' for n in self.windows['sma']]
+        columns += [f'EMA_{n}' for n in self.windows['ema']]
+        columns += [f'RSI_{n}' for n in self.windows['rsi']]
+        for n in self.windows['bollinger']:
+            columns += [f'BB_Middle_{n}', f'BB_Upper_{n}', f'BB_Lower_{n}']
+        columns += [f'ATR_{n}' for n in self.windows['atr']]
+        columns += [f'VWAP_{n}' for n in self.windows['vwap']]
+        return columns
+
+    def state_columns(self):
+        """Return the names of the running values of the recursive indicators."""
+        columns = [f'EMA_{n}' for n in self.windows['ema']]
+        for n in self.windows['rsi']:
+            columns += [f'RSI_{n}_Gain', f'RSI_{n}_Loss']
+        columns += [f'ATR_{n}' for n in self.windows['atr']]
+        return columns
+
+    def calculate(self, df, state=None):
+        """Return a copy of df with the indicator columns, continuing from and advancing the state.
+
+        Args:
+            df (DataFrame): Rows with 'CryptocurrencyName', 'Date' and the OHLCV columns. With a state,
+                only the rows after the days the state has seen.
+            state (RollingIndicatorState, optional): The state after the earlier history, advanced in place.
+                Without a state the rows are the full history.
+        """
+        if state is None:
+            state = RollingIndicatorState(self)
+        if df.empty:
+            return df.assign(**{column: np.nan for column in self.columns()})
+
+        rows = df.sort_values(by=['CryptocurrencyName', 'Date'], kind='stable')
+        codes, assets = pd.factorize(rows['CryptocurrencyName'].astype(str))
+        positions = rows.groupby(codes).cumcount().to_numpy()
+        lengths = np.bincount(codes)
+        shape = (lengths.max(), len(assets))
+
+        # One column per cryptocurrency and one row per day, shorter histories are padded with NaN
+        def grid(column):
+            values = np.full(shape, np.nan)
+            values[positions, codes] = pd.to_numeric(rows[column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            return values
+
+        open_, high, low, close, volume = (grid(column) for column in ['Open', 'High', 'Low', 'Close', 'Volume'])
+        # The typical price of DataAnalyzer.calculate_typical_price
+        flow = (high + low + close + open_) / 4 * volume
+        previous = state.arrays(assets)
+        outputs = {}
+        extended_close = self._window_indicators(close, previous['Close_History'], outputs)
+        extended_volume, extended_flow = self._rolling_vwaps(volume, flow, previous['Volume_History'], previous['TPV_History'], outputs)
+        extended = {'Close_History': extended_close, 'Volume_History': extended_volume, 'TPV_History': extended_flow}
+        running = self._recursive_indicators(close, high, low, previous, outputs)
+
+        calculated = {column: pd.Series(outputs[column][positions, codes], index=rows.index) for column in self.columns()}
+        # The state keeps the days at the end of each cryptocurrency's history, not of the padded grid
+        steps = lengths[:, None] + np.arange(self.history_length)[None, :]
+        for column, values in extended.items():
+            running[column] = values[steps, np.arange(len(assets))[:, None]]
+        running['Date'] = pd.to_datetime(rows.groupby(codes)['Date'].last().to_numpy())
+        state.update(assets, running)
+
+        logger.info(f"Calculated {len(calculated)} indicators for {len(rows)} rows of {len(assets)} cryptocurrencies.")
+        return df.assign(**calculated)
+
+    def _window_indicators(self, close, history, outputs):
+        """Add the SMA and Bollinger columns and return the closes with the state's history prepended."""
+        # With the earlier closes on top, every row has the closes of the window before it
+        extended = np.vstack([history.T, close])
+        n_days = close.shape[0]
+
+        for n in sorted(set(self.windows['sma'] + self.windows['bollinger'])):
+            start = self.history_length - (n - 1)
+            # The closes of each row's window, oldest first; summed in this order in every run
+            window = [extended[start + k:start + k + n_days] for k in range(n)]
+            total = window[0]
+            for values in window[1:]:
+                total = total + values
+            mean = total / n
+            if n in self.windows['sma']:
+                outputs[f'SMA_{n}'] = mean
+            if n in self.windows['bollinger']:
+                squares = (window[0] - mean) ** 2
+                for values in window[1:]:
+                    squares = squares + (values - mean) ** 2
+                std = np.sqrt(squares / n)
+                outputs[f'BB_Middle_{n}'] = mean
+                outputs[f'BB_Upper_{n}'] = mean + self.bollinger_stds * std
+                outputs[f'BB_Lower_{n}'] = mean - self.bollinger_stds * std
+        return extended
+
+    def _rolling_vwaps(self, volume, flow, volume_history, flow_history, outputs):
+        """Add the rolling VWAP columns and return the volumes and typical price x volume with the state's history prepended."""
+        extended_volume = np.vstack([volume_history.T, volume])
+        extended_flow = np.vstack([flow_history.T, flow])
+        missing = np.isnan(extended_volume) | np.isnan(extended_flow)
+
+        # One cumulative sum per column serves every window, a leading zero row makes the sum
+        # of the n days up to row e equal to cumulative[e + 1] - cumulative[e + 1 - n]
+        def cumulative(values):
+            return np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+
+        volumes = cumulative(np.where(missing, 0.0, extended_volume))
+        flows = cumulative(np.where(missing, 0.0, extended_flow))
+        gaps = cumulative(missing.astype('float64'))
+        n_days = volume.shape[0]
+        end = slice(self.history_length + 1, self.history_length + 1 + n_days)
+        for n in self.windows['vwap']:
+            start = slice(self.history_length + 1 - n, self.history_length + 1 - n + n_days)
+            window_volume = volumes[end] - volumes[start]
+            complete = (gaps[end] == gaps[start]) & (window_volume > 0)
+            outputs[f'VWAP_{n}'] = np.divide(flows[end] - flows[start], window_volume, out=np.full(window_volume.shape, np.nan), where=complete)
+        return extended_volume, extended_flow
+
+    def _recursive_indicators(self, close, high, low, previous, outputs):
+        """Add the EMA, RSI and ATR columns day by day and return the running values after the last day."""
+        running = {column: previous[column].copy() for column in ['Bars', 'Last_Close'] + self.state_columns()}
+        for column in [f'EMA_{n}' for n in self.windows['ema']] + [f'RSI_{n}' for n in self.windows['rsi']] + [f'ATR_{n}' for n in self.windows['atr']]:
+            outputs[column] = np.full(close.shape, np.nan)
+
+        for day in range(close.shape[0]):
+            today = close[day]
+            valid = ~np.isnan(today)
+            last_close = running['Last_Close']
+            has_previous = valid & ~np.isnan(last_close)
+            bars = running['Bars'] = running['Bars'] + valid
+
+            for n in self.windows['ema']:
+                ema = running[f'EMA_{n}']
+                updated = np.where(np.isnan(ema), today, ema + (2.0 / (n + 1)) * (today - ema))
+                ema = running[f'EMA_{n}'] = np.where(valid, updated, ema)
+                outputs[f'EMA_{n}'][day] = np.where(valid & (bars >= n), ema, np.nan)
+
+            change = today - last_close
+            gains = np.where(change > 0, change, 0.0)
+            losses = np.where(change < 0, -change, 0.0)
+            for n in self.windows['rsi']:
+                gain, loss = running[f'RSI_{n}_Gain'], running[f'RSI_{n}_Loss']
+                gain = running[f'RSI_{n}_Gain'] = np.where(has_previous, np.where(np.isnan(gain), gains, gain + (gains - gain) / n), gain)
+                loss = running[f'RSI_{n}_Loss'] = np.where(has_previous, np.where(np.isnan(loss), losses, loss + (losses - loss) / n), loss)
+                total = gain + loss
+                # Without any change in the window the RSI is neutral
+                rsi = np.divide(100.0 * gain, total, out=np.full(total.shape, 50.0), where=total > 0)
+                outputs[f'RSI_{n}'][day] = np.where(has_previous & (bars > n), rsi, np.nan)
+
+            # The first day of a cryptocurrency has no previous close, its true range is high - low
+            true_range = np.fmax(high[day] - low[day], np.fmax(np.abs(high[day] - last_close), np.abs(low[day] - last_close)))
+            counted = valid & ~np.isnan(true_range)
+            for n in self.windows['atr']:
+                atr = running[f'ATR_{n}']
+                updated = np.where(np.isnan(atr), true_range, atr + (true_range - atr) / n)
+                atr = running[f'ATR_{n}'] = np.where(counted, updated, atr)
+                outputs[f'ATR_{n}'][day] = np.where(counted & (bars >= n), atr, np.nan)
+
+            running['Last_Close'] = np.where(valid, today, last_close)
+        return running
+
+
+class RollingIndicatorState:
+    """
+    The per-cryptocurrency state an IndicatorEngine needs to continue its indicators by one day.
+
+    For every cryptocurrency it holds the last date, the number of closes seen, the last close, the closes,
+    volumes and typical price x volume of the longest window but one and the running values of the EMAs,
+    RSIs and ATRs. It is persisted in the
+    'rolling_indicator_state' table together with the engine's configuration. A state saved with other
+    windows is not loaded, so the caller rebuilds it from the history.
+
+    Methods:
+    load(db_handler, engine): Loads the persisted state of the engine's configuration from the database.
+    from_database(db_handler, engine, before_date=None): Builds the state by calculating the stored history.
+    save(db_handler): Persists the state through a DatabaseHandler or a UnitOfWork.
+    is_empty(): Returns True if the state holds no cryptocurrencies.
+    arrays(assets): Returns the running values of the given cryptocurrencies as arrays.
+    update(assets, running): Replaces the running values of the given cryptocurrencies.
+    """
+
+    TABLE_NAME = 'rolling_indicator_state'
+
+    def __init__(self, engine, state_df=None):
+        self.engine = engine
+        self.columns = ['CryptocurrencyName', 'Date', 'Bars', 'Last_Close'] + HISTORY_COLUMNS + engine.state_columns()
+        if state_df is None or state_df.empty:
+            state_df = pd.DataFrame(columns=self.columns)
+        self.state_df = state_df[self.columns].set_index('CryptocurrencyName')
+
+    @classmethod
+    def load(cls, db_handler, engine):
+        """Load the persisted state, or return an empty state if there is none for the engine's configuration."""
+        stored = db_handler.load_data_from_database(cls.TABLE_NAME)
+        if stored.empty:
+            logger.warning(f"No rolling indicator state found in table '{cls.TABLE_NAME}'.")
+            return cls(engine)
+        if json.loads(stored['Config'].iloc[0]) != engine.config():
+            logger.warning("The stored rolling indicator state was calculated with other windows, ignoring it.")
+            return cls(engine)
+
+        stored['Date'] = pd.to_datetime(stored['Date'])
+        for column in HISTORY_COLUMNS:
+            stored[column] = stored[column].map(json.loads)
+        logger.info(f"Loaded rolling indicator state for {len(stored)} cryptocurrencies.")
+        return cls(engine, stored)
+
+    @classmethod
+    def from_database(cls, db_handler, engine, before_date=None):
+        """Build the state by calculating the indicators over the stored history before before_date."""
+        end_date = pd.Timestamp(before_date) - pd.Timedelta(days=1) if before_date is not None else None
+        history = db_handler.query(end_date=end_date, columns=['Open', 'High', 'Low', 'Close', 'Volume'])
+        state = cls(engine)
+        if history.empty:
+            return state
+        engine.calculate(history, state)
+        logger.info(f"Built rolling indicator state from {len(history)} stored rows.")
+        return state
+
+    def save(self, db_handler):
+        """Persist the state through a DatabaseHandler or register it with a UnitOfWork."""
+        stored = self.state_df.reset_index()
+        stored['Date'] = pd.to_datetime(stored['Date']).dt.strftime('%Y-%m-%d')
+        for column in HISTORY_COLUMNS:
+            stored[column] = stored[column].map(lambda values: json.dumps([float(value) for value in values]))
+        stored['Config'] = json.dumps(self.engine.config())
+        db_handler.save_to_database(stored, self.TABLE_NAME, mode='replace')
+        logger.info(f"Saved rolling indicator state for {len(stored)} cryptocurrencies.")
+
+    def is_empty(self):
+        """Return True if the state holds no cryptocurrencies."""
+        return self.state_df.empty
+
+    def arrays(self, assets):
+        """Return the running values of the cryptocurrencies as arrays, unseen ones start empty."""
+        known = self.state_df.reindex(assets)
+        seen = known['Bars'].notna().to_numpy()
+        arrays = {'Bars': pd.to_numeric(known['Bars']).fillna(0).to_numpy(dtype='int64')}
+        for column in ['Last_Close'] + self.engine.state_columns():
+            arrays[column] = known[column].to_numpy(dtype='float64', na_value=np.nan)
+        for column in HISTORY_COLUMNS:
+            arrays[column] = np.full((len(assets), self.engine.history_length), np.nan)
+            if seen.any():
+                arrays[column][seen] = np.array(known[column][seen].tolist(), dtype='float64').reshape(seen.sum(), -1)
+        return arrays
+
+    def update(self, assets, running):
+        """Replace the state of the cryptocurrencies with their running values after the calculated rows."""
+        updated = pd.DataFrame({column: running[column] for column in ['Date', 'Bars', 'Last_Close'] + self.engine.state_columns()}, index=pd.Index(assets, name='CryptocurrencyName'))
+        for column in HISTORY_COLUMNS:
+            updated[column] = list(running[column])
+        updated = updated[self.columns[1:]]
+        kept = self.state_df.drop(index=updated.index, errors='ignore')
+        self.state_df = pd.concat([kept, updated]) if not kept.empty else updated
@@ -0,0 +1,221 @@
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Set up logger for the instrumentation module
+logger = logging.getLogger('instrumentation_logger')
+logger.setLevel(logging.INFO)
+
+METRIC_PREFIX = 'crypto_pipeline'
+# Metrics of the Prometheus text file: name suffix, record field and help text
+PROMETHEUS_METRICS = [
+    ('stage_calls', 'calls', 'Number of calls of the stage during the last run.'),
+    ('stage_duration_seconds', 'duration_seconds', 'Wall time spent in the stage during the last run.'),
+    ('stage_rows_in', 'rows_in', 'Rows passed into the stage during the last run.'),
+    ('stage_rows_out', 'rows_out', 'Rows returned or written by the stage during the last run.'),
+    ('stage_peak_memory_bytes', 'peak_memory_bytes', 'Peak memory traced by tracemalloc above the level at the start of the stage.'),
+]
+
+
+def count_rows(value):
+    """Return the rows of a DataFrame, of the first item of a tuple or the first DataFrame in a dict, or an int row count."""
+    if isinstance(value, tuple) and value:
+        return count_rows(value[0])
+    if isinstance(value, dict):
+        return next((count_rows(item) for item in value.values() if hasattr(item, 'shape')), None)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    shape = getattr(value, 'shape', None)
+    return int(shape[0]) if shape else None
+
+
+class Instrumentation:
+    """
+    Records the wall time, rows in and out and optionally the peak traced memory of instrumented stages.
+
+    Nothing is measured until enable() is called, so the instrumented methods cost a single flag
+    check during tests and library use. tracemalloc slows down every allocation, so the peak memory
+    is only recorded with enable(trace_memory=True). Stages may be nested: the peak memory of a stage
+    includes the stages it calls. Only the outermost stage is profiled, because one thread can run only
+    one profiler at a time. Measurements are taken on the thread that enabled the instrumentation,
+    calls from worker threads run unmeasured.
+
+    Methods:
+    enable(profile_directory=None, trace_memory=False): Starts recording, optionally with tracemalloc and a cProfile dump per stage.
+    disable(): Stops recording and tracemalloc if it was started here.
+    measure(stage, rows_in=None): Context manager that records one call of a stage.
+    summary(): Returns the totals per stage.
+    write_report(file_path): Writes the calls and totals of the run as JSON.
+    write_prometheus(file_path): Writes the totals in the Prometheus text format.
+    reset(): Forgets all recorded calls.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_directory = None
+        self.trace_memory = False
+        self.records = []
+        self.started_at = None
+        self._stack = []
+        self._thread = None
+        self._started_tracemalloc = False
+
+    def enable(self, profile_directory=None, trace_memory=False):
+        """Start recording, profiling every outermost stage into profile_directory if it is given."""
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.trace_memory = trace_memory
+        if profile_directory:
+            os.makedirs(profile_directory, exist_ok=True)
+        self.profile_directory = profile_directory
+        self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self._thread = threading.get_ident()
+        self.enabled = True
+        logger.info("Instrumentation enabled.")
+
+    def disable(self):
+        """Stop recording, the recorded calls are kept."""
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def reset(self):
+        """Forget all recorded calls."""
+        self.records = []
+        self._stack = []
+
+    @contextmanager
+    def measure(self, stage, rows_in=None):
+        """Record the duration and peak memory of the block, the caller may set record['rows_out']."""
+        if not self.enabled or threading.get_ident() != self._thread:
+            yield {}
+            return
+
+        current = 0
+        if self.trace_memory:
+            # The peak is reset for every stage, so the enclosing stage keeps the peak seen so far
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+
+        record = {'stage': stage, 'rows_in': rows_in, 'rows_out': None, 'peak_memory_bytes': None}
+        frame = {'start_memory': current, 'peak': current}
+        profiler = cProfile.Profile() if self.profile_directory and not self._stack else None
+        self._stack.append(frame)
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['duration_seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            if self.trace_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_memory_bytes'] = peak - frame['start_memory']
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            if profiler is not None:
+                profile_path = os.path.join(self.profile_directory, f'{stage}-{len(self.records)}.prof')
+                profiler.dump_stats(profile_path)
+                record['profile'] = profile_path
+            self.records.append(record)
+            memory = f", peak memory {record['peak_memory_bytes'] / 1e6:.1f} MB" if self.trace_memory else ''
+            logger.info(
+                f"Stage '{stage}' took {record['duration_seconds']:.3f} s, rows in {record['rows_in']}, "
+                f"rows out {record['rows_out']}{memory}."
+            )
+
+    def summary(self):
+        """Return the calls, total duration and rows and the highest peak memory of every stage.
+
+        The peak memory is None for the stages that ran without memory tracing.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['stage'], {
+                'calls': 0, 'duration_seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'peak_memory_bytes': None,
+            })
+            total['calls'] += 1
+            total['duration_seconds'] += record['duration_seconds']
+            total['rows_in'] += record['rows_in'] or 0
+            total['rows_out'] += record['rows_out'] or 0
+            if record['peak_memory_bytes'] is not None:
+                total['peak_memory_bytes'] = max(total['peak_memory_bytes'] or 0, record['peak_memory_bytes'])
+        return totals
+
+    def write_report(self, file_path):
+        """Write the run's calls and per-stage totals to a JSON file."""
+        report = {'started_at': self.started_at, 'stages': self.summary(), 'calls': self.records}
+        self._write_atomically(file_path, json.dumps(report, indent=2))
+        logger.info(f"Run report written to {file_path}.")
+
+    def write_prometheus(self, file_path):
+        """Write the per-stage totals as gauges in the Prometheus text format, e.g. for the node exporter."""
+        summary = self.summary()
+        lines = []
+        for suffix, field, help_text in PROMETHEUS_METRICS:
+            name = f'{METRIC_PREFIX}_{suffix}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for stage, total in summary.items():
+                if total[field] is not None:  # The peak memory is only known with memory tracing
+                    lines.append(f'{name}{{stage="{stage}"}} {total[field]}')
+        self._write_atomically(file_path, '\n'.join(lines) + '\n')
+        logger.info(f"Prometheus metrics written to {file_path}.")
+
+    @staticmethod
+    def _write_atomically(file_path, content):
+        """Write to a temporary file and rename it, so a collector never reads half a file."""
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f'{file_path}.tmp-{os.getpid()}'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temporary_path, file_path)
+
+
+# The process-wide recorder used by the instrumented methods
+instrumentation = Instrumentation()
+
+
+def instrumented(stage=None, rows_in=None):
+    """Decorator recording every call of the function as a stage of the process-wide instrumentation.
+
+    The stage is named after the function's qualified name, e.g. 'PerformCleaning.clean_all', unless
+    a name is given. rows_in is called with the function's arguments and returns the input whose rows are counted,
+    by default the first argument with a shape. The rows out are counted from the return value.
+    """
+    def decorator(function):
+        name = stage or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not instrumentation.enabled:
+                return function(*args, **kwargs)
+
+            if rows_in is not None:
+                rows = count_rows(rows_in(*args, **kwargs))
+            else:
+                rows = next((count_rows(arg) for arg in list(args) + list(kwargs.values()) if hasattr(arg, 'shape')), None)
+            with instrumentation.measure(name, rows_in=rows) as record:
+                result = function(*args, **kwargs)
+                record['rows_out'] = count_rows(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,43 @@
+import logging
+import os
+
+
+LOG_DIRECTORY = 'C:/Users/46704/Desktop/Kunskapskontroll 2 Python/Project/logs'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# The logger of every module in the package and the file it writes to
+LOG_FILES = {
+    'columnar_cache_logger': 'columnar_cache.log',
+    'compact_logger': 'compact.log',
+    'data_analyzer_logger': 'data_analyzer.log',
+    'data_cleaner_logger': 'data_cleaner.log',
+    'data_fetcher_logger': 'data_fetcher.log',
+    'data_loader_logger': 'data_loader.log',
+    'data_source_logger': 'data_source.log',
+    'database_handler_logger': 'database_handler.log',
+    'indicators_logger': 'indicators.log',
+    'instrumentation_logger': 'instrumentation.log',
+    'pipeline_logger': 'pipeline.log',
+    'streaming_logger': 'streaming.log',
+}
+
+
+def configure_logging(log_directory=LOG_DIRECTORY, level=logging.INFO):
+    """
+    Attach a file handler to the logger of every module, writing to '<log_directory>/<module>.log'.
+
+    Importing the package never touches the file system, applications call this once at start-up.
+    Calling it again with the same directory does not add duplicate handlers.
+    """
+    os.makedirs(log_directory, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    for logger_name, file_name in LOG_FILES.items():
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(level)
+        log_file_path = os.path.abspath(os.path.join(log_directory, file_name))
+        if any(getattr(handler, 'baseFilename', None) == log_file_path for handler in logger.handlers):
+            continue
+
+        file_handler = logging.FileHandler(log_file_path, encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
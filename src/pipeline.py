@@ -0,0 +1,204 @@
+import datetime
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import shutil
+from src.instrumentation import instrumentation, count_rows
+
+
+# Set up logger for the pipeline module
+logger = logging.getLogger('pipeline_logger')
+logger.setLevel(logging.INFO)
+
+VERSION_FILE = 'VERSION'  # Holds the code version of the checkpoints in a run directory
+
+
+def code_version(stages=()):
+    """Return a hash of the package source, the modules that define the stages and the pandas version.
+
+    Checkpoints are pickles of objects of these modules, so they are only reused by the code that wrote them.
+    """
+    import pandas as pd
+
+    package_directory = os.path.dirname(os.path.abspath(__file__))
+    paths = {os.path.join(package_directory, name) for name in os.listdir(package_directory) if name.endswith('.py')}
+    for stage in stages:
+        try:
+            paths.add(os.path.abspath(inspect.getsourcefile(stage.function)))
+        except TypeError:
+            continue  # Built-in functions have no source file
+
+    digest = hashlib.sha256(pd.__version__.encode())
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class Stage:
+    """
+    A named step of a pipeline.
+
+    The function is called with the outputs of the input stages, in the order they are listed,
+    and returns the stage's output. Returning None stops the run without a checkpoint, for
+    example when there is no new data. A stage with checkpoint=False, such as one that only
+    displays rows, is never checkpointed and runs again on every resume.
+    """
+
+    def __init__(self, name, function, inputs=(), checkpoint=True):
+        self.name = name
+        self.function = function
+        self.inputs = tuple(inputs)
+        self.checkpoint = checkpoint
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)!r})"
+
+
+class PipelineRunner:
+    """
+    Runs a graph of stages and checkpoints the output of every stage under the run date.
+
+    Checkpoints are pickled to '<checkpoint_directory>/<run_date>/<stage>.pkl'. With resume=True, a
+    stage whose checkpoint exists is skipped unless one of its inputs runs again, and its output is
+    only read back when a stage that still has to run needs it. The checkpoints of the stages that
+    run are deleted first, so a run that stops halfway never leaves outdated outputs behind. The
+    checkpoints of other run dates are removed when a run starts.
+
+    The run directory records the code version that wrote its checkpoints, by default code_version()
+    of the stages. Checkpoints of another version are deleted instead of resumed, so a resume after
+    an upgrade never unpickles objects of the old code.
+
+    Methods:
+    run(): Runs the stages and returns their outputs by name, or None if a stage failed or stopped the run.
+    completed_stages(): Returns the names of the stages with a checkpoint for the run date.
+    clear(): Deletes the checkpoints of the run date.
+    """
+
+    def __init__(self, stages, checkpoint_directory, run_date=None, resume=False, version=None):
+        self.stages = self._order(stages)
+        self.checkpoint_directory = checkpoint_directory
+        self.run_date = (run_date or datetime.date.today()).isoformat()
+        self.resume = resume
+        self.version = version if version is not None else code_version(self.stages)
+        self.run_directory = os.path.join(checkpoint_directory, self.run_date)
+
+    def run(self):
+        """Run the stages in dependency order, return a dict of their outputs or None on failure."""
+        os.makedirs(self.run_directory, exist_ok=True)
+        self._remove_other_runs()
+        if self._stored_version() != self.version:
+            if self.completed_stages(check_version=False):
+                logger.warning(f"The checkpoints of the {self.run_date} run were written by another code version, running all stages.")
+            self.clear()
+            os.makedirs(self.run_directory, exist_ok=True)
+            with open(os.path.join(self.run_directory, VERSION_FILE), 'w') as f:
+                f.write(self.version)
+
+        completed = set()
+        if self.resume:
+            # A stage whose input runs again has to run again too
+            checkpointed = set(self.completed_stages())
+            for stage in self.stages:
+                if stage.name in checkpointed and set(stage.inputs) <= completed:
+                    completed.add(stage.name)
+        for stage in self.stages:
+            if stage.name not in completed and os.path.exists(self._checkpoint_path(stage.name)):
+                os.remove(self._checkpoint_path(stage.name))
+        needed = {name for stage in self.stages if stage.name not in completed for name in stage.inputs}
+        outputs = {}
+
+        for stage in self.stages:
+            if stage.name in completed:
+                logger.info(f"Skipping stage '{stage.name}', it completed earlier on {self.run_date}.")
+                if stage.name in needed:
+                    outputs[stage.name] = self._read_checkpoint(stage.name)
+                continue
+
+            logger.info(f"Running stage '{stage.name}'.")
+            inputs = [outputs[name] for name in stage.inputs]
+            try:
+                with instrumentation.measure(f'pipeline.{stage.name}', rows_in=count_rows(inputs[0]) if inputs else None) as record:
+                    output = stage.function(*inputs)
+                    record['rows_out'] = count_rows(output)
+            except Exception as e:
+                logger.error(f"Stage '{stage.name}' failed: {e}")
+                return None
+
+            if output is None:
+                logger.warning(f"Stage '{stage.name}' returned no output, stopping the run.")
+                return None
+
+            if stage.checkpoint:
+                self._write_checkpoint(stage.name, output)
+            outputs[stage.name] = output
+
+        logger.info(f"All {len(self.stages)} stages of the {self.run_date} run completed.")
+        return outputs
+
+    def completed_stages(self, check_version=True):
+        """Return the names of the stages that have a checkpoint of this code version for the run date, in run order."""
+        if check_version and self._stored_version() != self.version:
+            return []
+        return [stage.name for stage in self.stages if os.path.exists(self._checkpoint_path(stage.name))]
+
+    def clear(self):
+        """Delete the checkpoints of the run date."""
+        shutil.rmtree(self.run_directory, ignore_errors=True)
+        logger.info(f"Cleared the checkpoints of the {self.run_date} run.")
+
+    @staticmethod
+    def _order(stages):
+        """Return the stages in dependency order, keeping the declared order where the graph allows it."""
+        by_name = {stage.name: stage for stage in stages}
+        if len(by_name) != len(stages):
+            raise ValueError("Stage names must be unique.")
+        for stage in stages:
+            unknown = [name for name in stage.inputs if name not in by_name]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {unknown}")
+
+        ordered, done = [], set()
+        while len(ordered) < len(stages):
+            ready = [stage for stage in stages if stage.name not in done and set(stage.inputs) <= done]
+            if not ready:
+                raise ValueError("The stages contain a dependency cycle.")
+            ordered.append(ready[0])
+            done.add(ready[0].name)
+        return ordered
+
+    def _stored_version(self):
+        """Return the code version of the run directory's checkpoints, or None."""
+        try:
+            with open(os.path.join(self.run_directory, VERSION_FILE)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _checkpoint_path(self, name):
+        return os.path.join(self.run_directory, f'{name}.pkl')
+
+    def _write_checkpoint(self, name, output):
+        """Pickle the output next to its final path and rename it, so a crash never leaves half a checkpoint."""
+        path = self._checkpoint_path(name)
+        temporary_path = f'{path}.tmp-{os.getpid()}'
+        with open(temporary_path, 'wb') as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    def _read_checkpoint(self, name):
+        with open(self._checkpoint_path(name), 'rb') as f:
+            return pickle.load(f)
+
+    def _remove_other_runs(self):
+        """Delete the checkpoint directories of other run dates."""
+        for entry in os.listdir(self.checkpoint_directory):
+            try:
+                datetime.date.fromisoformat(entry)
+            except ValueError:
+                continue  # Not a run directory
+            if entry != self.run_date:
+                shutil.rmtree(os.path.join(self.checkpoint_directory, entry), ignore_errors=True)
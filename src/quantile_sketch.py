@@ -0,0 +1,143 @@
+import math
+import numpy as np
+
+
+class TDigest:
+    """
+    A mergeable t-digest sketch for estimating percentiles of a stream of values.
+
+    Values are collected in a small buffer and merged into a bounded number of weighted
+    centroids when the buffer is full, so adding a value costs O(1) amortized and the
+    sketch never grows with the history. Two sketches can be merged into one that
+    describes both streams, and any percentile can be queried without the raw values.
+
+    Methods:
+    add(value, weight=1): Adds a single value to the sketch.
+    update(values): Adds many values to the sketch.
+    merge(other): Merges another sketch into this one.
+    quantile(q): Estimates the q-quantile (0-1) of all values added so far.
+    percentile(p): Estimates the p-th percentile (0-100) of all values added so far.
+    to_dict(): Serializes the sketch to a JSON-compatible dict.
+    from_dict(data): Creates a sketch from a dict made by to_dict().
+    """
+
+    def __init__(self, compression=100, buffer_size=None):
+        self.compression = compression
+        self.buffer_size = buffer_size if buffer_size else 5 * compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        """Add a single value to the sketch, missing and infinite values are ignored."""
+        if value is None or not math.isfinite(value):
+            return
+        self._buffer.append((float(value), float(weight)))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def update(self, values):
+        """Add many values to the sketch."""
+        for value in np.asarray(values, dtype='float64').ravel():
+            self.add(value)
+
+    def merge(self, other):
+        """Merge another sketch into this one."""
+        other._compress()
+        self._buffer.extend(zip(other.means.tolist(), other.weights.tolist()))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0-1), interpolating linearly between centroids like np.percentile."""
+        self._compress()
+        if self.count == 0:
+            return np.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+
+        # Centroid centres on the cumulative weight axis, with the exact min and max as end points
+        centres = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0.0], centres, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        target = q * (self.count - 1) + 0.5
+        return float(np.interp(target, positions, values))
+
+    def percentile(self, p):
+        """Estimate the p-th percentile (0-100)."""
+        return self.quantile(p / 100)
+
+    def to_dict(self):
+        """Serialize the sketch to a JSON-compatible dict."""
+        self._compress()
+        return {
+            'compression': self.compression,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a sketch from a dict made by to_dict()."""
+        digest = cls(compression=data['compression'])
+        digest.means = np.asarray(data['means'], dtype='float64')
+        digest.weights = np.asarray(data['weights'], dtype='float64')
+        digest.count = data['count']
+        if digest.count:
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
+
+    def _scale(self, q):
+        """The k1 scale function, which keeps centroids small near the tails."""
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _inverse_scale(self, k):
+        """Inverse of the k1 scale function."""
+        return (math.sin(min(max(k * 2 * math.pi / self.compression, -math.pi / 2), math.pi / 2)) + 1) / 2
+
+    def _compress(self):
+        """Merge the buffered values into the centroids."""
+        if not self._buffer:
+            return
+
+        buffered = np.asarray(self._buffer, dtype='float64')
+        self._buffer = []
+        means = np.concatenate([self.means, buffered[:, 0]])
+        weights = np.concatenate([self.weights, buffered[:, 1]])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order].tolist(), weights[order].tolist()
+
+        total = sum(weights)
+        merged_means, merged_weights = [], []
+        current_mean, current_weight = means[0], weights[0]
+        weight_so_far = 0.0
+        weight_limit = total * self._inverse_scale(self._scale(0.0) + 1)
+
+        for mean, weight in zip(means[1:], weights[1:]):
+            if weight_so_far + current_weight + weight <= weight_limit:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                weight_so_far += current_weight
+                merged_means.append(current_mean)
+                merged_weights.append(current_weight)
+                weight_limit = total * self._inverse_scale(self._scale(weight_so_far / total) + 1)
+                current_mean, current_weight = mean, weight
+
+        merged_means.append(current_mean)
+        merged_weights.append(current_weight)
+        self.means = np.asarray(merged_means)
+        self.weights = np.asarray(merged_weights)
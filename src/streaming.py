@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import pandas as pd
+from src.data_fetcher import FetchedDataProcessor, POOL_SIZE
+from src.data_cleaner import PerformCleaning
+from src.data_analyzer import PerformCalculations
+from src.instrumentation import instrumented
+
+
+# Set up logger for the streaming module
+logger = logging.getLogger('streaming_logger')
+logger.setLevel(logging.INFO)
+
+QUEUE_SIZE = 2 * POOL_SIZE  # Downloaded exports waiting for the worker before the fetch threads block
+_END = object()  # Put on the queue by the producer after the last export
+
+
+class StreamingPipeline:
+    """
+    Processes every export as soon as it is downloaded, while the next ones are still downloading.
+
+    The fetch backend is the producer: its fetch threads put each finished export on a bounded queue.
+    A single worker takes the exports off the queue in the order they finished and hands them to
+    process_asset(crypto, new_rows), so the run ends shortly after the last download instead of
+    after the last download plus the processing of all assets. Because there is one worker,
+    process_asset may update shared state such as the indicator state without locking.
+
+    Methods:
+    run(): Fetches and processes all exports and returns (combined rows or None, crypto names).
+    """
+
+    def __init__(self, loader, process_asset, queue_size=QUEUE_SIZE):
+        self.loader = loader
+        self.process_asset = process_asset
+        self.queue_size = queue_size
+        self.processed = []  # Names of the cryptocurrencies in the order they were processed
+
+    @instrumented()
+    def run(self):
+        """Run the fetch threads and the worker until every export is processed."""
+        exports = queue.Queue(maxsize=self.queue_size)
+        producer_result = {}
+
+        def produce():
+            try:
+                producer_result['names'] = self.loader.stream_exports(lambda crypto, export: exports.put((crypto, export)))
+            except Exception as e:
+                producer_result['error'] = e
+            finally:
+                exports.put(_END)
+
+        # The worker runs on the calling thread, so its stages are recorded by the instrumentation
+        producer = threading.Thread(target=produce, name='stream-fetch', daemon=True)
+        producer.start()
+        frames = self._consume(exports)
+        producer.join()
+
+        if 'error' in producer_result:
+            logger.error(f"Fetching stopped after {len(self.processed)} processed exports: {producer_result['error']}")
+            raise producer_result['error']
+
+        if not frames:
+            logger.warning("No data processed from the streamed exports.")
+            return None, producer_result['names']
+
+        # Combine in the order of the loader's cryptos, like the batch fetch, not in the order the downloads finished
+        combined_df = pd.concat([frames[crypto] for crypto in self.loader.cryptos if crypto in frames], ignore_index=True)
+        logger.info(f"Processed {len(combined_df)} rows of {len(frames)} cryptocurrencies while fetching.")
+        return combined_df, producer_result['names']
+
+    def _consume(self, exports):
+        """Read and process the queued exports until the producer is done, return the processed frame per crypto."""
+        frames = {}
+        while True:
+            item = exports.get()
+            if item is _END:
+                return frames
+            crypto, export = item
+            # A failing asset is logged and skipped so it cannot stall the fetch threads on a full queue
+            try:
+                new_rows = self.loader.read_export(crypto, export)
+                if new_rows is None or new_rows.empty:
+                    logger.warning(f"No new rows for {crypto}.")
+                    continue
+                result = self.process_asset(crypto, new_rows)
+            except Exception as e:
+                logger.error(f"Error processing the export of {crypto}: {e}")
+                continue
+            if result is not None and not result.empty:
+                frames[crypto] = result
+                self.processed.append(crypto)
+                logger.info(f"Processed {crypto} with {exports.qsize()} exports waiting.")
+
+
+class IncrementalAssetProcessor:
+    """
+    Transforms, cleans and calculates the new rows of one cryptocurrency at a time.
+
+    The calculations continue from the indicator states and add to the threshold sketches,
+    which are all advanced asset by asset and saved by the caller after the run. Without a
+    rolling indicator state, the first asset loads it from the database.
+
+    Methods:
+    __call__(crypto, new_rows): Returns the calculated new rows of the cryptocurrency, or None.
+    """
+
+    def __init__(self, state, sketches, db_handler, indicator_state=None, compact=False):
+        self.state = state
+        self.sketches = sketches
+        self.indicator_state = indicator_state
+        self.db_handler = db_handler
+        self.compact = compact
+
+    def __call__(self, crypto, new_rows):
+        """Return the calculated new rows of the cryptocurrency, or None."""
+        transformed = FetchedDataProcessor.transform_csv(new_rows)
+        cleaned = PerformCleaning(transformed, compact=self.compact).clean_all()
+        if cleaned is None or cleaned.empty:
+            return None
+
+        processor = PerformCalculations(cleaned, db_handler=self.db_handler, compact=self.compact)
+        processor.threshold_sketches = self.sketches
+        processor.indicator_state = self.indicator_state
+        result = processor.calculate_newdata(cleaned, state=self.state)
+        self.indicator_state = processor.indicator_state
+        return result
@@ -0,0 +1,58 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from tests.helpers import fixture_csv
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class CoinCodexStandIn(BaseHTTPRequestHandler):
+    """Serves the historical data fixture page and CSV exports like the CoinCodex website."""
+
+    def do_GET(self):
+        page = re.fullmatch(r'/crypto/([\w-]+)/historical-data/', self.path)
+        export = re.fullmatch(r'/exports/([\w-]+?)_[\d-]+_[\d-]+\.csv', self.path)
+        if page:
+            crypto = page.group(1)
+            with open(os.path.join(FIXTURE_DIR, 'historical_data.html'), encoding='utf-8') as f:
+                body = f.read().format(crypto=crypto, export_path=self.server.export_path(crypto)).encode()
+            self._respond(body, 'text/html')
+        elif export:
+            time.sleep(self.server.export_delay)  # Stands in for generating the export
+            self.server.export_count += 1
+            self._respond(fixture_csv(export.group(1)).encode(), 'text/csv',
+                          {'Content-Disposition': f'attachment; filename="{os.path.basename(self.path)}"'})
+        else:
+            self.send_error(404)
+
+    def _respond(self, body, content_type, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the test output clean
+
+
+@pytest.fixture
+def coincodex_server():
+    """A local stand-in for the CoinCodex website, yields the server with its base_url."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CoinCodexStandIn)
+    server.export_delay = 0.0
+    server.export_count = 0
+    server.export_path = lambda crypto: f"/exports/{crypto}_2020-01-01_{datetime.now().strftime('%Y-%m-%d')}.csv"
+    server.base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
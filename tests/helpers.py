@@ -0,0 +1,13 @@
+from datetime import datetime, timedelta
+
+
+def fixture_csv(crypto, days=5):
+    """CSV export of a cryptocurrency as served by the stand-in server, the last row is yesterday."""
+    seed = sum(ord(c) for c in crypto)
+    lines = ['Start,End,Open,High,Low,Close,Volume,Market Cap']
+    for offset in range(days, 0, -1):
+        day = (datetime.now() - timedelta(days=offset)).strftime('%Y-%m-%d')
+        next_day = (datetime.now() - timedelta(days=offset - 1)).strftime('%Y-%m-%d')
+        price = seed + offset
+        lines.append(f'{day},{next_day},{price},{price + 2},{price - 1},{price + 1},{seed * 1000 + offset},{seed * 100000 + offset}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,29 @@
+import pandas as pd
+import pytest
+from benchmarks import suite
+from benchmarks.synthetic import generate_ohlcv, write_csv_exports
+from src.data_loader import DataLoader, DataAggregator
+
+
+def test_csv_exports_load_like_the_downloads(tmp_path):
+    """Test that the synthetic exports are read back by DataLoader with the generated values."""
+    df = generate_ohlcv(n_assets=2, n_days=3)
+    write_csv_exports(df, str(tmp_path))
+
+    loaded = DataAggregator.aggregate_data(DataLoader(str(tmp_path)).load_csv_files())
+    loaded = loaded.sort_values(['CryptocurrencyName', 'Date']).reset_index(drop=True)
+
+    assert loaded['CryptocurrencyName'].tolist() == df['CryptocurrencyName'].tolist()
+    assert pd.to_datetime(loaded['Date']).tolist() == df['Date'].tolist()
+    assert loaded['Close'].tolist() == pytest.approx(df['Close'].tolist())
+
+
+def test_suite_results_and_comparison():
+    """Test that every benchmark gives one result per size and that a run compares against itself."""
+    results = suite.run(['2x10', '3x10'], repeat=1)
+
+    names = {result['benchmark'] for result in results['results']}
+    assert len(results['results']) == 2 * len(names)
+    assert {'DataLoader.load_csv_files', 'DataAggregator.aggregate_data', 'DataCleaner.clean_data', 'DataFormatter.format_data',
+            'DatabaseHandler.save_to_database', 'DatabaseHandler.bulk_write', 'DataAnalyzer.calculate_vwap'} <= names
+    assert all(ratio == 1.0 for *_, ratio in suite.compare(results, results))
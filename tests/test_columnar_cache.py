@@ -0,0 +1,78 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_ohlcv
+from src.columnar_cache import ColumnarCache
+from src.database_handler import DatabaseHandler
+
+
+@pytest.fixture
+def db_handler(tmp_path):
+    """DatabaseHandler with a synthetic OHLCV table."""
+    handler = DatabaseHandler(str(tmp_path / 'test.db'))
+    handler.save_to_database(generate_ohlcv(n_assets=3, n_days=50), 'ohlcv_marketcap_data', mode='replace')
+    yield handler
+    handler.close()
+
+
+class TestColumnarCache:
+
+    def test_load_matches_database(self, db_handler):
+        """Test that the cached table has the same rows as the database."""
+        expected = db_handler.execute_query("SELECT * FROM ohlcv_marketcap_data ORDER BY CryptocurrencyName, Date")
+        expected['Date'] = pd.to_datetime(expected['Date'])
+        numeric = expected.columns.drop(['CryptocurrencyName', 'Date'])
+        expected[numeric] = expected[numeric].astype('float64')  # All-NULL columns are read as object
+
+        result = ColumnarCache(db_handler).load()
+
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_single_crypto_is_a_view_on_the_mapped_files(self, db_handler):
+        """Test that selecting one crypto and some columns returns read-only views without copying."""
+        result = ColumnarCache(db_handler).load(cryptos=['asset-00001'], columns=['Close'])
+
+        assert list(result.columns) == ['CryptocurrencyName', 'Date', 'Close']
+        assert result['CryptocurrencyName'].unique().tolist() == ['asset-00001']
+        assert len(result) == 50
+        assert not result['Close'].to_numpy().flags.writeable
+        assert isinstance(result['Close'].to_numpy().base, np.memmap)
+
+    def test_rebuilt_only_when_the_table_changes(self, db_handler, tmp_path):
+        """Test that the cache is reused until a write changes the table's version."""
+        cache = ColumnarCache(db_handler)
+        first = cache.refresh()
+        assert cache.refresh() == first
+
+        update = db_handler.execute_query(
+            "SELECT * FROM ohlcv_marketcap_data WHERE CryptocurrencyName = 'asset-00000' ORDER BY Date DESC LIMIT 1"
+        )
+        update['Close'] = 1234.5
+        db_handler.upsert_rows(update)
+
+        second = cache.refresh()
+        assert second != first
+        assert os.listdir(cache.cache_directory) == [os.path.basename(second)]  # The old version is removed
+        latest = cache.load(cryptos=['asset-00000'])
+        assert latest['Close'].iloc[-1] == 1234.5
+
+    def test_new_database_never_reuses_a_cache(self, tmp_path):
+        """Test that a recreated database at the same path gets a new version tag."""
+        path = str(tmp_path / 'recreated.db')
+        tags = []
+        for _ in range(2):
+            handler = DatabaseHandler(path)
+            handler.save_to_database(generate_ohlcv(n_assets=1, n_days=5), 'ohlcv_marketcap_data', mode='replace')
+            tags.append(handler.get_table_version())
+            handler.close()
+            os.remove(path)
+
+        assert tags[0] != tags[1]
+        assert tags[0].endswith('-1') and tags[1].endswith('-1')
+
+    def test_missing_table(self, tmp_path):
+        """Test that an empty DataFrame is returned when there is no table."""
+        handler = DatabaseHandler(str(tmp_path / 'empty.db'))
+        assert ColumnarCache(handler).load().empty
+        handler.close()
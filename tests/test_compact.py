@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_ohlcv, write_csv_exports
+from src.compact import COMPACT_DTYPES, to_compact, frame_memory, memory_report
+from src.data_analyzer import DataAnalyzer
+from src.data_cleaner import DataCleaner
+from src.data_source import MasterDataLoader
+from src.database_handler import DatabaseHandler
+
+
+FLOAT32_COLUMNS = [column for column, dtype in COMPACT_DTYPES.items() if dtype == 'float32']
+
+
+@pytest.fixture(autouse=True)
+def clean_report():
+    """Start every test with an empty memory report."""
+    memory_report.reset()
+    yield
+    memory_report.reset()
+
+
+def analyze(df, compact):
+    """Run the master data calculations and return the DataFrame and its thresholds."""
+    analyzer = DataAnalyzer(df.copy(), compact=compact)
+    analyzer.calculate_typical_price()
+    analyzer.calculate_vwap()
+    thresholds = analyzer.determine_thresholds()
+    analyzer.calculate_price_change()
+    analyzer.clean_data()
+    return analyzer.df, thresholds
+
+
+class TestCompact:
+
+    def test_to_compact_types(self):
+        """Test that names become categories, dates datetime64, volumes float32 and pd.NA in object columns NaN."""
+        df = pd.DataFrame({
+            'CryptocurrencyName': ['bitcoin', 'bitcoin', 'ethereum'],
+            'Date': ['2024-10-06', '2024-10-07', '2024-10-07'],
+            'Close': [1.0, 2.0, 3.0],
+            'Volume': [10.0, 20.0, 30.0],
+            'Market Cap': pd.Series([100.0, pd.NA, 300.0], dtype='object'),
+        })
+
+        result = to_compact(df)
+
+        assert isinstance(result['CryptocurrencyName'].dtype, pd.CategoricalDtype)
+        assert result['Date'].dtype == 'datetime64[ns]'
+        assert result['Close'].dtype == 'float64'
+        assert result['Volume'].dtype == 'float32'
+        assert result['Market Cap'].dtype == 'float64'
+        assert np.isnan(result['Market Cap'].iloc[1])
+        assert to_compact(result) is result  # Nothing left to convert
+
+    def test_cleaner_keeps_float_columns(self):
+        """Test that the cleaned columns are floats with NaN instead of object columns with pd.NA."""
+        df = generate_ohlcv(n_assets=2, n_days=10)
+        df.loc[3, 'Market Cap'] = -1
+        df.loc[4, 'Volume'] = 0
+
+        cleaned = DataCleaner(df.copy()).clean_data()
+        compact = DataCleaner(df.copy(), compact=True).clean_data()
+
+        assert cleaned['Market Cap'].dtype == 'float64'
+        assert cleaned['Market Cap'].isna().sum() == 1
+        assert compact['Market Cap'].dtype == 'float64'
+        assert isinstance(compact['CryptocurrencyName'].dtype, pd.CategoricalDtype)
+        assert compact['Volume'].dtype == 'float32'
+        assert compact['Volume'].tolist() == cleaned['Volume'].astype('float32').tolist()
+
+    def test_analyzer_results_match(self):
+        """Test that the compact calculations give the same prices and match the rest within float32 precision."""
+        df = generate_ohlcv(n_assets=5, n_days=60)
+
+        expected, expected_thresholds = analyze(df, compact=False)
+        result, thresholds = analyze(df, compact=True)
+
+        assert isinstance(result['CryptocurrencyName'].dtype, pd.CategoricalDtype)
+        assert result[FLOAT32_COLUMNS].dtypes.eq('float32').all()
+        exact = ['Open', 'High', 'Low', 'Close', 'Market Cap', 'Typical_Price']
+        pd.testing.assert_frame_equal(result[exact], expected[exact], check_exact=True)
+        np.testing.assert_allclose(result[FLOAT32_COLUMNS + ['VWAP']], expected[FLOAT32_COLUMNS + ['VWAP']],
+                                   rtol=1e-5, atol=1e-4)  # Changes are shown with four decimals
+        for column, crypto_thresholds in expected_thresholds.items():
+            assert thresholds[column] == pytest.approx(crypto_thresholds, rel=1e-5)
+        assert frame_memory(result) < frame_memory(expected)
+
+    def test_memory_report(self):
+        """Test that the compact stages record the memory they saved."""
+        analyze(generate_ohlcv(n_assets=5, n_days=60), compact=True)
+
+        summary = memory_report.summary()
+
+        assert summary['stage'].tolist() == ['DataAnalyzer', 'DataAnalyzer.calculate_price_change']
+        assert (summary['saved_bytes'] > 0).all()
+        assert (summary['after_bytes'] == summary['before_bytes'] - summary['saved_bytes']).all()
+
+    def test_saved_master_data_is_float64(self, tmp_path):
+        """Test that compact mode saves float64 columns, with the prices and market caps unchanged."""
+        df = generate_ohlcv(n_assets=3, n_days=30)
+        df.loc[0, 'Market Cap'] = 1_234_567_890_123.0  # Not representable as float32
+        write_csv_exports(df, str(tmp_path / 'csv'))
+
+        saved = {}
+        for compact in (False, True):
+            db_path = str(tmp_path / f'compact-{compact}.db')
+            MasterDataLoader(str(tmp_path / 'csv'), db_path, compact=compact)
+            db_handler = DatabaseHandler(db_path)
+            saved[compact] = db_handler.query()
+            db_handler.close()
+
+        assert saved[True].select_dtypes('number').dtypes.eq('float64').all()
+        exact = ['CryptocurrencyName', 'Date', 'Open', 'High', 'Low', 'Close', 'Market Cap', 'Typical_Price']
+        pd.testing.assert_frame_equal(saved[True][exact], saved[False][exact], check_exact=True)
+        pd.testing.assert_frame_equal(saved[True], saved[False], check_exact=False, rtol=1e-5, atol=1e-4)
+        assert 1_234_567_890_123.0 in saved[True]['Market Cap'].tolist()
@@ -1,6 +1,12 @@
+import numpy as np
 import pandas as pd
 import pytest
-from src.data_analyzer import DataAnalyzer
+from src.data_analyzer import DataAnalyzer, PerformCalculations, IndicatorState, ThresholdSketches
+from src.database_handler import DatabaseHandler
+from src.indicators import IndicatorEngine, RollingIndicatorState
+
+# Windows short enough for the five rows of the mock data
+SHORT_WINDOWS = {'sma': (2,), 'ema': (2,), 'rsi': (1,), 'bollinger': (2,), 'atr': (2,)}
 
 @pytest.fixture
 def mock_dataframe():
@@ -109,4 +115,140 @@ def test_detect_large_changes(mock_dataframe):
     # Assert that 3 rows have large changes (threshold set at 5%)
     assert len(large_changes) == 3
         
- 
\ No newline at end of file
+ 
+
+def test_calculate_incremental_matches_full_recalculation(mock_dataframe, tmp_path):
+    """Test that calculating only the new rows gives the same result as recalculating everything."""
+    df = mock_dataframe.copy()
+    df.loc[2, 'CryptocurrencyName'] = 'ethereum'
+    processor = PerformCalculations(df.copy(), db_handler=DatabaseHandler(str(tmp_path / 'test.db')))
+    processor.threshold_sketches = ThresholdSketches.from_history(df.copy())
+
+    full_analyzer = DataAnalyzer(df.copy())
+    full_analyzer.calculate_typical_price()
+    full_analyzer.calculate_vwap()
+    full_analyzer.calculate_price_change()
+    full_analyzer.clean_data()
+    full_analyzer.calculate_indicators(IndicatorEngine(SHORT_WINDOWS))
+    expected = full_analyzer.df.loc[[1, 4]]
+
+    history = DataAnalyzer(df.drop(index=[1, 4]))
+    history.calculate_typical_price()
+    history_totals = pd.DataFrame({
+        'Cumulative_Volume': history.df.groupby('CryptocurrencyName')['Volume'].sum(),
+        'Cumulative_TPV': (history.df['Typical_Price'] * history.df['Volume']).groupby(history.df['CryptocurrencyName']).sum(),
+    })
+    history_tail = df.loc[[0, 3], ['Date', 'CryptocurrencyName', 'Open', 'High', 'Low', 'Close', 'Volume']]
+
+    processor.indicator_engine = IndicatorEngine(SHORT_WINDOWS)
+    processor.indicator_state = RollingIndicatorState(processor.indicator_engine)
+    processor.indicator_engine.calculate(df.drop(index=[1, 4]), processor.indicator_state)
+
+    result = processor.calculate_incremental(df.loc[[1, 4]], history_tail, history_totals)
+
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        expected[result.columns].reset_index(drop=True),
+        check_dtype=False
+    )
+
+
+def test_calculate_newdata_with_state_matches_full_recalculation(mock_dataframe, tmp_path):
+    """Test that extending the indicator state gives the same rows as recalculating the full history."""
+    df = mock_dataframe.copy()
+    processor = PerformCalculations(df.copy(), db_handler=DatabaseHandler(str(tmp_path / 'test.db')))
+    processor.threshold_sketches = ThresholdSketches.from_history(df.copy())
+
+    full_analyzer = DataAnalyzer(df.copy())
+    full_analyzer.calculate_typical_price()
+    full_analyzer.calculate_vwap()
+    full_analyzer.calculate_price_change()
+    full_analyzer.clean_data()
+    full_analyzer.calculate_indicators(IndicatorEngine(SHORT_WINDOWS))
+    expected = full_analyzer.df.loc[[2, 4]]
+
+    state = IndicatorState.from_history(df.drop(index=[2, 4]))
+    processor.indicator_engine = IndicatorEngine(SHORT_WINDOWS)
+    processor.indicator_state = RollingIndicatorState(processor.indicator_engine)
+    processor.indicator_engine.calculate(df.drop(index=[2, 4]), processor.indicator_state)
+    result = processor.calculate_newdata(df.loc[[2, 4]], state=state)
+
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True),
+        expected[result.columns].reset_index(drop=True),
+        check_dtype=False,
+        check_exact=True
+    )
+
+    # The advanced state matches a state built from the full history
+    rebuilt = IndicatorState.from_history(full_analyzer.df)
+    pd.testing.assert_frame_equal(state.state_df, rebuilt.state_df, check_dtype=False, check_exact=True)
+
+    # Rows already in the state are not calculated twice
+    assert processor.calculate_newdata(df.loc[[2, 4]], state=state) is None
+
+
+def test_full_recalculation_rebuilds_threshold_sketches(mock_dataframe, tmp_path):
+    """Test that recalculating the full history builds the sketches from it when none are stored."""
+    df = mock_dataframe.copy()
+    df['Date'] = pd.Timestamp.now().normalize() - pd.to_timedelta([4, 3, 2, 1, 0], unit='D')
+    processor = PerformCalculations(df.copy(), db_handler=DatabaseHandler(str(tmp_path / 'test.db')))
+
+    result = processor.calculate_newdata(df.copy())
+
+    assert len(result) == len(df)
+    assert processor.threshold_sketches.thresholds(98) == ThresholdSketches.from_history(df).thresholds(98)
+
+
+def test_thresholds_match_per_crypto_percentiles(mock_dataframe):
+    """Test that the grouped thresholds equal np.percentile over each crypto's percentage changes."""
+    analyzer = DataAnalyzer(mock_dataframe.copy())
+    thresholds = analyzer.determine_thresholds(percentile=90)
+
+    for crypto, crypto_df in mock_dataframe.groupby('CryptocurrencyName'):
+        for column in ['Open', 'High', 'Low', 'Close', 'Volume']:
+            expected = np.percentile((crypto_df[column].pct_change() * 100).dropna(), 90)
+            assert thresholds[f'{column}_Pct_Change'][crypto] == pytest.approx(expected)
+
+
+def test_calculate_vwap_per_crypto(mock_dataframe):
+    """Test that the grouped VWAP equals the cumulative VWAP of each crypto on its own."""
+    analyzer = DataAnalyzer(mock_dataframe.copy())
+    analyzer.calculate_typical_price()
+    df_with_vwap = analyzer.calculate_vwap()
+
+    for _, crypto_df in df_with_vwap.groupby('CryptocurrencyName'):
+        expected = (crypto_df['Typical_Price'] * crypto_df['Volume']).cumsum() / crypto_df['Volume'].cumsum()
+        pd.testing.assert_series_equal(crypto_df['VWAP'], expected, check_names=False)
+
+
+def test_threshold_sketches_match_exact_thresholds(mock_dataframe, tmp_path):
+    """Test that the sketches give the exact thresholds while they hold few values, and survive a save and load."""
+    expected = DataAnalyzer(mock_dataframe.copy()).determine_thresholds(percentile=98)
+    sketches = ThresholdSketches.from_history(mock_dataframe)
+
+    db_handler = DatabaseHandler(str(tmp_path / 'test.db'))
+    sketches.save(db_handler)
+    thresholds = ThresholdSketches.load(db_handler).thresholds(98)
+
+    for column, crypto_thresholds in expected.items():
+        for crypto, threshold in crypto_thresholds.items():
+            assert thresholds[column][crypto] == pytest.approx(threshold)
+
+
+def test_threshold_sketches_update(mock_dataframe):
+    """Test that the daily changes of new rows are added to the sketches."""
+    sketches = ThresholdSketches.from_history(mock_dataframe.iloc[:3])
+    new_rows = pd.DataFrame({
+        'CryptocurrencyName': ['bitcoin'],
+        'Open_Daily_Pct_Change': [50.0],
+        'High_Daily_Pct_Change': [50.0],
+        'Low_Daily_Pct_Change': [50.0],
+        'Close_Daily_Pct_Change': [50.0],
+        'Volume_Pct_Change': [50.0],
+    })
+
+    sketches.update(new_rows)
+
+    assert sketches.sketches[('bitcoin', 'Open')].count == 3
+    assert sketches.thresholds(100)['Open_Pct_Change']['bitcoin'] == 50.0
@@ -1,6 +1,6 @@
 import pandas as pd
 import pytest
-from src.data_cleaner import DataCleaner
+from src.data_cleaner import DataCleaner, DataFormatter, PerformCleaning
 
 @pytest.fixture
 def sample_data():
@@ -54,6 +54,39 @@ class TestDataCleaner:
         assert volume_na_count == 1  # One row set to NA in 'Volume'
         assert forward_fill_count == 1  # One row forward filled in 'Volume'
 
+    def test_duplicates_by_key_keep_last(self):
+        """Test that rows with the same crypto and date are reduced to the last one, before forward filling."""
+        df = pd.DataFrame({
+            'Date': ['2024-10-08', '2024-10-07', '2024-10-08'],
+            'CryptocurrencyName': ['bitcoin', 'bitcoin', 'bitcoin'],
+            'Open': [1.0, 2.0, 3.0], 'High': [1.0, 2.0, 3.0], 'Low': [1.0, 2.0, 3.0], 'Close': [1.0, 2.0, 3.0],
+            'Volume': [500.0, 100.0, 0.0],
+            'Market Cap': [10.0, 20.0, 30.0],
+        })
+        cleaner = DataCleaner(df)
+
+        cleaned = cleaner.clean_data()
+
+        assert cleaned['Date'].dt.strftime('%Y-%m-%d').tolist() == ['2024-10-07', '2024-10-08']
+        assert cleaned['Open'].tolist() == [2.0, 3.0]
+        assert cleaned['Volume'].tolist() == [100.0, 100.0]  # Filled from the previous day, not the dropped duplicate
+
+    def test_quality_report(self, sample_data):
+        """Test the counts per rule and per crypto of the quality report."""
+        cleaner = PerformCleaning(sample_data)
+        cleaner.clean_all()
+
+        report = cleaner.quality_report.to_dict()
+
+        assert report['rows_in'] == 3
+        assert report['rows_out'] == 3
+        assert report['totals']['non_positive_Market Cap'] == 2
+        assert report['totals']['non_positive_Volume'] == 1
+        assert report['totals']['volume_forward_filled'] == 1
+        assert report['totals']['duplicate_key'] == 0
+        assert report['per_asset']['bitcoin'] == {'non_positive_Market Cap': 1, 'non_positive_Volume': 1, 'volume_forward_filled': 1}
+        assert report['per_asset']['ethereum'] == {'non_positive_Market Cap': 1}
+
     def test_check_and_convert_formats(self, sample_data):
         """Test the check_and_convert_formats method."""
         cleaner = DataCleaner(sample_data)
@@ -64,3 +97,40 @@ class TestDataCleaner:
         cleaner.check_and_convert_formats()
         assert pd.api.types.is_numeric_dtype(cleaner.df['Volume'])  # Should be converted to numeric
 
+
+
+class TestDataFormatter:
+
+    def test_format_data_does_not_mutate(self):
+        """Test that formatting returns formatted text and leaves the numeric input unchanged."""
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(['2024-10-07', '2024-10-08']),
+            'Close': [105.123456, float('nan')],
+            'Volume': [1000, 2000],
+            'Close_Daily_Pct_Change': [1.5, -2.25],
+            'CryptocurrencyName': ['bitcoin', 'bitcoin'],
+        })
+        original = df.copy()
+
+        formatted = DataFormatter().format_data(df)
+
+        pd.testing.assert_frame_equal(df, original)
+        assert formatted['Close'].tolist() == ['105.1235', 'nan']
+        assert formatted['Volume'].tolist() == ['1000.0000', '2000.0000']
+        assert formatted['Close_Daily_Pct_Change'].tolist() == ['1.5000%', '-2.2500%']
+        assert formatted['Date'].tolist() == ['2024-10-07', '2024-10-08']
+
+    def test_text_columns_are_skipped(self):
+        """Test that a text column is left as it is and the other columns are still formatted."""
+        df = pd.DataFrame({
+            'Date': ['2024-10-07'],
+            'Open': ['n/a'],
+            'Close': [105.0],
+            'Open_Daily_Pct_Change': [0.5],
+        })
+
+        formatted = DataFormatter().format_data(df)
+
+        assert formatted['Open'].tolist() == ['n/a']
+        assert formatted['Close'].tolist() == ['105.0000']
+        assert formatted['Open_Daily_Pct_Change'].tolist() == ['0.5000%']
@@ -1,7 +1,16 @@
+import os
+import re
+import threading
+import time
 import pytest 
 import pandas as pd
 import logging
-from src.data_fetcher import NewDataLoader  # Adjust this import if necessary
+from urllib.parse import urljoin
+from urllib.request import urlopen
+from selenium.common.exceptions import NoSuchElementException
+from tests.helpers import fixture_csv
+from main import build_stages
+from src.data_fetcher import CRYPTOS, NewDataLoader, HttpDataLoader, FetchedDataProcessor, DownloadWatcher, read_csv_tail, create_fetch_backend  # Adjust this import if necessary
 
 # Set up logging for the tests
 logging.basicConfig(level=logging.INFO)
@@ -50,5 +59,240 @@ class TestCryptoDataLoader:
 
         assert cleaned_data.shape[1] == 7  # Should have 7 columns: 'Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Market_Cap'
 
+
+
+class FakeElement:
+    """Stand-in for a WebElement of the export button."""
+
+    def __init__(self, href):
+        self.href = href
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+
+class FakeDriver:
+    """Minimal stand-in for a WebDriver: loads pages over HTTP and downloads the export when it is clicked."""
+
+    def __init__(self, download_dir):
+        self.download_dir = download_dir
+        self.url = None
+        self.page = ''
+        self.closed = False
+
+    def get(self, url):
+        self.url = url
+        self.page = urlopen(url).read().decode()
+
+    def find_element(self, by, value):
+        match = re.search(r'data-href="([^"]+)"', self.page)
+        if not match:
+            raise NoSuchElementException(value)
+        return FakeElement(urljoin(self.url, match.group(1)))
+
+    def execute_script(self, script, element):
+        if 'click' in script:
+            with urlopen(element.href) as response:
+                data = response.read()
+            with open(os.path.join(self.download_dir, os.path.basename(element.href)), 'wb') as f:
+                f.write(data)
+
+    def quit(self):
+        self.closed = True
+
+
+class TestDriverPool:
+
+    CRYPTOS = ['bitcoin', 'ethereum', 'solana', 'cardano', 'tron', 'ripple']
+
+    def make_loader(self, server, tmp_path, pool_size, drivers):
+        def driver_factory(download_dir):
+            driver = FakeDriver(download_dir)
+            drivers.append(driver)
+            return driver
+        return NewDataLoader(download_folder=str(tmp_path), cryptos=self.CRYPTOS, pool_size=pool_size,
+                             base_url=server.base_url, download_timeout=5, driver_factory=driver_factory)
+
+    def test_process_crypto_data_against_fixture_pages(self, coincodex_server, tmp_path):
+        """Test that every export is downloaded into its worker's directory and combined per crypto."""
+        drivers = []
+        loader = self.make_loader(coincodex_server, tmp_path, pool_size=3, drivers=drivers)
+
+        combined_df, crypto_names = loader.process_crypto_data()
+
+        assert sorted(combined_df['CryptocurrencyName']) == sorted(self.CRYPTOS)
+        assert crypto_names == [crypto.capitalize() for crypto in self.CRYPTOS]
+        for crypto, file_path in loader.downloaded_files.items():
+            assert os.path.basename(file_path).startswith(crypto + '_')
+        assert 1 <= len(drivers) <= 3
+        assert all(driver.closed for driver in drivers)
+        assert len({driver.download_dir for driver in drivers}) == len(drivers)
+
+    def test_pool_runs_exports_concurrently(self, coincodex_server, tmp_path):
+        """Test that wall-clock time shrinks with the pool size."""
+        coincodex_server.export_delay = 0.25
+
+        start = time.perf_counter()
+        self.make_loader(coincodex_server, tmp_path / 'serial', pool_size=1, drivers=[]).process_crypto_data()
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.make_loader(coincodex_server, tmp_path / 'pooled', pool_size=3, drivers=[]).process_crypto_data()
+        pooled_time = time.perf_counter() - start
+
+        assert pooled_time < serial_time * 0.6
+
+
+@pytest.mark.skipif(not os.environ.get('SELENIUM_BROWSER_TESTS'), reason="Set SELENIUM_BROWSER_TESTS=1 to run against a real headless browser.")
+def test_real_browser_against_fixture_pages(coincodex_server, tmp_path):
+    """Test the export flow with a real headless Chrome against the locally served fixture pages."""
+    from selenium import webdriver
+
+    def chrome_factory(download_dir):
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless=new')
+        options.add_experimental_option('prefs', {'download.default_directory': download_dir})
+        return webdriver.Chrome(options=options)
+
+    loader = NewDataLoader(download_folder=str(tmp_path), cryptos=['bitcoin', 'ethereum'], pool_size=2,
+                           base_url=coincodex_server.base_url, download_timeout=30, driver_factory=chrome_factory)
+    combined_df, _ = loader.process_crypto_data()
+
+    assert sorted(combined_df['CryptocurrencyName']) == ['bitcoin', 'ethereum']
+
+
+
+class TestHttpDataLoader:
+
+    CRYPTOS = ['bitcoin', 'ethereum', 'solana']
+
+    def test_same_dataframe_as_selenium_path(self, coincodex_server, tmp_path):
+        """Test that both backends parse and filter the same exports into the same DataFrame.
+
+        The stand-in server serves the exports at an assumed path, so this checks the parsing, not the real endpoint.
+        """
+        export_url = coincodex_server.base_url + '/exports/{crypto}_{start}_{end}.csv'
+        http_df, http_names = HttpDataLoader(cryptos=self.CRYPTOS, export_url=export_url, max_workers=2).process_crypto_data()
+
+        selenium_loader = NewDataLoader(download_folder=str(tmp_path), cryptos=self.CRYPTOS, pool_size=2,
+                                        base_url=coincodex_server.base_url, download_timeout=5, driver_factory=FakeDriver)
+        selenium_df, selenium_names = selenium_loader.process_crypto_data()
+
+        pd.testing.assert_frame_equal(http_df, selenium_df)
+        assert http_names == selenium_names
+        assert FetchedDataProcessor.transform_csv(http_df).columns[0] == 'Date'
+
+    def test_http_backend_needs_export_url(self):
+        """Test that the HTTP backend is not created without an explicit export endpoint."""
+        with pytest.raises(ValueError):
+            create_fetch_backend('http')
+
+    def test_export_url_selects_http_backend(self, coincodex_server):
+        """Test that the fetch stage of main.py downloads over HTTP when it is given an export URL."""
+        export_url = coincodex_server.base_url + '/exports/{crypto}_{start}_{end}.csv'
+        stages = build_stages(db_handler=None, logger=logging.getLogger(__name__), export_url=export_url)
+
+        new_data = stages[0].function()
+
+        assert stages[0].name == 'fetch'
+        assert new_data['CryptocurrencyName'].nunique() == len(CRYPTOS)
+
+    def test_failed_exports_are_skipped(self, coincodex_server):
+        """Test that a crypto whose export fails is left out instead of failing the whole fetch."""
+        export_url = coincodex_server.base_url + '/exports/{crypto}_{start}_{end}.csv'
+        loader = HttpDataLoader(cryptos=['bitcoin', 'not a crypto'], export_url=export_url, max_workers=2)
+
+        combined_df, names = loader.process_crypto_data()
+
+        assert combined_df['CryptocurrencyName'].unique().tolist() == ['bitcoin']
+        assert names == ['Bitcoin']
+
+
+class TestDownloadWatcher:
+
+    def write_download(self, directory, name, chunks=5, delay=0.05):
+        """Write a download like Chromium does: grow a .crdownload file, then rename it."""
+        partial_path = os.path.join(directory, name + '.crdownload')
+        with open(partial_path, 'w') as f:
+            for _ in range(chunks):
+                f.write('Start,End,Open\n')
+                f.flush()
+                time.sleep(delay)
+        os.replace(partial_path, os.path.join(directory, name))
+
+    def test_waits_for_completed_download(self, tmp_path):
+        """Test that the finished file is returned and existing files are ignored."""
+        (tmp_path / 'old_export.csv').write_text('Start\n')
+        watcher = DownloadWatcher(str(tmp_path), timeout=5, poll_interval=0.01).start()
+        writer = threading.Thread(target=self.write_download, args=(str(tmp_path), 'bitcoin_2020-01-01_2024-10-08.csv'))
+
+        start = time.perf_counter()
+        writer.start()
+        result = watcher.wait()
+        elapsed = time.perf_counter() - start
+        writer.join()
+
+        assert os.path.basename(result) == 'bitcoin_2020-01-01_2024-10-08.csv'
+        assert os.path.getsize(result) > 0
+        assert elapsed < 1.0  # Download time plus a couple of polls, not a fixed sleep
+
+    def test_times_out_without_download(self, tmp_path):
+        """Test that None is returned when no download finishes in time."""
+        (tmp_path / 'stuck.csv.crdownload').write_text('Start\n')
+        watcher = DownloadWatcher(str(tmp_path), timeout=0.2, poll_interval=0.01).start()
+        (tmp_path / 'late.csv.part').write_text('Start\n')
+        (tmp_path / 'late.csv').write_text('')
+
+        assert watcher.wait() is None
+
+
+class TestTailReader:
+
+    def write_export(self, tmp_path, days, newest_first=False, name='bitcoin.csv'):
+        """Write a CSV export with a multi-year history, the latest row is yesterday."""
+        header, *rows = fixture_csv('bitcoin', days=days).splitlines()
+        if newest_first:
+            rows.reverse()
+        path = tmp_path / name
+        path.write_text('\n'.join([header, *rows]) + '\n')
+        return str(path)
+
+    def test_read_csv_tail_matches_full_parse(self, tmp_path):
+        """Test that the tail reader returns the same rows as the end of a full parse."""
+        path = self.write_export(tmp_path, days=2000)
+        expected = pd.read_csv(path).tail(7).reset_index(drop=True)
+        result = read_csv_tail(path, n_rows=7, block_size=64)  # Small blocks to cross block boundaries
+
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_read_csv_tail_short_file(self, tmp_path):
+        """Test that a file shorter than n_rows is returned whole."""
+        path = self.write_export(tmp_path, days=3)
+        pd.testing.assert_frame_equal(read_csv_tail(path, n_rows=7), pd.read_csv(path))
+
+    @pytest.mark.parametrize("newest_first", [False, True])
+    def test_filter_rows_by_date_same_as_full_parse(self, tmp_path, newest_first):
+        """Test that yesterday's row is found at either end of the export."""
+        path = self.write_export(tmp_path, days=2000, newest_first=newest_first)
+        full = pd.read_csv(path)
+        expected = full[full['Start'] == NewDataLoader.yesterday()].reset_index(drop=True)
+
+        result = NewDataLoader.filter_rows_by_date(path).reset_index(drop=True)
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_filter_rows_by_date_falls_back_to_full_parse(self, tmp_path):
+        """Test that yesterday's row in the middle of the file is still found."""
+        header, *rows = fixture_csv('bitcoin', days=40).splitlines()
+        rows = rows[-20:] + rows[:-20]  # Yesterday ends up in the middle
+        path = tmp_path / 'bitcoin.csv'
+        path.write_text('\n'.join([header, *rows]) + '\n')
+
+        result = NewDataLoader.filter_rows_by_date(str(path))
+        assert result['Start'].tolist() == [NewDataLoader.yesterday()]
+
+
 if __name__ == "__main__":
-    pytest.main()
\ No newline at end of file
+    pytest.main()
@@ -0,0 +1,140 @@
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_ohlcv
+from src.data_cleaner import DataCleaner
+from src.data_loader import BulkLoader, load_csv_file
+from src.data_analyzer import DataAnalyzer, IndicatorState, ThresholdSketches
+from src.database_handler import DatabaseHandler
+from src.indicators import IndicatorEngine, RollingIndicatorState
+
+
+def write_exports(directory, df, newest_first=()):
+    """Write one CoinCodex style CSV export per cryptocurrency."""
+    for crypto, rows in df.groupby('CryptocurrencyName'):
+        export = pd.DataFrame({
+            'Start': rows['Date'].dt.strftime('%Y-%m-%d'),
+            'End': (rows['Date'] + pd.Timedelta(days=1)).dt.strftime('%Y-%m-%d'),
+            **{column: rows[column] for column in ['Open', 'High', 'Low', 'Close', 'Volume', 'Market Cap']},
+        })
+        if crypto in newest_first:
+            export = export.iloc[::-1]
+        export.to_csv(directory / f'{crypto}_2020-01-01_2020-03-01.csv', index=False)
+
+
+def calculate_in_memory(df):
+    """The calculations of the master data run on the whole dataset at once."""
+    analyzer = DataAnalyzer(df.copy())
+    analyzer.calculate_typical_price()
+    analyzer.calculate_vwap()
+    analyzer.calculate_price_change()
+    analyzer.clean_data()
+    analyzer.calculate_indicators()
+    return DatabaseHandler.to_storage_format(analyzer.df)
+
+
+@pytest.fixture
+def history():
+    """Synthetic history with a few cleaning cases."""
+    df = generate_ohlcv(n_assets=3, n_days=60, seed=7)
+    df.loc[[5, 6, 70], 'Volume'] = 0.0  # Zero volumes are forward filled, also across chunk boundaries
+    df.loc[100, 'Market Cap'] = -1.0
+    return df
+
+
+class TestBulkLoader:
+
+    def test_same_rows_as_in_memory_calculation(self, tmp_path, history):
+        """Test that streaming small chunks in parallel gives the rows of the in-memory pipeline."""
+        write_exports(tmp_path, history, newest_first=('asset-00001',))
+        database_path = str(tmp_path / 'bulk.db')
+
+        rows = BulkLoader(str(tmp_path), database_path, max_workers=2, chunk_size=7).load()
+
+        expected = history.copy()
+        expected['Volume'] = expected['Volume'].where(expected['Volume'] > 0)
+        expected['Volume'] = expected.groupby('CryptocurrencyName')['Volume'].ffill()
+        expected['Market Cap'] = expected['Market Cap'].where(expected['Market Cap'] > 0)
+        cleaned_volume = expected.groupby('CryptocurrencyName')['Volume'].sum()
+        expected = calculate_in_memory(expected)
+
+        db_handler = DatabaseHandler(database_path)
+        stored = db_handler.load_data_from_database('ohlcv_marketcap_data')
+        assert rows == len(history)
+        pd.testing.assert_frame_equal(
+            stored[expected.columns].reset_index(drop=True),
+            expected.sort_values(['CryptocurrencyName', 'Date']).reset_index(drop=True),
+            check_exact=False, rtol=1e-12,
+        )
+
+        # The daily run can continue from the saved state and sketches
+        state = IndicatorState.load(db_handler)
+        assert state.state_df['Date'].eq(history['Date'].max()).all()
+        assert state.get_totals()['Cumulative_Volume'].tolist() == pytest.approx(
+            cleaned_volume.tolist()
+        )
+        assert len(ThresholdSketches.load(db_handler).sketches) == 3 * 5
+        indicator_state = RollingIndicatorState.load(db_handler, IndicatorEngine())
+        assert sorted(indicator_state.state_df.index) == sorted(history['CryptocurrencyName'].unique())
+        assert indicator_state.state_df['Bars'].tolist() == [60, 60, 60]
+        db_handler.close()
+
+    def test_repeated_dates_keep_the_last_row(self, tmp_path, history):
+        """Test that the bulk loader applies the rules of DataCleaner to repeated dates, also across chunks."""
+        asset = history[history['CryptocurrencyName'] == 'asset-00000'].reset_index(drop=True)
+        # Row 3 is repeated within the first chunk of 7 rows, row 6 is repeated as the first row of the second chunk
+        repeated = asset.loc[[3, 6]].assign(Close=lambda rows: rows['Close'] * 2, Volume=0.0)
+        with_repeats = pd.concat([asset.loc[:3], repeated.loc[[3]], asset.loc[4:6], repeated.loc[[6]], asset.loc[7:]])
+        write_exports(tmp_path, with_repeats.reset_index(drop=True))
+        database_path = str(tmp_path / 'bulk.db')
+
+        loader = BulkLoader(str(tmp_path), database_path, max_workers=1, chunk_size=7)
+        rows = loader.load()
+
+        cleaner = DataCleaner(with_repeats.reset_index(drop=True))
+        expected = calculate_in_memory(cleaner.clean_data())
+        stored = DatabaseHandler(database_path).load_data_from_database('ohlcv_marketcap_data')
+        assert rows == len(asset)
+        pd.testing.assert_frame_equal(
+            stored[expected.columns].reset_index(drop=True), expected.reset_index(drop=True),
+            check_exact=False, rtol=1e-12,
+        )
+        assert stored.loc[[3, 6], 'Close'].tolist() == pytest.approx(repeated['Close'].tolist())
+        assert loader.quality_report.totals()['duplicate_key'] == 2
+        assert loader.quality_report.totals() == cleaner.quality_report.totals()
+        assert (loader.quality_report.rows_in, loader.quality_report.rows_out) == (len(with_repeats), len(asset))
+
+    def test_files_of_the_same_cryptocurrency_are_rejected(self, tmp_path, history):
+        """Test that two files whose names give the same cryptocurrency are rejected before loading."""
+        write_exports(tmp_path, history[history['CryptocurrencyName'] == 'asset-00000'])
+        (tmp_path / 'asset-00000_2020-01-01_2020-03-01.csv').rename(tmp_path / 'asset-00000_other.csv')
+        write_exports(tmp_path, history)
+        database_path = tmp_path / 'bulk.db'
+
+        assert BulkLoader(str(tmp_path), str(database_path), max_workers=2).load() == 0
+        assert not database_path.exists()
+
+    def test_failed_file_leaves_no_rows(self, tmp_path, history):
+        """Test that the committed chunks of a file that fails part way are deleted again."""
+        write_exports(tmp_path, history)
+        broken = tmp_path / 'asset-00001_2020-01-01_2020-03-01.csv'
+        lines = broken.read_text().splitlines()
+        lines[30] = lines[30].replace(lines[30].split(',')[2], 'abc', 1)  # The Open of a row in the fifth chunk
+        broken.write_text('\n'.join(lines) + '\n')
+        database_path = str(tmp_path / 'bulk.db')
+
+        rows = BulkLoader(str(tmp_path), database_path, max_workers=2, chunk_size=7).load()
+
+        db_handler = DatabaseHandler(database_path)
+        stored = db_handler.load_data_from_database('ohlcv_marketcap_data')
+        assert rows == 120
+        assert sorted(stored['CryptocurrencyName'].unique()) == ['asset-00000', 'asset-00002']
+        assert sorted(IndicatorState.load(db_handler).state_df['CryptocurrencyName']) == ['asset-00000', 'asset-00002']
+        db_handler.close()
+
+    def test_unreadable_file_is_skipped(self, tmp_path, history):
+        """Test that a file that does not match the schema is logged and skipped."""
+        write_exports(tmp_path, history[history['CryptocurrencyName'] == 'asset-00000'])
+        (tmp_path / 'broken_2020-01-01_2020-03-01.csv').write_text('Start,End,Open\n2020-01-01,2020-01-02,abc\n')
+
+        assert load_csv_file(str(tmp_path / 'broken_2020-01-01_2020-03-01.csv'), str(tmp_path / 'bulk.db')) is None
+        assert BulkLoader(str(tmp_path), str(tmp_path / 'bulk.db'), max_workers=2).load() == 60
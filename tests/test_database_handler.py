@@ -0,0 +1,251 @@
+import pandas as pd
+import pytest
+from src.database_handler import DatabaseHandler, engine_registry
+
+
+@pytest.fixture
+def db_handler(tmp_path):
+    """DatabaseHandler backed by a temporary SQLite file."""
+    handler = DatabaseHandler(str(tmp_path / 'test.db'))
+    yield handler
+    handler.close()
+
+
+@pytest.fixture
+def stored_data():
+    """Formatted rows as they are stored by the daily run."""
+    data = {
+        'Date': ['2024-10-05', '2024-10-06', '2024-10-07', '2024-10-06', '2024-10-07'],
+        'Open': ['100.0000', '105.0000', '110.0000', '10.0000', '11.0000'],
+        'High': ['110.0000', '115.0000', '120.0000', '12.0000', '13.0000'],
+        'Low': ['90.0000', '95.0000', '100.0000', '9.0000', '10.0000'],
+        'Close': ['105.0000', '110.0000', '115.0000', '11.0000', '12.0000'],
+        'Volume': ['1000.0000', '2000.0000', '3000.0000', '400.0000', '500.0000'],
+        'CryptocurrencyName': ['bitcoin', 'bitcoin', 'bitcoin', 'ethereum', 'ethereum'],
+        'Typical_Price': ['101.2500', '106.2500', '111.2500', '10.5000', '11.5000'],
+    }
+    return pd.DataFrame(data)
+
+
+class TestDatabaseHandler:
+
+    def test_get_tail_per_crypto(self, db_handler, stored_data):
+        """Test that only the last rows of each crypto before the given date are loaded."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        tail = db_handler.get_tail_per_crypto('ohlcv_marketcap_data', n=1, before_date='2024-10-07')
+
+        assert tail['CryptocurrencyName'].tolist() == ['bitcoin', 'ethereum']
+        assert tail['Date'].tolist() == ['2024-10-06', '2024-10-06']
+        assert tail['Close'].tolist() == [110.0, 11.0]
+
+    def test_get_cumulative_totals(self, db_handler, stored_data):
+        """Test the per-crypto VWAP totals."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        totals = db_handler.get_cumulative_totals('ohlcv_marketcap_data', before_date='2024-10-07')
+
+        assert totals.loc['bitcoin', 'Cumulative_Volume'] == 3000.0
+        assert totals.loc['bitcoin', 'Cumulative_TPV'] == pytest.approx(101.25 * 1000 + 106.25 * 2000)
+        assert totals.loc['ethereum', 'Cumulative_Volume'] == 400.0
+
+    def test_upsert_rows_replaces_existing_keys(self, db_handler, stored_data):
+        """Test that upserting replaces rows with the same key instead of duplicating them."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+        update = stored_data.iloc[[2]].copy()
+        update['Close'] = '999.0000'
+
+        db_handler.upsert_rows(update, 'ohlcv_marketcap_data')
+        db_handler.upsert_rows(update, 'ohlcv_marketcap_data')
+        result = db_handler.execute_query("SELECT * FROM ohlcv_marketcap_data")
+
+        assert len(result) == len(stored_data)
+        bitcoin_last = result[(result['CryptocurrencyName'] == 'bitcoin') & (result['Date'] == '2024-10-07')]
+        assert bitcoin_last['Close'].tolist() == [999.0]
+
+    def test_typed_schema(self, db_handler, stored_data):
+        """Test that the OHLCV table is keyed, indexed and stores formatted values as numbers."""
+        formatted = stored_data.assign(Volume_Pct_Change=['1.5000%', 'nan%', '-2.0000%', '0.0000%', '3.2500%'])
+        db_handler.save_to_database(formatted, 'ohlcv_marketcap_data', mode='replace')
+
+        types = db_handler.execute_query(
+            "SELECT DISTINCT typeof(Close) AS close_type, typeof(Volume_Pct_Change) AS pct_type "
+            "FROM ohlcv_marketcap_data WHERE Volume_Pct_Change IS NOT NULL"
+        )
+        plan = db_handler.execute_query(
+            "EXPLAIN QUERY PLAN SELECT Date, Close FROM ohlcv_marketcap_data ORDER BY Date DESC LIMIT 30"
+        )
+
+        assert types.values.tolist() == [['real', 'real']]
+        assert 'idx_ohlcv_marketcap_data_date' in ' '.join(plan['detail'])
+        assert db_handler.execute_query("SELECT * FROM ohlcv_marketcap_data WHERE Volume_Pct_Change IS NULL").shape[0] == 1
+
+    def test_migrate_ohlcv_schema(self, db_handler, stored_data):
+        """Test that an untyped table with duplicates is converted in place."""
+        legacy = pd.concat([stored_data, stored_data.iloc[[0]]], ignore_index=True)
+        legacy['Date'] = legacy['Date'] + ' 00:00:00.000000'
+        legacy['Volume_Pct_Change'] = '1.2345%'
+        legacy.to_sql('ohlcv_marketcap_data', db_handler.engine, index=False)
+
+        assert db_handler.migrate_ohlcv_schema()
+        assert not db_handler.migrate_ohlcv_schema()  # Already migrated
+
+        result = db_handler.execute_query("SELECT * FROM ohlcv_marketcap_data ORDER BY CryptocurrencyName, Date")
+        assert len(result) == len(stored_data)
+        assert result['Date'].iloc[0] == '2024-10-05'
+        assert result['Close'].iloc[0] == 105.0
+        assert result['Volume_Pct_Change'].iloc[0] == 1.2345
+
+    def test_bulk_write_matches_save_to_database(self, db_handler, stored_data, tmp_path):
+        """Test that the bulk writer stores the same OHLCV rows as save_to_database and upserts by key."""
+        reference = DatabaseHandler(str(tmp_path / 'reference.db'))
+        reference.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        assert db_handler.bulk_write(stored_data, 'ohlcv_marketcap_data', mode='replace', batch_size=2) == len(stored_data)
+        db_handler.bulk_write(stored_data.iloc[[0]], 'ohlcv_marketcap_data')
+
+        query = "SELECT * FROM ohlcv_marketcap_data ORDER BY CryptocurrencyName, Date"
+        pd.testing.assert_frame_equal(db_handler.execute_query(query), reference.execute_query(query))
+        reference.close()
+
+    def test_bulk_write_restores_pragmas(self, db_handler, stored_data):
+        """Test that the bulk PRAGMAs do not stay set on the pooled connection or in the database file."""
+        before = {name: db_handler.execute_query(f"PRAGMA {name}").iloc[0, 0] for name in ['journal_mode', 'synchronous', 'cache_size']}
+
+        db_handler.bulk_write(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        after = {name: db_handler.execute_query(f"PRAGMA {name}").iloc[0, 0] for name in before}
+        assert after == before
+        assert before['journal_mode'] != 'wal'
+
+    def test_bulk_write_other_table(self, db_handler):
+        """Test that other tables are created from the DataFrame, with dates and missing values."""
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(['2024-10-05', '2024-10-06', None]),
+            'Name': ['bitcoin', pd.NA, 'ethereum'],
+            'Value': [1.5, float('nan'), 3],
+        })
+
+        db_handler.bulk_write(df, 'other_table', mode='replace', pragmas={})
+        db_handler.bulk_write(df, 'other_table', mode='append', pragmas={})
+        result = db_handler.load_data_from_database('other_table')
+
+        assert len(result) == 6
+        assert result['Date'].iloc[1] == pd.Timestamp('2024-10-06')
+        assert result[['Name', 'Value']].isna().sum().tolist() == [2, 2]
+
+        with pytest.raises(ValueError):
+            db_handler.bulk_write(df, 'other_table', mode='upsert')
+
+    def test_get_last_n_rows(self, db_handler, stored_data):
+        """Test that the last rows are loaded by date through the shared engine."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        result = db_handler.get_last_n_rows('ohlcv_marketcap_data', 2)
+
+        assert result['Date'].tolist() == ['2024-10-07', '2024-10-07']
+
+    def test_query_filters_and_projection(self, db_handler, stored_data):
+        """Test that the crypto, date range and column filters are applied."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        result = db_handler.query(cryptos=['bitcoin'], start_date='2024-10-06', end_date='2024-10-07', columns=['Close'])
+
+        assert list(result.columns) == ['CryptocurrencyName', 'Date', 'Close']
+        assert result['Date'].tolist() == ['2024-10-06', '2024-10-07']
+        assert result['Close'].tolist() == [110.0, 115.0]
+        assert db_handler.query(cryptos=["bitcoin' OR '1'='1"]).empty
+
+    def test_query_last_n_per_crypto(self, db_handler, stored_data):
+        """Test that the last n rows of every crypto are loaded, in ascending date order."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        result = db_handler.query(last_n=2, end_date='2024-10-06', columns=['Volume'])
+
+        assert result[['CryptocurrencyName', 'Date']].values.tolist() == [
+            ['bitcoin', '2024-10-05'], ['bitcoin', '2024-10-06'], ['ethereum', '2024-10-06'],
+        ]
+        assert result['Volume'].tolist() == [1000.0, 2000.0, 400.0]
+
+    def test_crypto_names_do_not_scan_the_table(self, db_handler, stored_data):
+        """Test that the cryptocurrencies for last_n are listed through the primary key, not a table scan."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        with db_handler.engine.connect() as connection:
+            names = DatabaseHandler._crypto_names(connection, 'ohlcv_marketcap_data')
+            plan = connection.exec_driver_sql(
+                'EXPLAIN QUERY PLAN SELECT MIN("CryptocurrencyName") FROM "ohlcv_marketcap_data" WHERE "CryptocurrencyName" > ?', ('',)
+            ).fetchall()
+
+        assert names == ['bitcoin', 'ethereum']
+        assert all('SCAN' not in row[-1] for row in plan)
+
+    def test_query_unknown_column(self, db_handler, stored_data):
+        """Test that unknown columns are rejected instead of being put into the SQL."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+
+        with pytest.raises(ValueError):
+            db_handler.query(columns=['Close" FROM sqlite_master --'])
+
+    def test_unit_of_work_commits_all_writes(self, db_handler, stored_data):
+        """Test that the registered writes are only made on commit, in one transaction."""
+        unit = db_handler.unit_of_work()
+        assert unit.upsert_rows(stored_data, 'ohlcv_marketcap_data') == 5
+        unit.save_to_database(pd.DataFrame({'CryptocurrencyName': ['bitcoin'], 'Value': [1.0]}), 'indicator_state', mode='replace')
+        assert db_handler.get_table_version('ohlcv_marketcap_data') is None
+
+        assert unit.commit()
+        assert len(db_handler.load_data_from_database('ohlcv_marketcap_data')) == 5
+        assert db_handler.load_data_from_database('indicator_state')['Value'].tolist() == [1.0]
+
+    def test_unit_of_work_rolls_back_on_error(self, db_handler, stored_data):
+        """Test that a failing write discards the other writes of the unit."""
+        db_handler.save_to_database(stored_data, 'ohlcv_marketcap_data', mode='replace')
+        version = db_handler.get_table_version('ohlcv_marketcap_data')
+
+        unit = db_handler.unit_of_work()
+        unit.save_to_database(stored_data.iloc[:1], 'ohlcv_marketcap_data', mode='replace')
+        unit.upsert_rows(pd.DataFrame({'Value': [1.0]}), 'indicator_state', key_columns=('CryptocurrencyName',))
+
+        assert not unit.commit()
+        assert len(db_handler.load_data_from_database('ohlcv_marketcap_data')) == 5
+        assert db_handler.get_table_version('ohlcv_marketcap_data') == version
+
+
+class TestEngineRegistry:
+
+    def test_handlers_share_one_engine_per_database(self, tmp_path):
+        """Test that handlers of the same file share an engine, also when given as a sqlite:/// URL."""
+        path = str(tmp_path / 'shared.db')
+        first, second = DatabaseHandler(path), DatabaseHandler(f'sqlite:///{path}')
+        other = DatabaseHandler(str(tmp_path / 'other.db'))
+
+        assert first.engine is second.engine
+        assert first.engine is not other.engine
+        engine_registry.dispose(path)
+        engine_registry.dispose(str(tmp_path / 'other.db'))
+
+    def test_close_keeps_engine_of_other_handlers(self, tmp_path):
+        """Test that closing one handler leaves the shared engine to the others until the last one closes."""
+        path = str(tmp_path / 'shared.db')
+        first, second = DatabaseHandler(path), DatabaseHandler(path)
+        engine = first.engine
+        assert second.engine is engine
+
+        first.close()
+        assert second.engine is engine
+        assert second.execute_query("SELECT 1 AS one")['one'].tolist() == [1]
+
+        second.close()
+        assert DatabaseHandler(path).engine is not engine
+        engine_registry.dispose(path)
+
+    def test_dispose_creates_engine_on_next_use(self, tmp_path):
+        """Test that a disposed engine is replaced lazily and the handler keeps working."""
+        db_handler = DatabaseHandler(str(tmp_path / 'lifecycle.db'))
+        engine = db_handler.engine
+        db_handler.close()
+
+        assert db_handler.engine is not engine
+        assert db_handler.execute_query("SELECT 1 AS one")['one'].tolist() == [1]
+        db_handler.close()
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET = 0.25  # Seconds for 'import src', which must not load any of the heavy dependencies
+HEAVY_MODULES = ['pandas', 'sqlalchemy', 'selenium', 'requests']
+
+
+def run_python(code, cwd):
+    """Run code in a fresh interpreter with the project on the path and return its JSON output."""
+    env = dict(os.environ, PYTHONPATH=PROJECT_ROOT)
+    result = subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_import_src_within_budget(tmp_path):
+    """Test that importing the package is fast and loads no heavy dependencies."""
+    result = run_python(
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import src\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'elapsed': elapsed, 'loaded': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))",
+        cwd=tmp_path,
+    )
+
+    assert result['loaded'] == []
+    assert result['elapsed'] < IMPORT_BUDGET
+
+
+def test_modules_import_without_side_effects(tmp_path):
+    """Test that importing every module opens no log files and does not load Selenium."""
+    result = run_python(
+        "import json, logging, sys\n"
+        "import src.data_source, src.data_loader, src.data_fetcher\n"
+        "from src import DatabaseHandler, HttpDataLoader\n"
+        "handlers = [type(h).__name__ for name in logging.root.manager.loggerDict\n"
+        "            for h in getattr(logging.getLogger(name), 'handlers', [])]\n"
+        "print(json.dumps({'handlers': handlers, 'selenium': 'selenium' in sys.modules}))",
+        cwd=tmp_path,
+    )
+
+    assert result == {'handlers': [], 'selenium': False}
+    assert os.listdir(tmp_path) == []  # No log directory or database file was created
+
+
+def test_configure_logging(tmp_path):
+    """Test that logging is opt-in and configuring it twice adds no duplicate handlers."""
+    result = run_python(
+        "import json, logging\n"
+        "from src import configure_logging\n"
+        f"configure_logging({str(tmp_path / 'logs')!r})\n"
+        f"configure_logging({str(tmp_path / 'logs')!r})\n"
+        "import src.database_handler\n"
+        "src.database_handler.logger.info('written')\n"
+        "print(json.dumps(len(src.database_handler.logger.handlers)))",
+        cwd=tmp_path,
+    )
+
+    assert result == 1
+    with open(tmp_path / 'logs' / 'database_handler.log', encoding='utf-8') as f:
+        assert 'written' in f.read()
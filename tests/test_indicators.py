@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks.synthetic import generate_ohlcv
+from src.database_handler import DatabaseHandler
+from src.indicators import IndicatorEngine, RollingIndicatorState
+
+
+@pytest.fixture
+def history():
+    """Synthetic history with a missing close and a cryptocurrency that is listed later."""
+    df = generate_ohlcv(n_assets=3, n_days=90, seed=3)
+    df.loc[40, 'Close'] = np.nan
+    listed_later = (df['CryptocurrencyName'] == df['CryptocurrencyName'].iloc[-1]) & (df['Date'] < df['Date'].min() + pd.Timedelta(days=70))
+    return df[~listed_later].reset_index(drop=True)
+
+
+def assert_same_indicators(result, expected):
+    """Assert that the frames are equal, exactly except for the rolling VWAPs which are differences of cumulative sums."""
+    vwaps = [column for column in expected.columns if column.startswith('VWAP_')]
+    pd.testing.assert_frame_equal(result.drop(columns=vwaps), expected.drop(columns=vwaps), check_exact=True)
+    pd.testing.assert_frame_equal(result[vwaps], expected[vwaps], rtol=1e-12)
+
+
+def split_by_date(df, days):
+    """Split df into the history before the last days and one frame per remaining day."""
+    dates = sorted(df['Date'].unique())
+    cutoff = dates[-days]
+    return df[df['Date'] < cutoff], [df[df['Date'] == date] for date in dates[-days:]]
+
+
+class TestIndicatorEngine:
+
+    def test_matches_pandas_definitions(self):
+        """Test the indicators against their definitions written with pandas rolling and ewm."""
+        df = generate_ohlcv(n_assets=2, n_days=120)
+        result = IndicatorEngine().calculate(df)
+        grouped = result.groupby('CryptocurrencyName')['Close']
+        names = result['CryptocurrencyName']
+
+        change = grouped.diff()
+        gain = change.clip(lower=0).groupby(names).transform(lambda s: s.ewm(alpha=1 / 14, adjust=False).mean())
+        loss = (-change).clip(lower=0).groupby(names).transform(lambda s: s.ewm(alpha=1 / 14, adjust=False).mean())
+        previous_close = grouped.shift()
+        true_range = pd.concat([
+            result['High'] - result['Low'], (result['High'] - previous_close).abs(), (result['Low'] - previous_close).abs()
+        ], axis=1).max(axis=1)
+        expected = {
+            'SMA_50': grouped.transform(lambda s: s.rolling(50).mean()),
+            'EMA_26': grouped.transform(lambda s: s.ewm(span=26, adjust=False, min_periods=26).mean()),
+            'RSI_14': (100 * gain / (gain + loss)).where(result.groupby('CryptocurrencyName').cumcount() >= 14),
+            'BB_Upper_20': grouped.transform(lambda s: s.rolling(20).mean() + 2 * s.rolling(20).std(ddof=0)),
+            'BB_Lower_20': grouped.transform(lambda s: s.rolling(20).mean() - 2 * s.rolling(20).std(ddof=0)),
+            'ATR_14': true_range.groupby(names).transform(lambda s: s.ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()),
+        }
+        for column, values in expected.items():
+            pd.testing.assert_series_equal(result[column], values, check_names=False, rtol=1e-9)
+
+    def test_rolling_vwaps(self):
+        """Test the rolling VWAPs against rolling sums of volume and typical price x volume per cryptocurrency."""
+        df = generate_ohlcv(n_assets=2, n_days=60)
+        df.loc[10, 'Volume'] = np.nan
+        result = IndicatorEngine({'vwap': (3, 7, 30)}).calculate(df)
+
+        typical_price = (df['High'] + df['Low'] + df['Close'] + df['Open']) / 4
+        names = df['CryptocurrencyName']
+        for n in (3, 7, 30):
+            volume = df['Volume'].groupby(names).transform(lambda s: s.rolling(n).sum())
+            flow = (typical_price * df['Volume']).groupby(names).transform(lambda s: s.rolling(n).sum())
+            pd.testing.assert_series_equal(result[f'VWAP_{n}'], flow / volume, check_names=False, rtol=1e-12)
+        # The window with the missing volume has no VWAP until the day drops out
+        assert result.loc[10:16, 'VWAP_7'].isna().all() and result.loc[17, 'VWAP_7'] > 0
+
+    def test_daily_updates_match_full_history(self, history):
+        """Test that updating one day at a time from the state gives exactly the full-history values."""
+        engine = IndicatorEngine()
+        expected = engine.calculate(history)
+
+        earlier, days = split_by_date(history, 25)
+        state = RollingIndicatorState(engine)
+        frames = [engine.calculate(earlier, state)] + [engine.calculate(day, state) for day in days]
+        result = pd.concat(frames).loc[expected.index]
+
+        assert_same_indicators(result, expected)
+        assert state.state_df['Bars'].tolist() == history.groupby('CryptocurrencyName')['Close'].count().tolist()
+
+    def test_state_round_trip(self, history, tmp_path):
+        """Test that the state continues after saving and loading, and is ignored with other windows."""
+        db_handler = DatabaseHandler(str(tmp_path / 'test.db'))
+        engine = IndicatorEngine()
+        expected = engine.calculate(history)
+        earlier, days = split_by_date(history, 1)
+
+        state = RollingIndicatorState(engine)
+        engine.calculate(earlier, state)
+        state.save(db_handler)
+        loaded = RollingIndicatorState.load(db_handler, engine)
+        result = engine.calculate(days[0], loaded)
+
+        assert_same_indicators(result, expected.loc[result.index])
+        assert RollingIndicatorState.load(db_handler, IndicatorEngine({'sma': (10,)})).is_empty()
+        db_handler.close()
+
+    def test_from_database(self, history, tmp_path):
+        """Test that the state is rebuilt from the stored rows before the given date."""
+        db_handler = DatabaseHandler(str(tmp_path / 'test.db'))
+        db_handler.save_to_database(history, 'ohlcv_marketcap_data', mode='replace')
+        engine = IndicatorEngine()
+        earlier, days = split_by_date(history, 1)
+
+        state = RollingIndicatorState.from_database(db_handler, engine, before_date=days[0]['Date'].iloc[0])
+        result = engine.calculate(days[0], state)
+
+        assert_same_indicators(result, engine.calculate(history).loc[result.index])
+        db_handler.close()
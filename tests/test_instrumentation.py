@@ -0,0 +1,106 @@
+import json
+import os
+import tracemalloc
+import pytest
+from benchmarks.synthetic import generate_ohlcv
+from src.data_cleaner import PerformCleaning, DataFormatter
+from src.database_handler import DatabaseHandler
+from src.instrumentation import instrumentation, instrumented
+
+
+@pytest.fixture
+def recorder():
+    """The process-wide instrumentation, enabled with memory tracing for one test."""
+    instrumentation.reset()
+    instrumentation.enable(trace_memory=True)
+    yield instrumentation
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+class TestInstrumentation:
+
+    def test_disabled_records_nothing(self):
+        """Test that instrumented methods run unmeasured until the instrumentation is enabled."""
+        instrumentation.reset()
+        DataFormatter().format_data(generate_ohlcv(n_assets=1, n_days=5))
+        assert instrumentation.records == []
+
+    def test_memory_is_only_traced_when_asked_for(self):
+        """Test that timing and rows are recorded without starting tracemalloc by default."""
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            assert not tracemalloc.is_tracing()
+            DataFormatter().format_data(generate_ohlcv(n_assets=1, n_days=5))
+        finally:
+            instrumentation.disable()
+
+        total = instrumentation.summary()['DataFormatter.format_data']
+        instrumentation.reset()
+        assert total['rows_out'] == 5 and total['duration_seconds'] > 0
+        assert total['peak_memory_bytes'] is None
+
+    def test_records_stages(self, recorder, tmp_path):
+        """Test the recorded rows of the cleaning, formatting and database writes."""
+        df = generate_ohlcv(n_assets=2, n_days=20)
+        db_handler = DatabaseHandler(str(tmp_path / 'test.db'))
+
+        cleaned = PerformCleaning(df).clean_all()
+        DataFormatter().format_data(cleaned)
+        db_handler.upsert_rows(cleaned)
+        db_handler.close()
+
+        summary = recorder.summary()
+        assert summary['PerformCleaning.clean_all']['rows_in'] == 40
+        assert summary['PerformCleaning.clean_all']['rows_out'] == 40
+        assert summary['DataFormatter.format_data']['rows_out'] == 40
+        assert summary['DatabaseHandler.upsert_rows']['rows_in'] == 40
+        assert summary['DatabaseHandler.upsert_rows']['rows_out'] == 40
+        assert all(record['duration_seconds'] > 0 for record in recorder.records)
+
+    def test_nested_stage_peak_counts_towards_outer(self, recorder):
+        """Test that the peak memory of an inner stage is included in the stage that called it."""
+        @instrumented('inner')
+        def allocate():
+            return len(bytearray(10_000_000))
+
+        @instrumented('outer')
+        def call_inner():
+            return allocate()
+
+        call_inner()
+
+        summary = recorder.summary()
+        assert summary['inner']['peak_memory_bytes'] >= 10_000_000
+        assert summary['outer']['peak_memory_bytes'] >= summary['inner']['peak_memory_bytes']
+        assert summary['outer']['rows_out'] == 10_000_000  # An int result counts as rows
+
+    def test_report_and_prometheus_files(self, recorder, tmp_path):
+        """Test the JSON run report and the Prometheus text file."""
+        DataFormatter().format_data(generate_ohlcv(n_assets=1, n_days=5))
+
+        recorder.write_report(str(tmp_path / 'run_report.json'))
+        recorder.write_prometheus(str(tmp_path / 'metrics.prom'))
+
+        with open(tmp_path / 'run_report.json') as f:
+            report = json.load(f)
+        assert report['stages']['DataFormatter.format_data']['calls'] == 1
+        assert report['calls'][0]['rows_in'] == 5
+        metrics = (tmp_path / 'metrics.prom').read_text()
+        assert '# TYPE crypto_pipeline_stage_duration_seconds gauge' in metrics
+        assert 'crypto_pipeline_stage_rows_out{stage="DataFormatter.format_data"} 5' in metrics
+
+    def test_profile_dump_per_outermost_stage(self, tmp_path):
+        """Test that the outermost stage is profiled into its own file."""
+        instrumentation.reset()
+        instrumentation.enable(profile_directory=str(tmp_path / 'profiles'))
+        try:
+            PerformCleaning(generate_ohlcv(n_assets=1, n_days=5)).clean_all()
+        finally:
+            instrumentation.disable()
+
+        record = instrumentation.records[-1]
+        instrumentation.reset()
+        assert record['stage'] == 'PerformCleaning.clean_all'
+        assert os.path.exists(record['profile'])
@@ -0,0 +1,133 @@
+import datetime
+import os
+import pandas as pd
+import pytest
+from src.pipeline import Stage, PipelineRunner
+
+
+RUN_DATE = datetime.date(2024, 10, 8)
+
+
+@pytest.fixture
+def calls():
+    """Names of the stages in the order they ran."""
+    return []
+
+
+def make_stages(calls, fail_in=None):
+    """A fetch -> clean -> calculate -> save graph that records its calls and can fail in one stage."""
+    def stage(name, function):
+        def run(*inputs):
+            calls.append(name)
+            if name == fail_in:
+                raise RuntimeError(f"{name} failed")
+            return function(*inputs)
+        return run
+
+    return [
+        Stage('fetch', stage('fetch', lambda: pd.DataFrame({'Close': [1.0, 2.0]}))),
+        Stage('clean', stage('clean', lambda df: df * 10), inputs=['fetch']),
+        Stage('calculate', stage('calculate', lambda df: df.sum()), inputs=['clean']),
+        Stage('save', stage('save', lambda totals: int(totals['Close'])), inputs=['calculate']),
+    ]
+
+
+class TestPipelineRunner:
+
+    def test_run_passes_outputs_and_writes_checkpoints(self, tmp_path, calls):
+        """Test that every stage gets its inputs' outputs and is checkpointed under the run date."""
+        runner = PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE)
+
+        outputs = runner.run()
+
+        assert calls == ['fetch', 'clean', 'calculate', 'save']
+        assert outputs['save'] == 30
+        assert runner.completed_stages() == ['fetch', 'clean', 'calculate', 'save']
+        assert os.path.exists(tmp_path / '2024-10-08' / 'fetch.pkl')
+
+    def test_resume_skips_completed_stages(self, tmp_path, calls):
+        """Test that a resumed run continues after the failed stage from the checkpoints."""
+        assert PipelineRunner(make_stages(calls, fail_in='calculate'), str(tmp_path), run_date=RUN_DATE).run() is None
+        assert calls == ['fetch', 'clean', 'calculate']
+
+        calls.clear()
+        outputs = PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE, resume=True).run()
+
+        assert calls == ['calculate', 'save']
+        assert outputs['save'] == 30
+        assert 'fetch' not in outputs  # Only read back when a running stage needs it
+
+    def test_run_without_resume_reruns_everything(self, tmp_path, calls):
+        """Test that the checkpoints are ignored and replaced without resume."""
+        PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE).run()
+        calls.clear()
+
+        PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE).run()
+
+        assert calls == ['fetch', 'clean', 'calculate', 'save']
+
+    def test_rerun_stage_invalidates_downstream_checkpoints(self, tmp_path, calls):
+        """Test that stages after a stage that runs again are not skipped with outdated checkpoints."""
+        runner = PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE)
+        runner.run()
+        os.remove(tmp_path / '2024-10-08' / 'clean.pkl')
+        calls.clear()
+
+        PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE, resume=True).run()
+
+        assert calls == ['clean', 'calculate', 'save']
+
+    def test_stage_without_output_stops_the_run(self, tmp_path, calls):
+        """Test that a stage returning None stops the run without a checkpoint."""
+        stages = make_stages(calls)
+        stages[1] = Stage('clean', lambda df: None, inputs=['fetch'])
+
+        runner = PipelineRunner(stages, str(tmp_path), run_date=RUN_DATE)
+
+        assert runner.run() is None
+        assert runner.completed_stages() == ['fetch']
+
+    def test_other_run_dates_are_removed(self, tmp_path, calls):
+        """Test that the checkpoints of an earlier day are not reused and are deleted."""
+        PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE).run()
+        calls.clear()
+
+        PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE + datetime.timedelta(days=1), resume=True).run()
+
+        assert calls == ['fetch', 'clean', 'calculate', 'save']
+        assert sorted(os.listdir(tmp_path)) == ['2024-10-09']
+
+    def test_checkpoints_of_another_version_are_not_resumed(self, tmp_path, calls):
+        """Test that a resume after a code change runs every stage instead of loading the old checkpoints."""
+        PipelineRunner(make_stages(calls, fail_in='save'), str(tmp_path), run_date=RUN_DATE, version='old').run()
+        calls.clear()
+
+        runner = PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE, resume=True, version='new')
+        assert runner.completed_stages() == []
+        runner.run()
+
+        assert calls == ['fetch', 'clean', 'calculate', 'save']
+        assert PipelineRunner(make_stages(calls), str(tmp_path), run_date=RUN_DATE, version='new').completed_stages() == [
+            'fetch', 'clean', 'calculate', 'save']
+
+    def test_stage_without_checkpoint(self, tmp_path, calls):
+        """Test that a stage with checkpoint=False is not written and runs again on resume."""
+        stages = make_stages(calls) + [Stage('display', lambda totals: calls.append('display') or 'shown', inputs=['calculate'], checkpoint=False)]
+        PipelineRunner(stages, str(tmp_path), run_date=RUN_DATE).run()
+        calls.clear()
+
+        runner = PipelineRunner(stages, str(tmp_path), run_date=RUN_DATE, resume=True)
+        outputs = runner.run()
+
+        assert calls == ['display']
+        assert outputs['display'] == 'shown'
+        assert 'display' not in runner.completed_stages()
+
+    def test_stages_are_ordered_by_their_inputs(self, tmp_path, calls):
+        """Test that the declared order is fixed up by the dependencies and that cycles are rejected."""
+        stages = make_stages(calls)
+        runner = PipelineRunner(list(reversed(stages)), str(tmp_path), run_date=RUN_DATE)
+        assert [stage.name for stage in runner.stages] == ['fetch', 'clean', 'calculate', 'save']
+
+        with pytest.raises(ValueError):
+            PipelineRunner([Stage('a', len, inputs=['b']), Stage('b', len, inputs=['a'])], str(tmp_path))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from src.quantile_sketch import TDigest
+
+
+@pytest.fixture
+def values():
+    """Heavy-tailed values like daily percentage changes."""
+    return np.random.default_rng(42).standard_t(3, size=20000)
+
+
+class TestTDigest:
+
+    def test_small_stream_is_exact(self):
+        """Test that percentiles equal np.percentile while every value is its own centroid."""
+        small = np.array([3.0, -1.0, 7.5, 2.0, 0.5, 12.0, -4.0])
+        digest = TDigest()
+        digest.update(small)
+
+        for p in [0, 25, 50, 90, 98, 100]:
+            assert digest.percentile(p) == pytest.approx(np.percentile(small, p))
+
+    def test_large_stream_is_accurate_and_bounded(self, values):
+        """Test the accuracy of the tail percentiles and that the sketch size does not grow with the stream."""
+        digest = TDigest(compression=200)
+        digest.update(values)
+
+        assert len(digest.means) <= 200
+        for p in [50, 90, 98]:
+            assert digest.percentile(p) == pytest.approx(np.percentile(values, p), rel=0.02, abs=0.01)
+
+    def test_merge(self, values):
+        """Test that merging two sketches describes both streams."""
+        first, second = TDigest(compression=200), TDigest(compression=200)
+        first.update(values[:5000])
+        second.update(values[5000:])
+
+        merged = first.merge(second)
+
+        assert merged.count == len(values)
+        assert merged.percentile(98) == pytest.approx(np.percentile(values, 98), rel=0.02)
+
+    def test_serialization_round_trip(self, values):
+        """Test that a sketch restored from its dict gives the same percentiles."""
+        digest = TDigest()
+        digest.update(values)
+
+        restored = TDigest.from_dict(digest.to_dict())
+
+        assert restored.percentile(98) == digest.percentile(98)
+        assert np.isnan(TDigest().percentile(50))
+
+    def test_missing_values_are_ignored(self):
+        """Test that NaN and infinite values do not enter the sketch."""
+        digest = TDigest()
+        digest.update([1.0, np.nan, np.inf, 2.0])
+
+        assert digest.count == 2
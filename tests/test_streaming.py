@@ -0,0 +1,118 @@
+import io
+import threading
+import pandas as pd
+from tests.helpers import fixture_csv
+from tests.test_data_fetcher import FakeDriver
+from src.data_analyzer import PerformCalculations, IndicatorState, ThresholdSketches, DataAnalyzer
+from src.data_cleaner import PerformCleaning
+from src.data_fetcher import HttpDataLoader, NewDataLoader, FetchedDataProcessor, FetchBackend
+from src.database_handler import DatabaseHandler
+from src.streaming import StreamingPipeline, IncrementalAssetProcessor
+
+
+CRYPTOS = ['bitcoin', 'ethereum', 'solana', 'cardano']
+
+
+def http_loader(server, max_workers=2, cryptos=CRYPTOS):
+    export_url = server.base_url + '/exports/{crypto}_{start}_{end}.csv'
+    return HttpDataLoader(cryptos=cryptos, export_url=export_url, max_workers=max_workers)
+
+
+def history_before_yesterday():
+    """The cleaned and calculated fixture exports without yesterday's rows."""
+    frames = []
+    for crypto in CRYPTOS:
+        df = pd.read_csv(io.StringIO(fixture_csv(crypto)))
+        df = df[df['Start'] < FetchBackend.yesterday()]
+        df['CryptocurrencyName'] = crypto
+        frames.append(df)
+    raw = FetchedDataProcessor.transform_csv(pd.concat(frames, ignore_index=True))
+    analyzer = DataAnalyzer(PerformCleaning(raw).clean_all())
+    analyzer.calculate_typical_price()
+    analyzer.calculate_vwap()
+    analyzer.calculate_price_change()
+    return analyzer.clean_data().df
+
+
+class TestStreamingPipeline:
+
+    def test_same_rows_as_batch_fetch(self, coincodex_server, tmp_path):
+        """Test that streaming the exports gives the same rows as fetching them all first, for both backends."""
+        expected, names = http_loader(coincodex_server).process_crypto_data()
+
+        http_df, http_names = StreamingPipeline(http_loader(coincodex_server), lambda crypto, rows: rows).run()
+        selenium_loader = NewDataLoader(download_folder=str(tmp_path), cryptos=CRYPTOS, pool_size=2,
+                                        base_url=coincodex_server.base_url, download_timeout=5, driver_factory=FakeDriver)
+        selenium_df, selenium_names = StreamingPipeline(selenium_loader, lambda crypto, rows: rows).run()
+
+        pd.testing.assert_frame_equal(http_df, expected)
+        pd.testing.assert_frame_equal(selenium_df, expected)
+        assert http_names == selenium_names == names
+        assert not any(path.suffix == '.csv' for path in tmp_path.rglob('*'))  # Read exports are deleted
+
+    def test_processing_overlaps_fetching(self, coincodex_server):
+        """Test that assets are processed while the next exports download, not after all of them."""
+        loader = http_loader(coincodex_server, max_workers=1)
+        first_processed = threading.Event()
+        events = []
+        download_export = loader.download_export
+
+        def download_after_first_processed(crypto):
+            # The last download waits for the first asset, which only finishes if processing overlaps fetching
+            if crypto == CRYPTOS[-1]:
+                events.append(('waited', first_processed.wait(timeout=10)))
+            text = download_export(crypto)
+            events.append(('downloaded', crypto))
+            return text
+
+        def process(crypto, rows):
+            events.append(('processed', crypto))
+            first_processed.set()
+            return rows
+
+        loader.download_export = download_after_first_processed
+        combined_df, _ = StreamingPipeline(loader, process).run()
+
+        assert len(combined_df) == len(CRYPTOS)
+        assert ('waited', True) in events
+        assert events.index(('processed', CRYPTOS[0])) < events.index(('downloaded', CRYPTOS[-1]))
+
+    def test_failing_asset_is_skipped(self, coincodex_server):
+        """Test that an asset whose processing fails is left out and the others are processed."""
+        def process(crypto, rows):
+            if crypto == 'ethereum':
+                raise ValueError('broken export')
+            return rows
+
+        pipeline = StreamingPipeline(http_loader(coincodex_server), process)
+        combined_df, names = pipeline.run()
+
+        assert sorted(combined_df['CryptocurrencyName']) == ['bitcoin', 'cardano', 'solana']
+        assert sorted(pipeline.processed) == ['bitcoin', 'cardano', 'solana']
+        assert len(names) == len(CRYPTOS)
+
+    def test_incremental_processor_matches_batch_run(self, coincodex_server, tmp_path, monkeypatch):
+        """Test that calculating asset by asset gives the same rows, state and sketches as the batch run."""
+        monkeypatch.chdir(tmp_path)
+        db_handler = DatabaseHandler(str(tmp_path / 'test.db'))
+        history = history_before_yesterday()
+
+        fetched, _ = http_loader(coincodex_server).process_crypto_data()
+        cleaned = PerformCleaning(FetchedDataProcessor.transform_csv(fetched)).clean_all()
+        batch_state, batch_sketches = IndicatorState.from_history(history), ThresholdSketches.from_history(history)
+        batch = PerformCalculations(cleaned, db_handler=db_handler)
+        batch.threshold_sketches = batch_sketches
+        expected = batch.calculate_newdata(cleaned, state=batch_state)
+
+        state, sketches = IndicatorState.from_history(history), ThresholdSketches.from_history(history)
+        process_asset = IncrementalAssetProcessor(state, sketches, db_handler)
+        result, _ = StreamingPipeline(http_loader(coincodex_server), process_asset).run()
+
+        pd.testing.assert_frame_equal(
+            result.sort_values(by=['CryptocurrencyName', 'Date']).reset_index(drop=True),
+            expected.sort_values(by=['CryptocurrencyName', 'Date']).reset_index(drop=True),
+            check_exact=True,
+        )
+        sort_state = lambda df: df.sort_values(by='CryptocurrencyName').reset_index(drop=True)
+        pd.testing.assert_frame_equal(sort_state(state.state_df), sort_state(batch_state.state_df), check_exact=True)
+        assert sketches.thresholds() == batch_sketches.thresholds()